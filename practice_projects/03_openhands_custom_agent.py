@@ -7,31 +7,64 @@
 """
 
 import asyncio
+import bisect
+import codecs
+import hashlib
+import io
+import itertools
 import json
+import mmap
 import os
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import posixpath
+import shlex
+import signal
+import sys
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable, Tuple, Type
+from dataclasses import dataclass, field, asdict
 from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext, redirect_stdout
+from contextvars import ContextVar
+
+# 多个调用方共享的LLM请求调度器在 agent_core 包中
+from agent_core.llm_scheduler import LLMRequestScheduler, Priority
 
 # 模拟OpenHands的核心组件（实际使用时应该从openhands包导入）
 class Event:
     """事件基类"""
+    __slots__ = ("source", "timestamp")
+
     def __init__(self, source: str = "agent"):
         self.source = source
-        self.timestamp = asyncio.get_event_loop().time()
+        # 使用墙上时钟，不依赖正在运行的事件循环，也便于持久化
+        self.timestamp = time.time()
 
 class Action(Event):
     """动作事件"""
+    __slots__ = ()
+
     def __init__(self, source: str = "agent"):
         super().__init__(source)
 
 class Observation(Event):
     """观察事件"""
+    __slots__ = ()
+
     def __init__(self, source: str = "environment"):
         super().__init__(source)
 
 class MessageAction(Action):
     """消息动作"""
+    __slots__ = ("content",)
+
     def __init__(self, content: str, source: str = "agent"):
         super().__init__(source)
         self.content = content
@@ -41,6 +74,8 @@ class MessageAction(Action):
 
 class CmdRunAction(Action):
     """命令执行动作"""
+    __slots__ = ("command",)
+
     def __init__(self, command: str, source: str = "agent"):
         super().__init__(source)
         self.command = command
@@ -50,6 +85,8 @@ class CmdRunAction(Action):
 
 class FileEditAction(Action):
     """文件编辑动作"""
+    __slots__ = ("path", "content")
+
     def __init__(self, path: str, content: str, source: str = "agent"):
         super().__init__(source)
         self.path = path
@@ -58,8 +95,32 @@ class FileEditAction(Action):
     def __str__(self):
         return f"FileEditAction(path='{self.path}')"
 
+class FileReadAction(Action):
+    """文件读取动作"""
+    __slots__ = ("path",)
+
+    def __init__(self, path: str, source: str = "agent"):
+        super().__init__(source)
+        self.path = path
+    
+    def __str__(self):
+        return f"FileReadAction(path='{self.path}')"
+
+class BatchAction(Action):
+    """批量动作：运行时并发执行互不依赖的成员动作"""
+    __slots__ = ("actions",)
+
+    def __init__(self, actions: List[Action], source: str = "agent"):
+        super().__init__(source)
+        self.actions = actions
+    
+    def __str__(self):
+        return f"BatchAction({len(self.actions)} actions)"
+
 class AgentFinishAction(Action):
     """代理完成动作"""
+    __slots__ = ("outputs",)
+
     def __init__(self, outputs: Dict[str, Any], source: str = "agent"):
         super().__init__(source)
         self.outputs = outputs
@@ -67,19 +128,277 @@ class AgentFinishAction(Action):
     def __str__(self):
         return f"AgentFinishAction(outputs={self.outputs})"
 
+# ---------------------------------------------------------------------------
+# 大输出溢出到磁盘
+#
+# 超过阈值的命令输出写入临时文件，内存中只保留开头和结尾的预览以及字节数，
+# 完整内容在需要时再按偏移从文件读回。
+# ---------------------------------------------------------------------------
+
+class SpooledPayload:
+    """可能已溢出到磁盘的文本负载"""
+    __slots__ = ("_text", "_spool", "_offset", "byte_count", "char_count", "head", "tail", "__weakref__")
+    
+    def __init__(self, text: Optional[str] = None, spool: Optional["PayloadSpool"] = None,
+                 offset: int = 0, byte_count: int = 0, char_count: int = 0,
+                 head: str = "", tail: str = ""):
+        self._text = text
+        self._spool = spool
+        self._offset = offset
+        self.byte_count = byte_count
+        self.char_count = char_count
+        self.head = head
+        self.tail = tail
+    
+    @property
+    def spilled(self) -> bool:
+        """内容是否保存在磁盘上"""
+        return self._text is None
+    
+    def load(self) -> str:
+        """读取完整内容"""
+        if self._text is not None:
+            return self._text
+        return self._spool.read(self._offset, self.byte_count)
+    
+    def preview(self, limit: int) -> str:
+        """内容开头的预览，不会触发磁盘读取"""
+        if self._text is not None:
+            return self._text[:limit]
+        return self.head[:limit]
+
+class SpoolWriter:
+    """增量写入负载：先缓存在内存中，超过阈值后转为写入自己的临时分段文件，
+    finish 时再整体复制到溢出文件中分配的区间，因此多个写入器可以同时写入"""
+    
+    def __init__(self, spool: "PayloadSpool"):
+        self.spool = spool
+        self._chunks: List[str] = []
+        self._buffered_bytes = 0
+        self._segment = None  # 溢出后的临时分段文件
+        self._byte_count = 0
+        self._char_count = 0
+        self._head = ""
+        self._tail = ""
+    
+    def write(self, chunk: str):
+        """写入一块文本"""
+        if not chunk:
+            return
+        if self._segment is None:
+            self._chunks.append(chunk)
+            self._buffered_bytes += len(chunk.encode("utf-8"))
+            if self._buffered_bytes > self.spool.threshold:
+                self._spill("".join(self._chunks))
+                self._chunks = []
+            return
+        self._append(chunk)
+    
+    def _spill(self, text: str):
+        """把已缓存的内容转移到磁盘"""
+        self._head = text[:self.spool.preview_chars]
+        self._segment = tempfile.TemporaryFile(dir=self.spool.directory)
+        self._append(text)
+    
+    def _append(self, text: str):
+        """追加到分段文件并更新结尾预览"""
+        data = text.encode("utf-8")
+        self._segment.write(data)
+        self._byte_count += len(data)
+        self._char_count += len(text)
+        self._tail = (self._tail + text)[-self.spool.preview_chars:]
+    
+    def finish(self) -> SpooledPayload:
+        """结束写入，返回负载"""
+        if self._segment is None:
+            return SpooledPayload(text="".join(self._chunks))
+        try:
+            self._segment.flush()
+            offset = self.spool.copy_from(self._segment, self._byte_count)
+        finally:
+            self.abort()
+        return self.spool._payload(offset, self._byte_count, self._char_count, self._head, self._tail)
+    
+    def abort(self):
+        """放弃写入（例如命令超时或被取消），释放分段文件；可以重复调用"""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        self._chunks = []
+
+class PayloadSpool:
+    """负载溢出文件：每个溢出的负载在同一个临时文件中分配一段连续区间
+    
+    负载对象被回收时归还它的区间，空闲区间按偏移排序并合并相邻区间，
+    新负载优先复用空闲区间；文件末尾的空闲区间会直接截掉，长时间运行时文件不会无限增长。
+    关闭后不能再保存负载，已有的溢出负载也无法读取。
+    """
+    
+    def __init__(self, threshold: int = 64 * 1024, preview_chars: int = 512, directory: Optional[str] = None):
+        self.threshold = threshold  # 超过该字节数的负载写入磁盘
+        self.preview_chars = preview_chars  # 内存中保留的开头/结尾字符数
+        self.directory = directory
+        self._file = None
+        self._end = 0  # 已分配区间的末尾
+        self._free: List[List[int]] = []  # 空闲区间 [偏移, 长度]，按偏移排序且互不相邻
+        self._closed = False
+        self.bytes_spilled = 0  # 累计写入磁盘的字节数
+        self.bytes_live = 0  # 仍被负载占用的字节数
+    
+    def _check_open(self):
+        if self._closed:
+            raise ValueError("溢出文件已关闭")
+    
+    def store(self, text: str) -> SpooledPayload:
+        """保存一段文本，小负载直接留在内存中"""
+        self._check_open()
+        if len(text) * 4 <= self.threshold or len(text.encode("utf-8")) <= self.threshold:
+            return SpooledPayload(text=text)
+        data = text.encode("utf-8")
+        offset = self._allocate(len(data))
+        try:
+            os.pwrite(self._file.fileno(), data, offset)
+        except BaseException:
+            self._release(offset, len(data))
+            raise
+        preview = self.preview_chars
+        return self._payload(offset, len(data), len(text), text[:preview], text[-preview:])
+    
+    def writer(self) -> SpoolWriter:
+        """创建增量写入器"""
+        self._check_open()
+        return SpoolWriter(self)
+    
+    def _payload(self, offset: int, byte_count: int, char_count: int, head: str, tail: str) -> SpooledPayload:
+        """为已写入的区间创建负载，负载被回收时归还区间"""
+        payload = SpooledPayload(
+            spool=self, offset=offset, byte_count=byte_count, char_count=char_count, head=head, tail=tail
+        )
+        weakref.finalize(payload, self._release, offset, byte_count)
+        return payload
+    
+    def _allocate(self, length: int) -> int:
+        """分配 length 字节的区间（优先复用空闲区间），返回起始偏移"""
+        self._check_open()
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.directory)
+        for i, (offset, size) in enumerate(self._free):
+            if size >= length:
+                if size == length:
+                    del self._free[i]
+                else:
+                    self._free[i] = [offset + length, size - length]
+                break
+        else:
+            offset = self._end
+            self._end += length
+        self.bytes_spilled += length
+        self.bytes_live += length
+        return offset
+    
+    def _release(self, offset: int, length: int):
+        """归还区间，与相邻空闲区间合并；位于文件末尾时截掉"""
+        if self._closed or length == 0:
+            return
+        self.bytes_live -= length
+        i = bisect.bisect(self._free, [offset, length])
+        if i > 0 and self._free[i - 1][0] + self._free[i - 1][1] == offset:
+            i -= 1
+            offset = self._free[i][0]
+            length += self._free[i][1]
+            del self._free[i]
+        if i < len(self._free) and offset + length == self._free[i][0]:
+            length += self._free[i][1]
+            del self._free[i]
+        if offset + length == self._end:
+            self._end = offset
+            self._file.truncate(offset)
+        else:
+            self._free.insert(i, [offset, length])
+    
+    def copy_from(self, source, length: int, block_size: int = 1024 * 1024) -> int:
+        """把文件 source 开头的 length 字节复制到新分配的区间，返回起始偏移"""
+        offset = self._allocate(length)
+        copied = 0
+        try:
+            while copied < length:
+                data = os.pread(source.fileno(), min(block_size, length - copied), copied)
+                if not data:
+                    raise OSError(f"分段文件只有 {copied} 字节，预期 {length} 字节")
+                os.pwrite(self._file.fileno(), data, offset + copied)
+                copied += len(data)
+        except BaseException:
+            self._release(offset, length)
+            raise
+        return offset
+    
+    def read(self, offset: int, length: int) -> str:
+        """按偏移读取负载"""
+        self._check_open()
+        return os.pread(self._file.fileno(), length, offset).decode("utf-8")
+    
+    def get_stats(self) -> Dict[str, int]:
+        """溢出文件的空间统计"""
+        return {
+            "bytes_spilled": self.bytes_spilled,
+            "bytes_live": self.bytes_live,
+            "file_size": self._end,
+            "free_ranges": len(self._free),
+        }
+    
+    def close(self):
+        """关闭并删除溢出文件；之后不能再保存或读取负载"""
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._free = []
+
+DEFAULT_PAYLOAD_SPOOL = PayloadSpool()
+
 class CmdOutputObservation(Observation):
-    """命令输出观察"""
-    def __init__(self, content: str, command: str, exit_code: int = 0):
+    """命令输出观察（大输出会溢出到磁盘，content 按需读取）"""
+    __slots__ = ("payload", "command", "exit_code")
+
+    def __init__(self, content: str, command: str, exit_code: int = 0, spool: Optional[PayloadSpool] = None):
         super().__init__("environment")
-        self.content = content
+        self.payload = (spool or DEFAULT_PAYLOAD_SPOOL).store(content)
         self.command = command
         self.exit_code = exit_code
     
+    @classmethod
+    def from_payload(cls, payload: SpooledPayload, command: str, exit_code: int = 0) -> "CmdOutputObservation":
+        """由已写好的负载创建观察（例如流式写入的命令输出）"""
+        observation = cls.__new__(cls)
+        Observation.__init__(observation, "environment")
+        observation.payload = payload
+        observation.command = command
+        observation.exit_code = exit_code
+        return observation
+    
+    @property
+    def content(self) -> str:
+        """完整输出（已溢出时从磁盘读取）"""
+        return self.payload.load()
+    
+    @content.setter
+    def content(self, value: str):
+        # 解码事件时对象还没有负载；已有负载时写回它所在的溢出文件
+        current = getattr(self, "payload", None)
+        spool = current._spool if current is not None else None
+        self.payload = (spool or DEFAULT_PAYLOAD_SPOOL).store(value)
+    
+    def preview(self, limit: int = 200) -> str:
+        """输出开头的预览，不读取磁盘"""
+        return self.payload.preview(limit)
+    
     def __str__(self):
         return f"CmdOutputObservation(exit_code={self.exit_code})"
 
 class FileReadObservation(Observation):
     """文件读取观察"""
+    __slots__ = ("content", "path")
+
     def __init__(self, content: str, path: str):
         super().__init__("environment")
         self.content = content
@@ -90,6 +409,8 @@ class FileReadObservation(Observation):
 
 class ErrorObservation(Observation):
     """错误观察"""
+    __slots__ = ("content", "error_type")
+
     def __init__(self, content: str, error_type: str = "general"):
         super().__init__("environment")
         self.content = content
@@ -98,12 +419,315 @@ class ErrorObservation(Observation):
     def __str__(self):
         return f"ErrorObservation(error_type='{self.error_type}')"
 
+class BatchObservation(Observation):
+    """批量观察：与批量动作的成员一一对应"""
+    __slots__ = ("observations",)
+
+    def __init__(self, observations: List[Observation]):
+        super().__init__("environment")
+        self.observations = observations
+    
+    def __str__(self):
+        errors = sum(1 for o in self.observations if isinstance(o, ErrorObservation))
+        return f"BatchObservation({len(self.observations)} results, {errors} errors)"
+
+# ---------------------------------------------------------------------------
+# 二进制事件日志
+#
+# 文件格式（小端序）:
+#   文件头:  magic(4s) | 版本(uint16) | 保留(uint16)
+#   记录:    负载长度(uint32) | 事件类型ID(uint16) | 时间戳(float64) | 负载
+#   负载:    按事件类型的字段表依次编码，str/json为 长度(uint32)+UTF-8字节，int为int64，
+#            events为 数量(uint32)+嵌套记录
+#
+# 记录只追加不改写；读取端通过mmap按偏移解码，不需要把整个文件读入内存。
+# ---------------------------------------------------------------------------
+
+EVENT_LOG_MAGIC = b"OHEV"
+EVENT_LOG_VERSION = 1
+
+_FILE_HEADER = struct.Struct("<4sHH")
+_RECORD_HEADER = struct.Struct("<IHd")
+_LENGTH = struct.Struct("<I")
+_INT64 = struct.Struct("<q")
+
+# 事件类型ID -> (事件类, 字段表)；字段表中的字段只能在末尾追加，以保持向后兼容
+EVENT_TYPES: Dict[int, Tuple[Type[Event], Tuple[Tuple[str, str], ...]]] = {}
+_EVENT_TYPE_IDS: Dict[Type[Event], Tuple[int, Tuple[Tuple[str, str], ...]]] = {}
+
+
+def register_event_type(type_id: int, cls: Type[Event], fields: Tuple[Tuple[str, str], ...]):
+    """注册可持久化的事件类型，字段类型为 'str'、'int'、'json' 或 'events'（嵌套事件列表）"""
+    if type_id in EVENT_TYPES and EVENT_TYPES[type_id][0] is not cls:
+        raise ValueError(f"事件类型ID {type_id} 已被 {EVENT_TYPES[type_id][0].__name__} 占用")
+    EVENT_TYPES[type_id] = (cls, fields)
+    _EVENT_TYPE_IDS[cls] = (type_id, fields)
+
+
+register_event_type(1, MessageAction, (("source", "str"), ("content", "str")))
+register_event_type(2, CmdRunAction, (("source", "str"), ("command", "str")))
+register_event_type(3, FileEditAction, (("source", "str"), ("path", "str"), ("content", "str")))
+register_event_type(4, AgentFinishAction, (("source", "str"), ("outputs", "json")))
+register_event_type(5, FileReadAction, (("source", "str"), ("path", "str")))
+register_event_type(6, BatchAction, (("source", "str"), ("actions", "events")))
+register_event_type(
+    101, CmdOutputObservation,
+    (("source", "str"), ("content", "str"), ("command", "str"), ("exit_code", "int"))
+)
+register_event_type(102, FileReadObservation, (("source", "str"), ("content", "str"), ("path", "str")))
+register_event_type(103, ErrorObservation, (("source", "str"), ("content", "str"), ("error_type", "str")))
+register_event_type(104, BatchObservation, (("source", "str"), ("observations", "events")))
+
+
+def encode_event(event: Event) -> bytes:
+    """把事件编码为一条带长度前缀的记录"""
+    try:
+        type_id, fields = _EVENT_TYPE_IDS[type(event)]
+    except KeyError:
+        raise TypeError(f"未注册的事件类型: {type(event).__name__}") from None
+    
+    parts = []
+    for name, kind in fields:
+        value = getattr(event, name)
+        if kind == "int":
+            parts.append(_INT64.pack(value))
+            continue
+        if kind == "events":
+            parts.append(_LENGTH.pack(len(value)))
+            parts.extend(encode_event(item) for item in value)
+            continue
+        if kind == "str":
+            data = value.encode("utf-8")
+        else:
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        parts.append(_LENGTH.pack(len(data)))
+        parts.append(data)
+    
+    payload = b"".join(parts)
+    return _RECORD_HEADER.pack(len(payload), type_id, event.timestamp) + payload
+
+
+def decode_event(buffer, offset: int) -> Tuple[Optional[Event], int]:
+    """从缓冲区偏移处解码一条记录，返回 (事件, 下一条记录偏移)；未知类型返回 None"""
+    length, type_id, timestamp = _RECORD_HEADER.unpack_from(buffer, offset)
+    pos = offset + _RECORD_HEADER.size
+    end = pos + length
+    
+    if type_id not in EVENT_TYPES:
+        return None, end
+    
+    cls, fields = EVENT_TYPES[type_id]
+    event = cls.__new__(cls)
+    event.timestamp = timestamp
+    for name, kind in fields:
+        if pos >= end:
+            # 旧版本写入的记录缺少后来追加的字段
+            setattr(event, name, None)
+            continue
+        if kind == "int":
+            (value,) = _INT64.unpack_from(buffer, pos)
+            pos += _INT64.size
+        elif kind == "events":
+            (count,) = _LENGTH.unpack_from(buffer, pos)
+            pos += _LENGTH.size
+            value = []
+            for _ in range(count):
+                item, pos = decode_event(buffer, pos)
+                if item is not None:
+                    value.append(item)
+        else:
+            (size,) = _LENGTH.unpack_from(buffer, pos)
+            pos += _LENGTH.size
+            data = bytes(buffer[pos:pos + size])
+            pos += size
+            value = data.decode("utf-8") if kind == "str" else json.loads(data)
+        setattr(event, name, value)
+    
+    return event, end
+
+
+def _record_spans(buffer, size: int) -> Iterator[Tuple[int, int, int, float]]:
+    """遍历完整记录的 (偏移, 结束偏移, 事件类型ID, 时间戳)，只解析记录头；末尾写了一半的记录会被忽略"""
+    offset = _FILE_HEADER.size
+    header_size = _RECORD_HEADER.size
+    while offset + header_size <= size:
+        length, type_id, timestamp = _RECORD_HEADER.unpack_from(buffer, offset)
+        end = offset + header_size + length
+        if end > size:
+            break
+        yield offset, end, type_id, timestamp
+        offset = end
+
+def _complete_log_size(path: str) -> int:
+    """校验已有日志的文件头，返回最后一条完整记录的结束偏移"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        _check_file_header(f.read(_FILE_HEADER.size), path)
+        if size == _FILE_HEADER.size:
+            return size
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            end = _FILE_HEADER.size
+            for _, end, _, _ in _record_spans(buffer, size):
+                pass
+            return end
+
+class EventLogWriter:
+    """只追加的事件日志写入器
+    
+    打开已有日志时先截掉末尾写了一半的记录（例如进程在写入中途崩溃），
+    否则新记录接在残缺的字节之后，读取时会被当成同一条记录解析。
+    """
+    
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.truncated_bytes = 0  # 打开时截掉的残缺字节数
+        self._file = open(path, "ab")
+        try:
+            size = self._file.tell()
+            if size == 0:
+                self._file.write(_FILE_HEADER.pack(EVENT_LOG_MAGIC, EVENT_LOG_VERSION, 0))
+            else:
+                complete = _complete_log_size(path)
+                if complete < size:
+                    self._file.truncate(complete)
+                    self._file.seek(0, os.SEEK_END)
+                    self.truncated_bytes = size - complete
+        except BaseException:
+            self._file.close()
+            raise
+        self.records_written = 0
+    
+    def append(self, event: Event) -> int:
+        """追加单个事件，返回记录的文件偏移"""
+        offset = self._file.tell()
+        self._file.write(encode_event(event))
+        self.records_written += 1
+        return offset
+    
+    def extend(self, events) -> int:
+        """批量追加事件（一次写入），返回第一条记录的文件偏移"""
+        offset = self._file.tell()
+        records = [encode_event(event) for event in events]
+        self._file.write(b"".join(records))
+        self.records_written += len(records)
+        return offset
+    
+    def flush(self):
+        """刷新到磁盘"""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+    
+    def close(self):
+        """关闭写入器"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventLogReader:
+    """基于mmap的事件日志读取器，支持回放和只读头部的快速扫描"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mmap = None
+        if self._size == 0:
+            self._file.close()
+            raise ValueError(f"{path} 不是有效的事件日志（空文件）")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            _check_file_header(self._mmap[:_FILE_HEADER.size], path)
+        except BaseException:
+            self.close()
+            raise
+    
+    def _offsets(self) -> Iterator[Tuple[int, int, float]]:
+        """遍历 (偏移, 事件类型ID, 时间戳)，只解析记录头；末尾写了一半的记录会被忽略"""
+        for offset, _, type_id, timestamp in _record_spans(self._mmap, self._size):
+            yield offset, type_id, timestamp
+    
+    def scan(self) -> Iterator[Tuple[int, int, float]]:
+        """快速扫描记录头，不解码负载"""
+        return self._offsets()
+    
+    def replay(self, event_types: Optional[Tuple[Type[Event], ...]] = None) -> Iterator[Event]:
+        """按写入顺序惰性回放事件，可按事件类型过滤"""
+        wanted = None
+        if event_types is not None:
+            wanted = {
+                type_id for type_id, (cls, _) in EVENT_TYPES.items()
+                if issubclass(cls, event_types)
+            }
+        for offset, type_id, _ in self._offsets():
+            if wanted is not None and type_id not in wanted:
+                continue
+            event, _ = decode_event(self._mmap, offset)
+            if event is not None:
+                yield event
+    
+    def __iter__(self) -> Iterator[Event]:
+        return self.replay()
+    
+    def read_at(self, offset: int) -> Optional[Event]:
+        """读取指定偏移的事件"""
+        event, _ = decode_event(self._mmap, offset)
+        return event
+    
+    def count_by_type(self) -> Dict[str, int]:
+        """统计各事件类型的数量"""
+        counts: Dict[int, int] = {}
+        for _, type_id, _ in self._offsets():
+            counts[type_id] = counts.get(type_id, 0) + 1
+        return {
+            (EVENT_TYPES[type_id][0].__name__ if type_id in EVENT_TYPES else f"unknown:{type_id}"): count
+            for type_id, count in counts.items()
+        }
+    
+    def close(self):
+        """关闭读取器"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _check_file_header(header: bytes, path: str):
+    """校验事件日志文件头"""
+    if len(header) < _FILE_HEADER.size:
+        raise ValueError(f"{path} 不是有效的事件日志（文件头不完整）")
+    magic, version, _ = _FILE_HEADER.unpack(header)
+    if magic != EVENT_LOG_MAGIC:
+        raise ValueError(f"{path} 不是有效的事件日志（magic不匹配）")
+    if version > EVENT_LOG_VERSION:
+        raise ValueError(f"{path} 的格式版本 {version} 高于当前支持的 {EVENT_LOG_VERSION}")
+
 @dataclass
 class State:
     """代理状态"""
     history: List[Event]
     iteration: int = 0
     max_iterations: int = 100
+    task_id: Optional[str] = None  # 设置后控制器会为该任务写检查点
+    total_events: int = 0  # 累计添加过的事件数（历史被压缩后仍持续增长）
+    
+    def __post_init__(self):
+        if not self.total_events:
+            self.total_events = len(self.history)
     
     def get_last_action(self) -> Optional[Action]:
         """获取最后一个动作"""
@@ -122,14 +746,243 @@ class State:
     def add_event(self, event: Event):
         """添加事件"""
         self.history.append(event)
+        self.total_events += 1
+
+# ---------------------------------------------------------------------------
+# 分段追踪与性能分析
+#
+# 控制器为每个任务、迭代、LLM调用、动作解析和运行时执行记录嵌套的时间段（span）。
+# 时间段结束后写入定长环形缓冲区，可导出为Chrome Trace或OTLP风格的JSON文件。
+# ---------------------------------------------------------------------------
+
+_active_tracer: ContextVar[Optional["Tracer"]] = ContextVar("active_tracer", default=None)
+_current_span_id: ContextVar[int] = ContextVar("current_span_id", default=0)
+_current_trace_task: ContextVar[str] = ContextVar("current_trace_task", default="main")
+
+class _Span:
+    """进行中的时间段"""
+    __slots__ = ("tracer", "name", "category", "args", "span_id", "parent_id", "task", "start_ns", "_token")
+    
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Optional[Dict[str, Any]]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+    
+    def __enter__(self):
+        self.span_id = next(self.tracer._span_ids)
+        self.parent_id = _current_span_id.get()
+        self.task = _current_trace_task.get()
+        self._token = _current_span_id.set(self.span_id)
+        self.start_ns = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, *exc_info):
+        end_ns = time.perf_counter_ns()
+        _current_span_id.reset(self._token)
+        self.tracer._spans.append((
+            self.span_id, self.parent_id, self.name, self.category,
+            self.task, self.start_ns, end_ns, self.args
+        ))
+        return False
+
+class Tracer:
+    """基于单调时钟和环形缓冲区的低开销追踪器"""
+    
+    def __init__(
+        self,
+        capacity: int = 100_000,
+        profile_iterations: Optional[set] = None,
+        profile_dir: str = "profiles"
+    ):
+        self._spans: deque = deque(maxlen=capacity)  # 只保留最近的时间段
+        self._span_ids = itertools.count(1)
+        # 单调时钟与墙上时钟的换算，用于导出绝对时间
+        self._epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+        self.profile_iterations = profile_iterations or set()  # 需要cProfile分析的迭代序号
+        self.profile_dir = profile_dir
+        self._profiling = False
+    
+    def span(self, name: str, category: str = "agent", **args) -> _Span:
+        """创建时间段，用作 with 语句"""
+        return _Span(self, name, category, args or None)
+    
+    @contextmanager
+    def task(self, task_id: str):
+        """标记当前上下文所属的任务（导出时对应一条时间线）"""
+        token = _current_trace_task.set(task_id)
+        try:
+            with self.span("task", "task", task_id=task_id):
+                yield
+        finally:
+            _current_trace_task.reset(token)
+    
+    @contextmanager
+    def activate(self):
+        """在当前上下文中启用追踪器，使代理内部的 trace_span 生效"""
+        token = _active_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _active_tracer.reset(token)
+    
+    @contextmanager
+    def profile(self, iteration: int):
+        """对选定的迭代启用cProfile（同一时间只分析一个迭代）
+        
+        注意：cProfile按线程统计，并发任务在这段时间内的调用也会被计入。
+        """
+        if iteration not in self.profile_iterations or self._profiling:
+            yield
+            return
+        
+        import cProfile
+        
+        profiler = cProfile.Profile()
+        self._profiling = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._profiling = False
+            os.makedirs(self.profile_dir, exist_ok=True)
+            task = _current_trace_task.get()
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{task}-iteration-{iteration}.prof"))
+    
+    def spans(self) -> List[Dict[str, Any]]:
+        """缓冲区中的全部时间段"""
+        return [
+            {
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "category": category,
+                "task": task,
+                "start_ns": start_ns,
+                "duration_ns": end_ns - start_ns,
+                "args": args or {}
+            }
+            for span_id, parent_id, name, category, task, start_ns, end_ns, args in self._spans
+        ]
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按名称汇总：次数、总耗时、平均和最大耗时（毫秒）"""
+        stats: Dict[str, Dict[str, float]] = {}
+        for _, _, name, _, _, start_ns, end_ns, _ in self._spans:
+            duration = (end_ns - start_ns) / 1e6
+            entry = stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += duration
+            entry["max_ms"] = max(entry["max_ms"], duration)
+        for entry in stats.values():
+            entry["mean_ms"] = entry["total_ms"] / entry["count"]
+        return dict(sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+    
+    def export_chrome_trace(self, path: str):
+        """导出为Chrome Trace格式（chrome://tracing 或 Perfetto 中打开）"""
+        task_ids: Dict[str, int] = {}
+        events = []
+        for span in self.spans():
+            tid = task_ids.setdefault(span["task"], len(task_ids) + 1)
+            events.append({
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": span["start_ns"] / 1000,
+                "dur": span["duration_ns"] / 1000,
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {key: str(value) for key, value in span["args"].items()}
+            })
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": task}}
+            for task, tid in task_ids.items()
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    
+    def export_otlp_json(self, path: str, service_name: str = "custom-agent"):
+        """导出为OTLP风格的JSON（resourceSpans结构）"""
+        trace_ids: Dict[str, str] = {}
+        otlp_spans = []
+        for span in self.spans():
+            trace_id = trace_ids.setdefault(span["task"], uuid.uuid4().hex)
+            start = span["start_ns"] + self._epoch_offset_ns
+            otlp_spans.append({
+                "traceId": trace_id,
+                "spanId": f"{span['span_id']:016x}",
+                "parentSpanId": f"{span['parent_id']:016x}" if span["parent_id"] else "",
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(start),
+                "endTimeUnixNano": str(start + span["duration_ns"]),
+                "attributes": [
+                    {"key": key, "value": {"stringValue": str(value)}}
+                    for key, value in {"category": span["category"], "task": span["task"], **span["args"]}.items()
+                ]
+            })
+        document = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": "practice_projects.tracer"}, "spans": otlp_spans}]
+            }]
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False)
+    
+    def clear(self):
+        """清空缓冲区"""
+        self._spans.clear()
+
+_NO_SPAN = nullcontext()
+
+def trace_span(name: str, category: str = "agent", **args):
+    """在当前启用的追踪器中记录时间段；未启用时几乎没有开销"""
+    tracer = _active_tracer.get()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, category, **args)
 
 class MockLLM:
     """模拟LLM"""
-    def __init__(self, model: str = "mock-gpt"):
+    def __init__(
+        self,
+        model: str = "mock-gpt",
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        chunk_size: int = 4
+    ):
         self.model = model
+        self.latency = latency  # 模拟API延迟（秒）
+        self.token_latency = token_latency  # 模拟每个输出块的生成时间（秒）
+        self.chunk_size = chunk_size  # 流式输出时每块的字符数
     
     async def completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """模拟LLM补全"""
+        response = self._generate_response(messages)
+        delay = self.latency + self.token_latency * self._num_chunks(response)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
+    
+    async def stream_completion(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """模拟流式LLM补全，逐块返回输出"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        response = self._generate_response(messages)
+        for i in range(0, len(response), self.chunk_size):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield response[i:i + self.chunk_size]
+    
+    def _num_chunks(self, response: str) -> int:
+        """输出按块切分后的块数"""
+        return -(-len(response) // self.chunk_size)
+    
+    def _generate_response(self, messages: List[Dict[str, str]]) -> str:
+        """生成完整的响应文本"""
         if not messages:
             return "我需要更多信息来帮助你。"
         
@@ -147,12 +1000,96 @@ class MockLLM:
         else:
             return f"我理解了你的请求：{last_message}。让我来处理这个任务。"
 
+class IncrementalActionParser:
+    """增量动作解析器：边接收LLM输出边判断动作
+    
+    规则与一次性解析相同：出现命令关键词即为命令动作（优先级最高），
+    具体命令取最先出现的 ls/pwd/date。命令动作不依赖后续文本，一旦确定即可提前返回；
+    文件编辑、完成和消息动作需要携带完整响应，只能在流结束时生成。
+    """
+    
+    COMMAND_KEYWORDS = ("run", "execute", "命令", "执行")
+    COMMANDS = (("ls", "ls -la"), ("pwd", "pwd"), ("date", "date"))
+    FILE_KEYWORDS = ("file", "edit", "write", "文件", "编辑")
+    FINISH_KEYWORDS = ("finish", "done", "complete", "完成")
+    DEFAULT_COMMAND = "echo 'Hello from custom agent'"
+    
+    _OVERLAP = max(len(k) for k in COMMAND_KEYWORDS + tuple(name for name, _ in COMMANDS)) - 1
+    
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._lower = ""
+        self._scanned = 0
+        self._command_requested = False
+        self._command: Optional[str] = None
+        self.action: Optional[Action] = None
+    
+    @property
+    def text(self) -> str:
+        """目前收到的全部文本"""
+        return "".join(self._chunks)
+    
+    def feed(self, chunk: str) -> Optional[Action]:
+        """输入一块输出；动作在这一块中被确定时返回该动作"""
+        self._chunks.append(chunk)
+        if self.action is not None:
+            return None
+        
+        self._lower += chunk.lower()
+        # 只扫描新增部分（带上可能跨块的关键词前缀）
+        window_start = max(0, self._scanned - self._OVERLAP)
+        window = self._lower[window_start:]
+        self._scanned = len(self._lower)
+        
+        if not self._command_requested:
+            self._command_requested = any(k in window for k in self.COMMAND_KEYWORDS)
+        if self._command is None:
+            found = [(window.find(name), command) for name, command in self.COMMANDS if name in window]
+            if found:
+                self._command = min(found)[1]
+        
+        if self._command_requested and self._command is not None:
+            self.action = CmdRunAction(self._command)
+            return self.action
+        return None
+    
+    def finish(self) -> Action:
+        """流结束，返回最终动作"""
+        if self.action is not None:
+            return self.action
+        
+        response = self.text
+        response_lower = self._lower
+        
+        # 检查是否需要执行命令
+        if self._command_requested:
+            self.action = CmdRunAction(self._command or self.DEFAULT_COMMAND)
+        
+        # 检查是否需要编辑文件
+        elif any(keyword in response_lower for keyword in self.FILE_KEYWORDS):
+            self.action = FileEditAction(
+                path="/tmp/agent_output.txt",
+                content=f"Agent response: {response}\nTimestamp: {time.time()}"
+            )
+        
+        # 检查是否完成任务
+        elif any(keyword in response_lower for keyword in self.FINISH_KEYWORDS):
+            self.action = AgentFinishAction(outputs={"result": response, "status": "completed"})
+        
+        # 默认返回消息动作
+        else:
+            self.action = MessageAction(content=response)
+        
+        return self.action
+
 class CustomAgent:
     """自定义OpenHands代理"""
     
-    def __init__(self, llm: MockLLM, name: str = "CustomAgent"):
+    def __init__(self, llm: MockLLM, name: str = "CustomAgent", streaming: bool = False):
         self.llm = llm
         self.name = name
+        # 开启后使用流式补全，动作一经确定立即返回，不等待完整输出
+        self.streaming = streaming
         self.system_prompt = """你是一个有用的AI代理，可以执行以下操作：
 1. 执行shell命令
 2. 读取和编辑文件
@@ -164,16 +1101,36 @@ class CustomAgent:
     async def step(self, state: State) -> Action:
         """执行一步操作"""
         # 构建对话历史
-        messages = self._build_messages(state)
+        with trace_span("prompt_build"):
+            messages = self._build_messages(state)
+        
+        if self.streaming:
+            with trace_span("llm_stream", "llm"):
+                return await self._step_streaming(messages)
         
         # 获取LLM响应
-        response = await self.llm.completion(messages)
+        with trace_span("llm_call", "llm"):
+            response = await self.llm.completion(messages)
         
         # 解析响应并生成动作
-        action = self._parse_response_to_action(response, state)
+        with trace_span("action_parse"):
+            action = self._parse_response_to_action(response, state)
         
         return action
     
+    async def _step_streaming(self, messages: List[Dict[str, str]]) -> Action:
+        """流式获取LLM响应，动作确定后立即返回并关闭剩余的流"""
+        parser = IncrementalActionParser()
+        stream = self.llm.stream_completion(messages)
+        try:
+            async for chunk in stream:
+                action = parser.feed(chunk)
+                if action is not None:
+                    return action
+        finally:
+            await stream.aclose()
+        return parser.finish()
+    
     def _build_messages(self, state: State) -> List[Dict[str, str]]:
         """构建消息历史"""
         messages = [{"role": "system", "content": self.system_prompt}]
@@ -188,71 +1145,592 @@ class CustomAgent:
             elif isinstance(event, CmdOutputObservation):
                 messages.append({
                     "role": "system", 
-                    "content": f"命令 '{event.command}' 的输出：{event.content[:200]}..."
+                    "content": f"命令 '{event.command}' 的输出：{event.preview(200)}..."
                 })
             elif isinstance(event, ErrorObservation):
                 messages.append({
                     "role": "system",
                     "content": f"错误：{event.content}"
                 })
+            elif isinstance(event, CondensationSummary):
+                messages.append({"role": "system", "content": event.describe()})
         
         return messages
     
     def _parse_response_to_action(self, response: str, state: State) -> Action:
         """解析LLM响应为动作"""
-        response_lower = response.lower()
-        
-        # 检查是否需要执行命令
-        if any(keyword in response_lower for keyword in ["run", "execute", "命令", "执行"]):
-            # 简单提取命令（实际项目中需要更复杂的解析）
-            if "ls" in response_lower:
-                return CmdRunAction("ls -la")
-            elif "pwd" in response_lower:
-                return CmdRunAction("pwd")
-            elif "date" in response_lower:
-                return CmdRunAction("date")
+        parser = IncrementalActionParser()
+        parser.feed(response)
+        return parser.finish()
+
+class BlobStore:
+    """内容寻址的文件内容存储：相同内容只保存一份，可在多个运行时之间共享
+    
+    引用本存储的文件系统和快照以弱引用登记；恢复快照或释放快照后，内容数量比上次回收后
+    翻倍（且不少于 collect_threshold）时回收不再被任何文件系统或快照引用的内容。
+    """
+    
+    def __init__(self, collect_threshold: int = 1024):
+        self._blobs: Dict[str, str] = {}
+        # 引用本存储的 VirtualFileSystem 和 FileSystemSnapshot: id -> 弱引用（两者都不可按身份哈希）
+        self._owners: Dict[int, weakref.ref] = {}
+        self.collect_threshold = collect_threshold
+        self._collect_at = collect_threshold
+    
+    def put(self, content: str) -> str:
+        """保存内容，返回内容摘要"""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self._blobs.setdefault(digest, content)
+        return digest
+    
+    def get(self, digest: str) -> str:
+        """按摘要读取内容"""
+        return self._blobs[digest]
+    
+    def track(self, owner):
+        """登记引用本存储的文件系统或快照（有 root 属性，弱引用）"""
+        key = id(owner)
+        self._owners[key] = weakref.ref(owner, lambda _: self._owners.pop(key, None))
+    
+    def untrack(self, owner):
+        """取消登记（例如快照被释放）"""
+        self._owners.pop(id(owner), None)
+    
+    def live_digests(self) -> set:
+        """所有已登记的文件系统和快照引用的内容摘要（共享的目录节点只遍历一次）"""
+        live = set()
+        seen = set()
+        owners = [ref() for ref in list(self._owners.values())]
+        stack = [owner.root for owner in owners if owner is not None]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            for entry in node.entries.values():
+                if isinstance(entry, _DirNode):
+                    stack.append(entry)
+                else:
+                    live.add(entry)
+        return live
+    
+    def collect(self, live_digests) -> int:
+        """删除不在 live_digests 中的内容，返回删除数量"""
+        live = set(live_digests)
+        dead = [digest for digest in self._blobs if digest not in live]
+        for digest in dead:
+            del self._blobs[digest]
+        return len(dead)
+    
+    def collect_garbage(self, force: bool = False) -> int:
+        """回收不再被引用的内容；不强制时只在内容数量达到回收阈值后才遍历，均摊开销"""
+        if not force and len(self._blobs) < self._collect_at:
+            return 0
+        removed = self.collect(self.live_digests())
+        self._collect_at = max(self.collect_threshold, 2 * len(self._blobs))
+        return removed
+    
+    def __len__(self) -> int:
+        return len(self._blobs)
+    
+    @property
+    def total_bytes(self) -> int:
+        """已保存内容的总字节数（按UTF-8计）"""
+        return sum(len(content.encode("utf-8")) for content in self._blobs.values())
+
+class _DirNode:
+    """目录节点：子目录为 _DirNode，文件为内容摘要；generation 用于判断节点是否被快照共享"""
+    __slots__ = ("entries", "generation")
+    
+    def __init__(self, entries: Dict[str, Any], generation: int):
+        self.entries = entries
+        self.generation = generation
+
+@dataclass(frozen=True)
+class FileSystemSnapshot:
+    """文件系统快照（只引用当时的根目录节点，创建和恢复都是O(1)）"""
+    root: _DirNode
+    file_count: int
+    label: str = ""
+    created_at: float = 0.0
+
+# 所有虚拟文件系统共用的代数计数器，保证跨实例恢复快照时不会误改共享节点
+_vfs_generations = itertools.count(1)
+
+class VirtualFileSystem(MutableMapping):
+    """写时复制的虚拟文件系统
+    
+    用法与 {路径: 内容} 字典相同。快照只是冻结当前根节点，之后的写入沿路径复制
+    被共享的目录节点，因此快照、恢复和分叉的开销只与改动的文件数和目录深度有关。
+    """
+    
+    def __init__(self, blob_store: Optional[BlobStore] = None):
+        self.blob_store = blob_store if blob_store is not None else BlobStore()
+        self._generation = next(_vfs_generations)
+        self._root = _DirNode({}, self._generation)
+        self._count = 0
+        self.blob_store.track(self)
+    
+    @property
+    def root(self) -> _DirNode:
+        """当前根目录节点（供内容存储回收时遍历）"""
+        return self._root
+    
+    @staticmethod
+    def _split(path: str) -> List[str]:
+        """规范化路径并拆分为各级名称"""
+        parts = [part for part in posixpath.normpath("/" + path).split("/") if part]
+        if not parts:
+            raise IsADirectoryError(path)
+        return parts
+    
+    def _lookup(self, path: str):
+        """查找路径对应的条目，不存在时抛出KeyError"""
+        node = self._root
+        parts = self._split(path)
+        for name in parts[:-1]:
+            node = node.entries.get(name)
+            if not isinstance(node, _DirNode):
+                raise KeyError(path)
+        return node.entries[parts[-1]]
+    
+    def _writable(self, node: _DirNode) -> _DirNode:
+        """返回可修改的节点，被快照共享的节点先复制一份"""
+        if node.generation == self._generation:
+            return node
+        return _DirNode(dict(node.entries), self._generation)
+    
+    def _writable_parent(self, parts: List[str], create: bool) -> Optional[_DirNode]:
+        """沿路径复制被共享的目录节点，返回可修改的父目录"""
+        self._root = node = self._writable(self._root)
+        for name in parts[:-1]:
+            child = node.entries.get(name)
+            if child is None:
+                if not create:
+                    return None
+                child = _DirNode({}, self._generation)
+            elif not isinstance(child, _DirNode):
+                raise NotADirectoryError("/" + "/".join(parts))
             else:
-                return CmdRunAction("echo 'Hello from custom agent'")
-        
-        # 检查是否需要编辑文件
-        elif any(keyword in response_lower for keyword in ["file", "edit", "write", "文件", "编辑"]):
-            return FileEditAction(
-                path="/tmp/agent_output.txt",
-                content=f"Agent response: {response}\nTimestamp: {asyncio.get_event_loop().time()}"
-            )
-        
-        # 检查是否完成任务
-        elif any(keyword in response_lower for keyword in ["finish", "done", "complete", "完成"]):
-            return AgentFinishAction(outputs={"result": response, "status": "completed"})
+                child = self._writable(child)
+            node.entries[name] = child
+            node = child
+        return node
+    
+    def __getitem__(self, path: str) -> str:
+        entry = self._lookup(path)
+        if isinstance(entry, _DirNode):
+            raise IsADirectoryError(path)
+        return self.blob_store.get(entry)
+    
+    def __setitem__(self, path: str, content: str):
+        parts = self._split(path)
+        parent = self._writable_parent(parts, create=True)
+        existing = parent.entries.get(parts[-1])
+        if isinstance(existing, _DirNode):
+            raise IsADirectoryError(path)
+        if existing is None:
+            self._count += 1
+        digest = self.blob_store.put(content)
+        parent.entries[parts[-1]] = digest
+        if existing is not None and existing != digest:
+            self.blob_store.collect_garbage()  # 旧内容可能已无人引用
+    
+    def __delitem__(self, path: str):
+        parts = self._split(path)
+        if isinstance(self._lookup(path), _DirNode):
+            raise IsADirectoryError(path)
+        parent = self._writable_parent(parts, create=False)
+        del parent.entries[parts[-1]]
+        self._count -= 1
+        self.blob_store.collect_garbage()
+    
+    def __contains__(self, path) -> bool:
+        try:
+            return not isinstance(self._lookup(path), _DirNode)
+        except (KeyError, IsADirectoryError):
+            return False
+    
+    def get(self, path: str, default: Any = None) -> Any:
+        """读取文件内容；路径不存在或是目录时返回 default"""
+        try:
+            return self[path]
+        except (KeyError, IsADirectoryError):
+            return default
+    
+    def _walk(self, node: _DirNode, prefix: str) -> Iterator[Tuple[str, str]]:
+        """遍历 (路径, 内容摘要)"""
+        for name, entry in node.entries.items():
+            path = f"{prefix}/{name}"
+            if isinstance(entry, _DirNode):
+                yield from self._walk(entry, path)
+            else:
+                yield path, entry
+    
+    def __iter__(self) -> Iterator[str]:
+        for path, _ in self._walk(self._root, ""):
+            yield path
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def digests(self) -> Iterator[str]:
+        """当前所有文件的内容摘要"""
+        for _, digest in self._walk(self._root, ""):
+            yield digest
+    
+    def snapshot(self, label: str = "") -> FileSystemSnapshot:
+        """创建快照"""
+        snapshot = FileSystemSnapshot(self._root, self._count, label, time.time())
+        self.blob_store.track(snapshot)
+        # 之后的写入都需要先复制当前节点
+        self._generation = next(_vfs_generations)
+        return snapshot
+    
+    def restore(self, snapshot: FileSystemSnapshot):
+        """恢复到快照（被丢弃的改动引用的内容会在之后的回收中删除）"""
+        self._root = snapshot.root
+        self._count = snapshot.file_count
+        self._generation = next(_vfs_generations)
+        self.blob_store.collect_garbage()
+    
+    def release(self, snapshot: FileSystemSnapshot):
+        """释放不再需要的快照，只被它引用的内容可以被回收；释放后不能再恢复该快照"""
+        self.blob_store.untrack(snapshot)
+        self.blob_store.collect_garbage()
+    
+    def fork(self) -> "VirtualFileSystem":
+        """分叉出共享内容存储的独立副本"""
+        snapshot = self.snapshot("fork")
+        other = VirtualFileSystem(self.blob_store)
+        other.restore(snapshot)
+        return other
+
+def _action_footprint(action: Action) -> Tuple[set, set, bool]:
+    """动作读写的路径集合，以及它是否可能影响任意状态（例如shell命令）"""
+    if isinstance(action, FileEditAction):
+        return set(), {posixpath.normpath(action.path)}, False
+    if isinstance(action, FileReadAction):
+        return {posixpath.normpath(action.path)}, set(), False
+    if isinstance(action, MessageAction):
+        return set(), set(), False
+    return set(), set(), True
+
+def _actions_conflict(a: Tuple[set, set, bool], b: Tuple[set, set, bool]) -> bool:
+    """两个动作是否必须按顺序执行"""
+    reads_a, writes_a, barrier_a = a
+    reads_b, writes_b, barrier_b = b
+    if barrier_a or barrier_b:
+        return True
+    return bool(writes_a & (reads_b | writes_b) or writes_b & reads_a)
+
+# 命令结果缓存：按命令读取的路径跟踪依赖，写入相关路径时失效
+_PURE_COMMANDS = {"pwd", "whoami", "hostname", "uname", "nproc", "echo", "printf", "true", "false"}
+_READ_COMMANDS = {
+    "ls", "cat", "head", "tail", "wc", "grep", "find", "stat", "du", "file", "tree",
+    "md5sum", "sha1sum", "sha256sum", "diff", "cmp", "readlink", "realpath",
+}
+_VOLATILE_COMMANDS = {"date", "uptime", "ps", "free", "df", "top", "sleep"}
+_READ_GIT_SUBCOMMANDS = {"status", "log", "diff", "show", "branch"}  # 不带参数的git查询读取整个工作区
+_MUTATING_COMMANDS = {"rm", "mv", "cp", "touch", "mkdir", "rmdir", "chmod", "chown", "ln", "tee", "truncate"}
+# find 的这些动作执行任意命令或写入任意文件（-exec、-execdir、-ok、-okdir、-fprint、-fprint0、-fprintf、-fls）
+_FIND_UNBOUNDED_ACTIONS = ("-exec", "-ok", "-fprint", "-fls")
+_SHELL_METACHARS = set("|;&<>$`(){}\n\\")
+_GLOB_CHARS = set("*?[")
+
+@dataclass(frozen=True)
+class CommandEffect:
+    """命令对工作区的影响
+    
+    kind:
+    - pure: 输出只取决于命令文本，可以一直缓存
+    - read: 只读取 paths 下的内容，可以缓存到相关路径被修改
+    - volatile: 不修改工作区但每次输出不同（例如 date），不缓存
+    - mutating: 会修改 paths；paths 为 None 表示影响无法确定，视为修改整个工作区
+    """
+    kind: str
+    paths: Optional[frozenset] = None
+
+def _normalize_command_path(path: str) -> str:
+    if any(c in _GLOB_CHARS for c in path):
+        # 通配符读取的是所在目录
+        path = posixpath.dirname(path.split("*")[0].split("?")[0].split("[")[0]) or "."
+    return posixpath.normpath(path)
+
+def _sed_in_place(args: List[str]) -> bool:
+    """sed 是否原地修改文件（-i、-i.bak、-ni 等短选项组合，或 --in-place[=后缀]）"""
+    for arg in args:
+        if arg == "--in-place" or arg.startswith("--in-place="):
+            return True
+        if arg.startswith("-") and not arg.startswith("--") and "i" in arg[1:]:
+            return True
+    return False
+
+def _grep_paths(args: List[str]) -> List[str]:
+    """grep 的文件参数：去掉选项和模式（用 -e/-f 给出模式时所有操作数都是文件）"""
+    operands, explicit_pattern, skip = [], False, False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ("-e", "-f", "--regexp", "--file"):
+            explicit_pattern, skip = True, True
+        elif arg.startswith(("--regexp=", "--file=")):
+            explicit_pattern = True
+        elif not arg.startswith("-"):
+            operands.append(arg)
+    return operands if explicit_pattern else operands[1:]
+
+def classify_command(command: str) -> CommandEffect:
+    """按命令名和参数保守地判断命令类别；无法确定时一律视为修改整个工作区"""
+    if any(c in _SHELL_METACHARS for c in command):
+        return CommandEffect("mutating")  # 管道、重定向、变量展开等一律不缓存
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return CommandEffect("mutating")
+    if not argv:
+        return CommandEffect("pure")
+    
+    name, args = argv[0], argv[1:]
+    operands = [a for a in args if not a.startswith("-")]
+    if name in _PURE_COMMANDS:
+        return CommandEffect("pure")
+    if name in _VOLATILE_COMMANDS:
+        return CommandEffect("volatile")
+    if name == "git" and len(argv) == 2 and argv[1] in _READ_GIT_SUBCOMMANDS:
+        return CommandEffect("read", frozenset({"."}))
+    if name == "find":
+        # 起始路径是第一个表达式之前的参数
+        index = next((i for i, a in enumerate(args) if a.startswith(("-", "(", "!"))), len(args))
+        operands = args[:index] or ["."]
+        if any(a.startswith(_FIND_UNBOUNDED_ACTIONS) for a in args[index:]):
+            return CommandEffect("mutating")
+        if "-delete" in args[index:]:
+            return CommandEffect("mutating", frozenset(_normalize_command_path(p) for p in operands))
+    if name in _MUTATING_COMMANDS or (name == "sed" and _sed_in_place(args)):
+        return CommandEffect("mutating", frozenset(_normalize_command_path(p) for p in operands))
+    if name in _READ_COMMANDS or name == "sed":
+        if name == "grep":
+            operands = _grep_paths(args)
+        elif name == "sed" and "-e" not in args and "-f" not in args:
+            operands = operands[1:]  # 第一个操作数是脚本
+        if not operands:
+            operands = ["."]  # 不带路径时读取当前目录（ls、find、grep -r 等），保守地视为依赖整个工作区
+        return CommandEffect("read", frozenset(_normalize_command_path(p) for p in operands))
+    return CommandEffect("mutating")
+
+def _paths_related(a: str, b: str) -> bool:
+    """两个路径相同，或一个是另一个的祖先（相对和绝对路径无法比较，视为相关）"""
+    if posixpath.isabs(a) != posixpath.isabs(b):
+        return True
+    if a == b or a == "." or b == ".":
+        return True
+    return b.startswith(a.rstrip("/") + "/") or a.startswith(b.rstrip("/") + "/")
+
+class CommandResultCache:
+    """幂等命令的结果缓存
+    
+    键为命令文本加上运行时给出的读取路径指纹；条目按读取的路径建立索引，
+    FileEditAction 或修改类命令涉及相关路径时删除对应条目。
+    无法判断影响范围的命令会清空缓存。
+    """
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: Dict[Tuple[str, Any], Tuple[SpooledPayload, int, frozenset]] = {}
+        self._by_path: Dict[str, set] = {}
+        self._generation = 0  # 每次失效加一，执行期间发生失效的结果不会写入缓存
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidations = 0
+    
+    @property
+    def generation(self) -> int:
+        return self._generation
+    
+    def get(self, key: Tuple[str, Any]) -> Optional[Tuple[SpooledPayload, int]]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries[key] = entry  # 移到末尾（LRU）
+        self.hits += 1
+        return entry[0], entry[1]
+    
+    def put(self, key: Tuple[str, Any], payload: SpooledPayload, exit_code: int,
+            paths: frozenset, generation: int):
+        if generation != self._generation:
+            return
+        if key in self._entries:
+            self._discard(key)
+        while len(self._entries) >= self.maxsize:
+            self._discard(next(iter(self._entries)))
+        self._entries[key] = (payload, exit_code, paths)
+        for path in paths:
+            self._by_path.setdefault(path, set()).add(key)
+    
+    def _discard(self, key: Tuple[str, Any]):
+        _, _, paths = self._entries.pop(key)
+        for path in paths:
+            keys = self._by_path.get(path)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_path[path]
+    
+    def invalidate(self, paths: Optional[frozenset] = None) -> int:
+        """删除读取了相关路径的条目；paths 为 None 时清空所有条目
         
-        # 默认返回消息动作
+        影响无法确定的命令（例如 cd、export）连纯命令的输出也可能改变（cd 之后的 pwd），
+        因此不区分条目是否依赖工作区。
+        """
+        self._generation += 1
+        if paths is None:
+            stale = set(self._entries)
         else:
-            return MessageAction(content=response)
+            stale = set()
+            for read_path, keys in self._by_path.items():
+                if any(_paths_related(read_path, path) for path in paths):
+                    stale |= keys
+        for key in stale:
+            self._discard(key)
+        self.invalidations += len(stale)
+        return len(stale)
+    
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._by_path.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
 
 class MockRuntime:
     """模拟运行时环境"""
     
-    def __init__(self):
-        self.files = {}  # 模拟文件系统
+    # 动作类型 -> 处理协程 handler(runtime, action)；插件可通过 register_handler 扩展
+    _action_handlers: Dict[type, Callable] = {}
+    
+    @classmethod
+    def register_handler(cls, action_type: type):
+        """注册动作处理函数（装饰器）；在子类上注册不会影响父类"""
+        def decorator(handler: Callable) -> Callable:
+            if "_action_handlers" not in cls.__dict__:
+                cls._action_handlers = dict(cls._action_handlers)
+            cls._action_handlers[action_type] = handler
+            return handler
+        return decorator
+    
+    def __init__(self, blob_store: Optional[BlobStore] = None, command_cache: Optional[CommandResultCache] = None):
+        self.files = VirtualFileSystem(blob_store)  # 模拟文件系统（写时复制，可快照）
+        self.command_cache = command_cache  # 可选：缓存只读命令的结果
+    
+    def snapshot(self, label: str = "") -> FileSystemSnapshot:
+        """为工作区创建快照"""
+        return self.files.snapshot(label)
+    
+    def restore(self, snapshot: FileSystemSnapshot):
+        """把工作区回滚到快照"""
+        self.files.restore(snapshot)
+        if self.command_cache is not None:
+            self.command_cache.invalidate()
+    
+    def release(self, snapshot: FileSystemSnapshot):
+        """释放不再需要的快照"""
+        self.files.release(snapshot)
+    
+    def fork(self) -> "MockRuntime":
+        """分叉出工作区独立、内容存储共享的运行时，用于分支或重试轨迹"""
+        cache = CommandResultCache(self.command_cache.maxsize) if self.command_cache is not None else None
+        runtime = MockRuntime(self.files.blob_store, cache)
+        runtime.files = self.files.fork()
+        return runtime
     
     async def execute_action(self, action: Action) -> Observation:
         """执行动作并返回观察"""
-        if isinstance(action, CmdRunAction):
-            return await self._execute_command(action)
-        elif isinstance(action, FileEditAction):
-            return await self._edit_file(action)
-        elif isinstance(action, MessageAction):
-            # 消息动作不需要执行，直接返回成功观察
-            return CmdOutputObservation(
-                content=f"Message sent: {action.content}",
-                command="message",
-                exit_code=0
-            )
-        else:
-            return ErrorObservation(
-                content=f"Unknown action type: {type(action).__name__}",
-                error_type="action_error"
-            )
+        # 按动作类型的MRO查找处理函数，子类动作可以复用父类的处理函数
+        for action_type in type(action).__mro__:
+            handler = self._action_handlers.get(action_type)
+            if handler is not None:
+                return await handler(self, action)
+        
+        return ErrorObservation(
+            content=f"Unknown action type: {type(action).__name__}",
+            error_type="action_error"
+        )
+    
+    async def _execute_batch(self, batch: BatchAction) -> Observation:
+        """并发执行批量动作中互不依赖的成员；有路径冲突的成员按原顺序执行"""
+        footprints = [_action_footprint(action) for action in batch.actions]
+        tasks: List[asyncio.Task] = []
+        for i, action in enumerate(batch.actions):
+            dependencies = [
+                tasks[j] for j in range(i)
+                if _actions_conflict(footprints[i], footprints[j])
+            ]
+            tasks.append(asyncio.ensure_future(self._execute_after(dependencies, action)))
+        
+        return BatchObservation(list(await asyncio.gather(*tasks)))
+    
+    async def _execute_after(self, dependencies: List[asyncio.Task], action: Action) -> Observation:
+        """等依赖的动作完成后再执行；单个动作失败不影响批量中的其他动作"""
+        if dependencies:
+            await asyncio.wait(dependencies)
+        try:
+            return await self.execute_action(action)
+        except Exception as e:
+            return ErrorObservation(content=f"动作执行失败: {e}", error_type="action_error")
+    
+    async def _read_file(self, action: FileReadAction) -> Observation:
+        """读取文件"""
+        try:
+            content = self.files[action.path]
+        except (KeyError, OSError):
+            return ErrorObservation(content=f"File {action.path} not found", error_type="file_error")
+        return FileReadObservation(content=content, path=action.path)
+    
+    def _read_fingerprint(self, paths: frozenset) -> Any:
+        """命令读取路径的状态指纹，作为缓存键的一部分
+        
+        模拟文件系统只会通过动作修改，失效由缓存自身处理，因此不需要额外指纹。
+        """
+        return None
+    
+    async def _execute_cached_command(self, action: CmdRunAction) -> Observation:
+        """执行命令；纯命令和只读命令的结果从缓存读取，修改类命令使相关条目失效"""
+        cache = self.command_cache
+        effect = classify_command(action.command)
+        if effect.kind == "mutating":
+            observation = await self._execute_command(action)
+            cache.invalidate(effect.paths)
+            return observation
+        if effect.kind == "volatile":
+            cache.bypassed += 1
+            return await self._execute_command(action)
+        
+        paths = effect.paths or frozenset()
+        key = (action.command, self._read_fingerprint(paths))
+        cached = cache.get(key)
+        if cached is not None:
+            return CmdOutputObservation.from_payload(cached[0], action.command, cached[1])
+        
+        generation = cache.generation
+        observation = await self._execute_command(action)
+        if isinstance(observation, CmdOutputObservation):
+            cache.put(key, observation.payload, observation.exit_code, paths, generation)
+        return observation
     
     async def _execute_command(self, action: CmdRunAction) -> Observation:
         """执行命令"""
@@ -282,101 +1760,1816 @@ drwxr-xr-x 3 user user 4096 Jan 1 12:00 ..
     
     async def _edit_file(self, action: FileEditAction) -> Observation:
         """编辑文件"""
-        self.files[action.path] = action.content
+        try:
+            self.files[action.path] = action.content
+        except OSError as e:
+            return ErrorObservation(content=f"写入文件失败: {e}", error_type="file_error")
         
         return FileReadObservation(
             content=f"File {action.path} written successfully",
             path=action.path
         )
 
+@MockRuntime.register_handler(CmdRunAction)
+async def _handle_cmd_run(runtime: MockRuntime, action: CmdRunAction) -> Observation:
+    if runtime.command_cache is not None:
+        return await runtime._execute_cached_command(action)
+    return await runtime._execute_command(action)
+
+@MockRuntime.register_handler(FileEditAction)
+async def _handle_file_edit(runtime: MockRuntime, action: FileEditAction) -> Observation:
+    try:
+        return await runtime._edit_file(action)
+    finally:
+        if runtime.command_cache is not None:
+            runtime.command_cache.invalidate(frozenset({posixpath.normpath(action.path)}))
+
+@MockRuntime.register_handler(FileReadAction)
+async def _handle_file_read(runtime: MockRuntime, action: FileReadAction) -> Observation:
+    return await runtime._read_file(action)
+
+@MockRuntime.register_handler(MessageAction)
+async def _handle_message(runtime: MockRuntime, action: MessageAction) -> Observation:
+    # 消息动作不需要执行，直接返回成功观察
+    return CmdOutputObservation(
+        content=f"Message sent: {action.content}",
+        command="message",
+        exit_code=0
+    )
+
+@MockRuntime.register_handler(BatchAction)
+async def _handle_batch(runtime: MockRuntime, action: BatchAction) -> Observation:
+    return await runtime._execute_batch(action)
+
+class ShellSyntaxError(ValueError):
+    """命令无法被bash解析（例如引号不配对），不会发送到会话"""
+
+async def check_command_syntax(command: str, shell: str = "/bin/bash"):
+    """检查命令能否被解析，不能时抛出 ShellSyntaxError
+    
+    先用 shlex 快速检查；shlex 无法解析时（也可能是 shlex 不支持的合法语法，例如 here-document）
+    再用 bash -n 确认。
+    """
+    try:
+        shlex.split(command)
+        return
+    except ValueError:
+        pass
+    process = await asyncio.create_subprocess_exec(
+        shell, "-n", "-c", command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        message = stderr.decode("utf-8", "replace").strip()
+        raise ShellSyntaxError(f"命令语法错误: {message or command}")
+
+class ShellSession:
+    """常驻bash会话：命令通过带唯一标记的分帧协议执行，并获取退出码
+    
+    每条命令都在会话的工作目录中执行（cd状态不会跨命令保留），
+    因此池中的会话可以互换使用；导出的环境变量会保留在会话中。
+    """
+    
+    def __init__(self, workdir: Optional[str] = None, shell: str = "/bin/bash"):
+        self.workdir = workdir or os.getcwd()
+        self.shell = shell
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.last_exit_code: Optional[int] = None
+        self.commands_run = 0
+        self._broken = False
+    
+    @property
+    def alive(self) -> bool:
+        """会话进程是否存活且可用"""
+        return self.process is not None and self.process.returncode is None and not self._broken
+    
+    async def start(self):
+        """启动bash进程"""
+        self.process = await asyncio.create_subprocess_exec(
+            self.shell, "--noprofile", "--norc",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=self.workdir,
+            start_new_session=True
+        )
+        self._broken = False
+    
+    async def stream(self, command: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """执行命令并增量返回输出；结束后退出码保存在 last_exit_code
+        
+        无法解析的命令不会发送到会话，直接抛出 ShellSyntaxError。
+        """
+        await check_command_syntax(command, self.shell)
+        if not self.alive:
+            await self.start()
+        
+        marker = f"__OH_CMD_DONE_{uuid.uuid4().hex}__"
+        terminator = f"\n{marker}:".encode()
+        # 命令作为一个单引号字符串交给eval：即使命令本身不完整（例如未结束的if），
+        # bash也只会在eval内部报语法错误，不会继续读取后面的结束标记
+        script = (
+            f"cd {shlex.quote(self.workdir)}\n"
+            f"eval {shlex.quote(command)} < /dev/null\n"
+            f"printf '\\n%s:%d\\n' {marker} $?\n"
+        )
+        self.last_exit_code = None
+        self.commands_run += 1
+        self.process.stdin.write(script.encode())
+        await self.process.stdin.drain()
+        
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        buffer = b""
+        completed = False
+        try:
+            while True:
+                index = buffer.find(terminator)
+                if index >= 0:
+                    line_end = buffer.find(b"\n", index + len(terminator))
+                    if line_end >= 0:
+                        text = decoder.decode(buffer[:index], final=True)
+                        if text:
+                            yield text
+                        self.last_exit_code = int(buffer[index + len(terminator):line_end])
+                        completed = True
+                        return
+                else:
+                    # 只保留可能是半个结束标记的尾部，其余输出立即返回
+                    safe = len(buffer)
+                    tail = buffer.rfind(b"\n", max(0, len(buffer) - len(terminator) + 1))
+                    if tail >= 0 and terminator.startswith(buffer[tail:]):
+                        safe = tail
+                    if safe > 0:
+                        text = decoder.decode(buffer[:safe])
+                        buffer = buffer[safe:]
+                        if text:
+                            yield text
+                
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    chunk = await asyncio.wait_for(self.process.stdout.read(65536), remaining)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"命令执行超时（{timeout}秒）: {command}") from None
+                
+                if not chunk:
+                    # 命令结束了shell本身（例如exit），会话失效
+                    text = decoder.decode(buffer, final=True)
+                    if text:
+                        yield text
+                    self.last_exit_code = await self.process.wait()
+                    completed = True
+                    return
+                buffer += chunk
+        finally:
+            if not completed:
+                # 超时或调用方提前放弃读取，会话状态不确定，直接终止
+                self.kill()
+    
+    async def run(self, command: str, timeout: Optional[float] = None) -> Tuple[str, int]:
+        """执行命令，返回 (完整输出, 退出码)"""
+        chunks = [chunk async for chunk in self.stream(command, timeout)]
+        return "".join(chunks), self.last_exit_code
+    
+    def kill(self):
+        """终止会话进程，会话随即不可再用"""
+        if self.process is not None and self.process.returncode is None:
+            # 会话是独立进程组的组长，连同正在运行的子进程一起终止
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._broken = True
+    
+    async def close(self):
+        """关闭会话并回收进程"""
+        if self.process is None:
+            return
+        if self.alive:
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), 1.0)
+            except asyncio.TimeoutError:
+                self.kill()
+        await self.process.wait()
+
+class ShellSessionPool:
+    """常驻bash会话池，可在多次代理运行之间复用"""
+    
+    def __init__(
+        self,
+        size: int = 4,
+        workdir: Optional[str] = None,
+        shell: str = "/bin/bash",
+        max_commands_per_session: Optional[int] = None
+    ):
+        self.size = size
+        self.workdir = workdir or os.getcwd()
+        self.shell = shell
+        self.max_commands_per_session = max_commands_per_session
+        self._idle: Optional[asyncio.Queue] = None
+        self._sessions: List[ShellSession] = []
+        self.sessions_started = 0
+    
+    async def start(self):
+        """预先启动全部会话"""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        sessions = await asyncio.gather(*(self._new_session() for _ in range(self.size)))
+        for session in sessions:
+            self._idle.put_nowait(session)
+    
+    async def _new_session(self) -> ShellSession:
+        """创建并启动新会话"""
+        session = ShellSession(self.workdir, self.shell)
+        await session.start()
+        self._sessions.append(session)
+        self.sessions_started += 1
+        return session
+    
+    @asynccontextmanager
+    async def session(self):
+        """租用一个会话，用完归还；失效或用满次数的会话会被替换"""
+        await self.start()
+        session = await self._idle.get()
+        try:
+            yield session
+        finally:
+            worn_out = (
+                self.max_commands_per_session is not None
+                and session.commands_run >= self.max_commands_per_session
+            )
+            if not session.alive or worn_out:
+                self._sessions.remove(session)
+                await session.close()
+                session = await self._new_session()
+            self._idle.put_nowait(session)
+    
+    async def run(self, command: str, timeout: Optional[float] = None) -> Tuple[str, int]:
+        """在任一空闲会话中执行命令"""
+        async with self.session() as session:
+            return await session.run(command, timeout)
+    
+    async def close(self):
+        """关闭全部会话"""
+        await asyncio.gather(*(session.close() for session in self._sessions))
+        self._sessions.clear()
+        self._idle = None
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class LocalRuntime(MockRuntime):
+    """本地运行时：命令在会话池的常驻bash进程中真实执行，文件写入本地磁盘"""
+    
+    def __init__(
+        self,
+        pool: ShellSessionPool,
+        command_timeout: Optional[float] = 120,
+        on_output: Optional[Callable[[str], None]] = None,
+        spool: Optional[PayloadSpool] = None,
+        command_cache: Optional[CommandResultCache] = None
+    ):
+        super().__init__(command_cache=command_cache)
+        self.pool = pool
+        self.spool = spool or DEFAULT_PAYLOAD_SPOOL  # 大输出边接收边写入磁盘
+        self.command_timeout = command_timeout
+        self.on_output = on_output  # 增量输出回调，例如实时打印
+    
+    def _read_fingerprint(self, paths: frozenset) -> Any:
+        """读取路径的 (mtime, size, inode)，使运行时之外对这些路径的修改也能让缓存失效"""
+        fingerprint = []
+        for path in sorted(paths):
+            try:
+                st = os.stat(os.path.join(self.pool.workdir, path))
+                fingerprint.append((path, st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                fingerprint.append((path, None))
+        return tuple(fingerprint)
+    
+    async def _execute_command(self, action: CmdRunAction) -> Observation:
+        """在常驻会话中执行命令"""
+        writer = self.spool.writer()
+        try:
+            async with self.pool.session() as session:
+                async for chunk in session.stream(action.command, self.command_timeout):
+                    writer.write(chunk)
+                    if self.on_output is not None:
+                        self.on_output(chunk)
+                exit_code = session.last_exit_code
+            return CmdOutputObservation.from_payload(writer.finish(), action.command, exit_code)
+        except TimeoutError as e:
+            return ErrorObservation(content=str(e), error_type="timeout")
+        except ShellSyntaxError as e:
+            return ErrorObservation(content=str(e), error_type="syntax_error")
+        finally:
+            writer.abort()  # 超时、取消或其他异常时丢弃已写入的分段
+    
+    def _resolve_path(self, path: str) -> str:
+        """把动作中的路径解析为工作目录内的真实路径；绝对路径、".." 或符号链接指向工作目录之外时抛出 PermissionError"""
+        root = os.path.realpath(self.pool.workdir)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if resolved != root and not resolved.startswith(root + os.sep):
+            raise PermissionError(f"路径 {path} 不在工作目录 {self.pool.workdir} 内")
+        return resolved
+    
+    async def _edit_file(self, action: FileEditAction) -> Observation:
+        """写入本地文件（路径相对于会话池工作目录，不能超出工作目录）"""
+        try:
+            path = self._resolve_path(action.path)
+        except PermissionError as e:
+            return ErrorObservation(content=f"写入文件失败: {e}", error_type="file_error")
+        
+        def write():
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(action.content)
+        
+        try:
+            await asyncio.to_thread(write)
+        except OSError as e:
+            return ErrorObservation(content=f"写入文件失败: {e}", error_type="file_error")
+        
+        return FileReadObservation(
+            content=f"File {action.path} written successfully",
+            path=action.path
+        )
+    
+    async def _read_file(self, action: FileReadAction) -> Observation:
+        """读取本地文件（路径不能超出工作目录）"""
+        try:
+            path = self._resolve_path(action.path)
+        except PermissionError as e:
+            return ErrorObservation(content=f"读取文件失败: {e}", error_type="file_error")
+        
+        def read() -> str:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        
+        try:
+            content = await asyncio.to_thread(read)
+        except OSError as e:
+            return ErrorObservation(content=f"读取文件失败: {e}", error_type="file_error")
+        return FileReadObservation(content=content, path=action.path)
+
+# 预热的隔离运行时工作进程池：控制器与工作进程通过Unix套接字通信
+# 帧格式: <请求ID, 操作码, 负载长度> + 负载（执行请求和结果的负载是事件日志记录）
+_WORKER_FRAME = struct.Struct("<IBI")
+_OP_HELLO, _OP_EXECUTE, _OP_RESULT, _OP_RESET, _OP_ACK, _OP_SHUTDOWN = range(1, 7)
+DEFAULT_WORKER_PRELOAD = ("json", "shlex", "subprocess", "tempfile")
+
+async def _read_worker_frame(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    request_id, op, length = _WORKER_FRAME.unpack(await reader.readexactly(_WORKER_FRAME.size))
+    payload = await reader.readexactly(length) if length else b""
+    return request_id, op, payload
+
+def _write_worker_frame(writer: asyncio.StreamWriter, request_id: int, op: int, payload: bytes = b""):
+    writer.write(_WORKER_FRAME.pack(request_id, op, len(payload)) + payload)
+
+def _clear_directory(path: str):
+    """删除目录下的全部内容，保留目录本身"""
+    import shutil
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+async def _runtime_worker_main(socket_path: str, worker_id: int, workspace: str, preload: List[str]):
+    """工作进程入口：预先导入模块、创建工作区并启动bash会话，然后按顺序处理请求
+    
+    请求在套接字缓冲区中排队，控制器可以不等结果连续发送多个请求（流水线）。
+    """
+    import importlib
+    for name in preload:
+        importlib.import_module(name)
+    os.makedirs(workspace, exist_ok=True)
+    
+    async with ShellSessionPool(size=1, workdir=workspace) as shell_pool:
+        runtime = LocalRuntime(shell_pool)
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        _write_worker_frame(writer, worker_id, _OP_HELLO)
+        await writer.drain()
+        try:
+            while True:
+                try:
+                    request_id, op, payload = await _read_worker_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                if op == _OP_EXECUTE:
+                    action, _ = decode_event(payload, 0)
+                    try:
+                        observation = await runtime.execute_action(action)
+                    except Exception as e:
+                        observation = ErrorObservation(content=f"动作执行失败: {e}", error_type="action_error")
+                    _write_worker_frame(writer, request_id, _OP_RESULT, encode_event(observation))
+                elif op == _OP_RESET:
+                    await asyncio.to_thread(_clear_directory, workspace)
+                    _write_worker_frame(writer, request_id, _OP_ACK)
+                elif op == _OP_SHUTDOWN:
+                    _write_worker_frame(writer, request_id, _OP_ACK)
+                    await writer.drain()
+                    break
+                await writer.drain()
+        finally:
+            writer.close()
+
+class _RuntimeWorker:
+    """控制器一侧的工作进程句柄：按请求ID匹配流水线请求的响应"""
+    
+    def __init__(self, worker_id: int, workspace: str, process: asyncio.subprocess.Process):
+        self.worker_id = worker_id
+        self.workspace = workspace
+        self.process = process
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.tasks_served = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count(1)
+        self._reader_task: Optional[asyncio.Task] = None
+    
+    def attach(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._reader_task = asyncio.create_task(self._read_responses(reader))
+        if not self.ready.done():
+            self.ready.set_result(self)
+    
+    async def _read_responses(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                request_id, op, payload = await _read_worker_frame(reader)
+                future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((op, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            error = ConnectionError(f"运行时工作进程 {self.worker_id} 已断开")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+    
+    async def request(self, op: int, payload: bytes = b"") -> Tuple[int, bytes]:
+        if self.writer is None or self.writer.is_closing():
+            raise ConnectionError(f"运行时工作进程 {self.worker_id} 已断开")
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        _write_worker_frame(self.writer, request_id, op, payload)
+        await self.writer.drain()
+        return await future
+    
+    async def close(self, timeout: float = 5.0):
+        """通知进程退出，超时后强制结束"""
+        if self.writer is not None and not self.writer.is_closing():
+            try:
+                await asyncio.wait_for(self.request(_OP_SHUTDOWN), timeout)
+            except (ConnectionError, TimeoutError):
+                pass
+            self.writer.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+        if self._reader_task is not None:
+            await self._reader_task
+    
+    async def kill(self):
+        """强制结束无响应的进程（不等待它处理关闭请求）"""
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+        if self.writer is not None:
+            self.writer.close()
+        if self._reader_task is not None:
+            await self._reader_task
+
+class RemoteRuntime:
+    """租用的工作进程运行时，可直接交给 AgentController 使用"""
+    
+    def __init__(self, worker: _RuntimeWorker):
+        self.worker = worker
+    
+    @property
+    def workspace(self) -> str:
+        return self.worker.workspace
+    
+    async def execute_action(self, action: Action) -> Observation:
+        """在工作进程中执行动作"""
+        try:
+            _, payload = await self.worker.request(_OP_EXECUTE, encode_event(action))
+        except ConnectionError as e:
+            return ErrorObservation(content=str(e), error_type="runtime_error")
+        observation, _ = decode_event(payload, 0)
+        return observation
+    
+    async def execute_many(self, actions: List[Action]) -> List[Observation]:
+        """流水线执行：连续发送全部请求再统一等待结果，工作进程仍按顺序执行"""
+        return list(await asyncio.gather(*(self.execute_action(action) for action in actions)))
+
+class RuntimeWorkerPool:
+    """预先启动的隔离运行时工作进程池
+    
+    - 每个工作进程是独立的解释器，启动时预先导入模块、创建工作区并启动bash会话
+    - 租用时直接拿到已就绪的进程，归还时清空工作区
+    - 处理满 max_tasks_per_worker 个任务后退出，并在后台预热一个新进程替换
+    - 启动握手超过 spawn_timeout 或清空工作区超过 reset_timeout 的进程被强制结束并重新启动
+    - 替换进程启动失败时记录并按指数退避（respawn_backoff 起，最长 max_respawn_backoff 秒）重试，
+      池中没有存活或正在启动的进程时 lease 直接报错而不是一直等待
+    """
+    
+    def __init__(
+        self,
+        size: int = 4,
+        max_tasks_per_worker: Optional[int] = 50,
+        preload: Tuple[str, ...] = DEFAULT_WORKER_PRELOAD,
+        base_dir: Optional[str] = None,
+        spawn_timeout: float = 30.0,
+        reset_timeout: float = 30.0,
+        spawn_attempts: int = 3,
+        respawn_backoff: float = 1.0,
+        max_respawn_backoff: float = 30.0
+    ):
+        self.size = size
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.preload = preload
+        self.base_dir = base_dir
+        self.spawn_timeout = spawn_timeout
+        self.reset_timeout = reset_timeout
+        self.spawn_attempts = spawn_attempts
+        self.respawn_backoff = respawn_backoff
+        self.max_respawn_backoff = max_respawn_backoff
+        self._root: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: Dict[int, _RuntimeWorker] = {}
+        self._worker_ids = itertools.count(1)
+        self._background: set = set()
+        self._respawning = 0  # 正在启动的替换进程数
+        self._closing: Optional[asyncio.Event] = None
+        self.workers_started = 0
+        self.workers_recycled = 0
+        self.workers_killed = 0
+        self.spawn_failures = 0
+        self.leases = 0
+    
+    @property
+    def socket_path(self) -> str:
+        return os.path.join(self._root, "runtime.sock")
+    
+    async def start(self):
+        """启动套接字服务并预热全部工作进程"""
+        if self._idle is not None:
+            return
+        self._closing = asyncio.Event()
+        self._root = tempfile.mkdtemp(prefix="oh_runtime_", dir=self.base_dir)
+        self._server = await asyncio.start_unix_server(self._on_connect, path=self.socket_path)
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+    
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            worker_id, op, _ = await _read_worker_frame(reader)
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+        worker = self._workers.get(worker_id)
+        if op != _OP_HELLO or worker is None:
+            writer.close()
+            return
+        worker.attach(reader, writer)
+    
+    async def _spawn(self) -> _RuntimeWorker:
+        """启动一个工作进程并等待它连接就绪；握手超时的进程被结束后重试"""
+        for attempt in range(1, self.spawn_attempts + 1):
+            try:
+                return await self._spawn_once()
+            except TimeoutError:
+                if attempt == self.spawn_attempts:
+                    raise RuntimeError(
+                        f"运行时工作进程连续 {attempt} 次在 {self.spawn_timeout} 秒内未完成启动"
+                    ) from None
+    
+    async def _spawn_once(self) -> _RuntimeWorker:
+        worker_id = next(self._worker_ids)
+        workspace = os.path.join(self._root, f"workspace-{worker_id}")
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "runtime-worker",
+            self.socket_path, str(worker_id), workspace, *self.preload,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL
+        )
+        worker = _RuntimeWorker(worker_id, workspace, process)
+        self._workers[worker_id] = worker
+        self.workers_started += 1
+        
+        exited = asyncio.ensure_future(process.wait())
+        try:
+            await asyncio.wait(
+                [worker.ready, exited], timeout=self.spawn_timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        except BaseException:
+            del self._workers[worker_id]
+            await worker.kill()
+            raise
+        finally:
+            exited.cancel()
+        if not worker.ready.done():
+            del self._workers[worker_id]
+            if process.returncode is not None:
+                raise RuntimeError(f"运行时工作进程启动失败（退出码 {process.returncode}）")
+            self.workers_killed += 1
+            await worker.kill()
+            raise TimeoutError(f"运行时工作进程 {worker_id} 启动握手超时")
+        return worker
+    
+    @asynccontextmanager
+    async def lease(self):
+        """租用一个已预热的工作进程，返回 RemoteRuntime"""
+        await self.start()
+        if self._idle.empty() and not self._workers and not self._respawning:
+            raise RuntimeError("运行时工作进程池中没有存活或正在启动的工作进程")
+        worker = await self._idle.get()
+        self.leases += 1
+        try:
+            yield RemoteRuntime(worker)
+        finally:
+            worker.tasks_served += 1
+            task = asyncio.create_task(self._release(worker))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+    
+    async def _release(self, worker: _RuntimeWorker):
+        """归还工作进程：清空工作区；失效或用满次数的进程被替换"""
+        worn_out = (
+            self.max_tasks_per_worker is not None
+            and worker.tasks_served >= self.max_tasks_per_worker
+        )
+        hung = False
+        if not worn_out:
+            try:
+                await asyncio.wait_for(worker.request(_OP_RESET), self.reset_timeout)
+                self._idle.put_nowait(worker)
+                return
+            except ConnectionError:
+                pass
+            except TimeoutError:
+                hung = True
+        
+        del self._workers[worker.worker_id]
+        self.workers_recycled += 1
+        if hung:
+            self.workers_killed += 1
+            await worker.kill()
+        else:
+            await worker.close()
+        await self._replace()
+    
+    async def _replace(self):
+        """启动替换进程；失败时记录并按指数退避重试，直到成功或池被关闭"""
+        delay = self.respawn_backoff
+        self._respawning += 1
+        try:
+            while not self._closing.is_set():
+                try:
+                    worker = await self._spawn()
+                except Exception as e:
+                    self.spawn_failures += 1
+                    print(f"❌ 替换运行时工作进程失败（累计 {self.spawn_failures} 次）: {e}，"
+                          f"{delay:.1f} 秒后重试", file=sys.stderr)
+                    try:
+                        await asyncio.wait_for(self._closing.wait(), delay)
+                    except TimeoutError:
+                        pass
+                    delay = min(delay * 2, self.max_respawn_backoff)
+                    continue
+                self._idle.put_nowait(worker)
+                return
+        finally:
+            self._respawning -= 1
+    
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "leases": self.leases,
+            "workers_started": self.workers_started,
+            "workers_recycled": self.workers_recycled,
+            "workers_killed": self.workers_killed,
+            "spawn_failures": self.spawn_failures,
+        }
+    
+    async def close(self):
+        """关闭全部工作进程和套接字服务"""
+        import shutil
+        if self._closing is not None:
+            self._closing.set()  # 唤醒正在退避等待的替换任务，不再重试
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await asyncio.gather(*(worker.close() for worker in self._workers.values()))
+        self._workers.clear()
+        self._idle = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._root is not None:
+            shutil.rmtree(self._root, ignore_errors=True)
+            self._root = None
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class CheckpointMarker(Event):
+    """检查点标记：记录截至此处已完成的迭代数和历史长度"""
+    __slots__ = ("completed_iterations", "max_iterations", "history_length")
+
+    def __init__(self, completed_iterations: int, max_iterations: int, history_length: int):
+        super().__init__("controller")
+        self.completed_iterations = completed_iterations
+        self.max_iterations = max_iterations
+        self.history_length = history_length
+    
+    def __str__(self):
+        return f"CheckpointMarker(completed_iterations={self.completed_iterations})"
+
+register_event_type(
+    201, CheckpointMarker,
+    (("source", "str"), ("completed_iterations", "int"), ("max_iterations", "int"), ("history_length", "int"))
+)
+
+class CheckpointStore:
+    """增量检查点存储
+    
+    每个任务对应两个事件日志文件：
+    - {task_id}.delta: 每次迭代只追加新增事件和一个检查点标记
+    - {task_id}.snap:  定期压缩生成的完整快照，生成后清空增量文件
+    
+    标记中记录了累计事件数，因此即使压缩在替换快照后、清空增量前中断，
+    恢复时也能跳过已包含在快照中的事件。历史被压缩器缩减时，快照保存的是缩减后的历史。
+    """
+    
+    def __init__(self, directory: str, compact_every: int = 1000, fsync: bool = False):
+        self.directory = directory
+        self.compact_every = compact_every  # 每隔多少次迭代压缩一次
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._writers: Dict[str, EventLogWriter] = {}
+        self._recorded: Dict[str, int] = {}  # 任务ID -> 已写入检查点的累计事件数
+        self._since_compaction: Dict[str, int] = {}
+    
+    def _path(self, task_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{task_id}.{suffix}")
+    
+    def _writer(self, task_id: str) -> EventLogWriter:
+        writer = self._writers.get(task_id)
+        if writer is None:
+            writer = EventLogWriter(self._path(task_id, "delta"), fsync=self.fsync)
+            self._writers[task_id] = writer
+        return writer
+    
+    def record(self, task_id: str, state: State, completed_iterations: int):
+        """追加自上次检查点以来的新事件和迭代计数"""
+        # 新事件总在历史末尾；压缩器只会缩减已写入检查点的旧事件
+        new_count = state.total_events - self._recorded.get(task_id, 0)
+        new_events = state.history[len(state.history) - new_count:] if new_count > 0 else []
+        marker = CheckpointMarker(completed_iterations, state.max_iterations, state.total_events)
+        writer = self._writer(task_id)
+        writer.extend(new_events + [marker])
+        writer.flush()
+        self._recorded[task_id] = state.total_events
+        
+        self._since_compaction[task_id] = self._since_compaction.get(task_id, 0) + 1
+        if self._since_compaction[task_id] >= self.compact_every:
+            self.compact(task_id, state, completed_iterations)
+    
+    def compact(self, task_id: str, state: State, completed_iterations: int):
+        """把完整历史写成快照并清空增量文件"""
+        snap_path = self._path(task_id, "snap")
+        tmp_path = snap_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with EventLogWriter(tmp_path, fsync=self.fsync) as writer:
+            writer.extend(state.history + [
+                CheckpointMarker(completed_iterations, state.max_iterations, state.total_events)
+            ])
+        os.replace(tmp_path, snap_path)
+        
+        self.close(task_id)
+        os.remove(self._path(task_id, "delta"))
+        self._recorded[task_id] = state.total_events
+        self._since_compaction[task_id] = 0
+    
+    def load(self, task_id: str) -> Optional[State]:
+        """由快照和增量文件重建状态，没有检查点时返回None"""
+        history: List[Event] = []
+        total = 0  # 已恢复的累计事件数
+        marker: Optional[CheckpointMarker] = None
+        
+        for suffix in ("snap", "delta"):
+            path = self._path(task_id, suffix)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            with EventLogReader(path) as reader:
+                pending: List[Event] = []
+                size = os.path.getsize(path)
+                complete = _FILE_HEADER.size  # 最后一个标记的结束偏移
+                for offset, end, _, _ in _record_spans(reader._mmap, reader._size):
+                    event = reader.read_at(offset)
+                    if event is None:
+                        continue
+                    if not isinstance(event, CheckpointMarker):
+                        pending.append(event)
+                        continue
+                    # 这一批事件在完整历史中的起始位置
+                    batch_start = event.history_length - len(pending)
+                    history.extend(pending[max(0, total - batch_start):])
+                    total = max(total, event.history_length)
+                    pending = []
+                    marker = event
+                    complete = end
+            # 最后一个标记之后的事件属于未完成的迭代，丢弃并从增量文件中截掉，
+            # 恢复后的运行从最后一个检查点之后继续追加
+            if suffix == "delta" and complete < size:
+                self.close(task_id)
+                os.truncate(path, complete)
+        
+        if marker is None:
+            return None
+        
+        completed = marker.completed_iterations
+        state = State(
+            history=history,
+            iteration=max(completed - 1, 0),
+            max_iterations=marker.max_iterations,
+            task_id=task_id,
+            total_events=total
+        )
+        self._recorded[task_id] = total
+        return state
+    
+    def close(self, task_id: Optional[str] = None):
+        """关闭增量文件（默认关闭全部）"""
+        task_ids = [task_id] if task_id is not None else list(self._writers)
+        for tid in task_ids:
+            writer = self._writers.pop(tid, None)
+            if writer is not None:
+                writer.close()
+    
+    def delete(self, task_id: str):
+        """删除任务的全部检查点"""
+        self.close(task_id)
+        for suffix in ("snap", "delta"):
+            path = self._path(task_id, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        self._recorded.pop(task_id, None)
+        self._since_compaction.pop(task_id, None)
+
+class CondensationSummary(Event):
+    """压缩摘要：代替被折叠的旧事件"""
+    __slots__ = ("folded_count", "counts", "recent_commands", "archive_path")
+
+    def __init__(
+        self,
+        folded_count: int = 0,
+        counts: Optional[Dict[str, int]] = None,
+        recent_commands: Optional[List[str]] = None,
+        archive_path: str = ""
+    ):
+        super().__init__("controller")
+        self.folded_count = folded_count
+        self.counts = counts or {}
+        self.recent_commands = recent_commands or []
+        self.archive_path = archive_path  # 被折叠事件的归档文件，为空表示未归档
+    
+    def describe(self) -> str:
+        """摘要的文字描述（用于构建提示）"""
+        counts = "，".join(f"{name} {count}" for name, count in self.counts.items())
+        text = f"已折叠 {self.folded_count} 个较早的事件（{counts}）"
+        if self.recent_commands:
+            text += f"；最近执行的命令：{', '.join(self.recent_commands)}"
+        return text
+    
+    def __str__(self):
+        return f"CondensationSummary(folded_count={self.folded_count})"
+
+register_event_type(
+    202, CondensationSummary,
+    (("source", "str"), ("folded_count", "int"), ("counts", "json"),
+     ("recent_commands", "json"), ("archive_path", "str"))
+)
+
+class Condenser(ABC):
+    """事件压缩器：控制器在每次迭代后调用，原地缩减 state.history"""
+    
+    @abstractmethod
+    def condense(self, state: State):
+        pass
+    
+    def close(self):
+        """释放资源（例如归档文件）"""
+
+class DropRedundantObservations(Condenser):
+    """删除窗口之外的冗余观察：消息回显，以及与前一条完全相同的命令输出
+    
+    每个状态记住已处理的前缀，之后每次只检查新移出窗口的事件；
+    前缀被其他压缩器改动（例如被摘要折叠）时从头重新检查。
+    """
+    
+    def __init__(self, window: int = 10):
+        self.window = window  # 最近的若干事件保持原样（默认与构建提示时取的事件数一致）
+        # id(state) -> (状态的弱引用, 已处理前缀长度, 前缀最后一个事件, 最后一条输出的签名)
+        self._progress: Dict[int, Tuple[weakref.ref, int, Event, Optional[tuple]]] = {}
+    
+    def condense(self, state: State):
+        history = state.history
+        end = len(history) - self.window
+        if end <= 1:
+            return
+        
+        key = id(state)
+        start, last_output = 1, None
+        progress = self._progress.get(key)
+        if progress is not None and progress[0]() is state:
+            ref, done, anchor, signature = progress
+            if done <= end and history[done - 1] is anchor:
+                start, last_output = done, signature
+        else:
+            ref = weakref.ref(state, lambda _: self._progress.pop(key, None))
+        
+        kept = []
+        for event in history[start:end]:
+            if isinstance(event, CmdOutputObservation):
+                if event.command == "message":
+                    continue
+                signature = (event.command, event.exit_code, event.payload.byte_count, event.preview(200))
+                if signature == last_output:
+                    continue
+                last_output = signature
+            kept.append(event)
+        
+        if len(kept) < end - start:
+            history[start:end] = kept
+        done = start + len(kept)
+        self._progress[key] = (ref, done, history[done - 1], last_output)
+    
+    def close(self):
+        self._progress.clear()
+
+class SummarizingCondenser(Condenser):
+    """把最近窗口之外的事件折叠为摘要事件，被折叠的事件可归档到磁盘
+    
+    历史长度超过 window + slack 时才折叠一次，使每次折叠的开销均摊到多次迭代上，
+    内存中的事件数始终为 O(window)。归档文件只在写入时打开，不随任务数占用文件句柄。
+    """
+    
+    def __init__(self, window: int = 50, slack: Optional[int] = None, archive_dir: Optional[str] = None):
+        self.window = window
+        self.slack = slack if slack is not None else window
+        self.archive_dir = archive_dir
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+    
+    def _archive_path(self, state: State) -> str:
+        """任务的归档文件路径，未配置归档目录时为空"""
+        if not self.archive_dir:
+            return ""
+        key = state.task_id or f"state-{id(state):x}"
+        return os.path.join(self.archive_dir, f"{key}.archive")
+    
+    def condense(self, state: State):
+        history = state.history
+        if len(history) <= 1 + self.window + self.slack:
+            return
+        
+        # 首条事件是任务本身，第二条可能是上一次折叠留下的摘要
+        start = 1
+        previous = history[1] if isinstance(history[1], CondensationSummary) else None
+        if previous is not None:
+            start = 2
+        folded = history[start:len(history) - self.window]
+        
+        counts = dict(previous.counts) if previous else {}
+        commands = list(previous.recent_commands) if previous else []
+        for event in folded:
+            name = type(event).__name__
+            counts[name] = counts.get(name, 0) + 1
+            if isinstance(event, CmdRunAction):
+                commands.append(event.command)
+        
+        archive_path = self._archive_path(state)
+        if archive_path:
+            with EventLogWriter(archive_path) as archive:
+                archive.extend(folded)
+        
+        summary = CondensationSummary(
+            folded_count=(previous.folded_count if previous else 0) + len(folded),
+            counts=counts,
+            recent_commands=commands[-5:],
+            archive_path=archive_path
+        )
+        history[1:len(history) - self.window] = [summary]
+
+class CondenserPipeline(Condenser):
+    """依次运行多个压缩器"""
+    
+    def __init__(self, condensers: List[Condenser]):
+        self.condensers = condensers
+    
+    def condense(self, state: State):
+        for condenser in self.condensers:
+            condenser.condense(state)
+    
+    def close(self):
+        for condenser in self.condensers:
+            condenser.close()
+
+# ---------------------------------------------------------------------------
+# 异步事件总线
+#
+# 控制器把运行过程发布到总线上，由订阅者（控制台、日志文件、指标）在各自的
+# 后台任务中批量处理，避免在控制循环中直接进行阻塞的输出。
+# ---------------------------------------------------------------------------
+
+@dataclass
+class BusEvent:
+    """总线事件"""
+    kind: str  # task_start, iteration, action, observation, finish, task_end, resume
+    message: str
+    task_id: Optional[str] = None
+    iteration: Optional[int] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+class Subscriber(ABC):
+    """总线订阅者"""
+    
+    @abstractmethod
+    async def handle_batch(self, events: List[BusEvent]):
+        pass
+    
+    async def close(self):
+        """总线关闭时调用"""
+
+class ConsoleSubscriber(Subscriber):
+    """控制台输出：批量拼接后在线程中写入，不阻塞事件循环"""
+    
+    def __init__(self, stream=None, show_task: bool = False):
+        self.stream = stream
+        self.show_task = show_task  # 多任务并发时在每行前加上任务ID
+    
+    async def handle_batch(self, events: List[BusEvent]):
+        if self.show_task:
+            lines = [f"[{e.task_id}] {e.message.lstrip()}" if e.task_id else e.message for e in events]
+        else:
+            lines = [e.message for e in events]
+        await asyncio.to_thread(self._write, "\n".join(lines) + "\n")
+    
+    def _write(self, text: str):
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+
+class FileLogSubscriber(Subscriber):
+    """JSONL日志文件"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+    
+    async def handle_batch(self, events: List[BusEvent]):
+        text = "".join(json.dumps(asdict(e), ensure_ascii=False, default=str) + "\n" for e in events)
+        await asyncio.to_thread(self._write, text)
+    
+    def _write(self, text: str):
+        self._file.write(text)
+        self._file.flush()
+    
+    async def close(self):
+        self._file.close()
+
+class MetricsSubscriber(Subscriber):
+    """按事件类型和动作类型计数"""
+    
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.action_types: Dict[str, int] = {}
+    
+    async def handle_batch(self, events: List[BusEvent]):
+        for event in events:
+            self.counts[event.kind] = self.counts.get(event.kind, 0) + 1
+            action_type = event.data.get("action_type")
+            if action_type:
+                self.action_types[action_type] = self.action_types.get(action_type, 0) + 1
+
+class _Subscription:
+    """订阅者的有界队列和消费任务"""
+    
+    def __init__(self, subscriber: Subscriber, maxsize: int, policy: str, kinds: Optional[set]):
+        self.subscriber = subscriber
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.kinds = kinds
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+    
+    async def consume(self):
+        """取出队列中已有的全部事件，批量交给订阅者"""
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.subscriber.handle_batch(batch)
+            except Exception as e:
+                print(f"❌ 订阅者 {type(self.subscriber).__name__} 处理失败: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+class EventBus:
+    """非阻塞事件总线
+    
+    每个订阅者有独立的有界队列，队列满时的背压策略：
+    - drop_oldest: 丢弃最旧的事件（默认，适合控制台等只关心最新进度的订阅者）
+    - drop_newest: 丢弃新事件
+    - block:       发布方等待队列有空位（适合不能丢数据的日志订阅者）
+    """
+    
+    POLICIES = ("drop_oldest", "drop_newest", "block")
+    
+    def __init__(self):
+        self._subscriptions: List[_Subscription] = []
+    
+    def subscribe(
+        self,
+        subscriber: Subscriber,
+        maxsize: int = 1000,
+        policy: str = "drop_oldest",
+        kinds: Optional[List[str]] = None
+    ) -> Subscriber:
+        """添加订阅者，可只订阅部分事件类型"""
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的背压策略: {policy}，可选 {self.POLICIES}")
+        self._subscriptions.append(_Subscription(subscriber, maxsize, policy, set(kinds) if kinds else None))
+        return subscriber
+    
+    async def publish(self, event: BusEvent):
+        """发布事件；只有 block 策略的订阅者队列已满时才会等待"""
+        for subscription in self._subscriptions:
+            if subscription.kinds is not None and event.kind not in subscription.kinds:
+                continue
+            if subscription.task is None:
+                subscription.task = asyncio.create_task(subscription.consume())
+            
+            queue = subscription.queue
+            if not queue.full():
+                queue.put_nowait(event)
+            elif subscription.policy == "block":
+                await queue.put(event)
+            elif subscription.policy == "drop_oldest":
+                queue.get_nowait()
+                queue.task_done()
+                queue.put_nowait(event)
+                subscription.dropped += 1
+            else:
+                subscription.dropped += 1
+    
+    def dropped(self) -> Dict[str, int]:
+        """各订阅者丢弃的事件数"""
+        return {type(s.subscriber).__name__: s.dropped for s in self._subscriptions}
+    
+    async def close(self):
+        """等待队列清空后停止消费任务并关闭订阅者"""
+        for subscription in self._subscriptions:
+            if subscription.task is not None:
+                await subscription.queue.join()
+                subscription.task.cancel()
+                try:
+                    await subscription.task
+                except asyncio.CancelledError:
+                    pass
+                subscription.task = None
+            await subscription.subscriber.close()
+
+class LoopLagMonitor:
+    """事件循环延迟监测：定时唤醒，记录实际唤醒时间比预期晚了多少"""
+    
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+    
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - expected))
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> Dict[str, float]:
+        """停止监测，返回平均、p99和最大延迟（毫秒）"""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        samples = sorted(self.samples) or [0.0]
+        return {
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            "max_ms": samples[-1] * 1000
+        }
+
+# AgentScheduler 在任务的上下文中设置 (LLM限流器, 运行时限流器)，不修改共享的控制器
+_scheduler_limiters: ContextVar[Optional[Tuple[Any, asyncio.Semaphore]]] = ContextVar(
+    "scheduler_limiters", default=None
+)
+
 class AgentController:
     """代理控制器"""
     
-    def __init__(self, agent: CustomAgent, runtime: MockRuntime):
+    def __init__(
+        self,
+        agent: CustomAgent,
+        runtime: MockRuntime,
+        step_delay: float = 0.5,
+        verbose: bool = True,
+        checkpoints: Optional[CheckpointStore] = None,
+        tracer: Optional[Tracer] = None,
+        condenser: Optional[Condenser] = None,
+        bus: Optional[EventBus] = None
+    ):
         self.agent = agent
         self.runtime = runtime
+        self.step_delay = step_delay  # 每次迭代后的间隔，0表示不暂停
+        self.verbose = verbose
+        self.checkpoints = checkpoints  # 为带task_id的状态写增量检查点
+        self.tracer = tracer  # 设置后记录每个任务、迭代和调用的耗时
+        self.condenser = condenser  # 每次迭代后缩减历史，使内存保持在窗口大小
+        self.bus = bus  # 设置后运行日志发布到事件总线，不再直接打印
+        # 可选：限制LLM和运行时的并发调用数（LLM限流器也可以是共享调度器的 SchedulerSlot）；
+        # AgentScheduler 运行的任务使用调度器自己的限流器，因此同一个控制器可以被多个调度器共享
+        self.llm_limiter: Optional[Any] = None
+        self.runtime_limiter: Optional[asyncio.Semaphore] = None
+    
+    def _limiters(self) -> Tuple[Optional[Any], Optional[asyncio.Semaphore]]:
+        """当前任务的 (LLM限流器, 运行时限流器)：调度器运行的任务优先使用调度器的限流器"""
+        scoped = _scheduler_limiters.get()
+        return scoped if scoped is not None else (self.llm_limiter, self.runtime_limiter)
+    
+    def close(self):
+        """关闭仍打开的检查点文件"""
+        if self.checkpoints is not None:
+            self.checkpoints.close()
     
-    async def run_agent(self, initial_message: str, max_iterations: int = 10) -> State:
+    async def _emit(self, kind: str, message: str, state: Optional[State] = None, **data):
+        """输出运行日志：有事件总线时发布到总线，否则在verbose模式下直接打印"""
+        if self.bus is not None:
+            await self.bus.publish(BusEvent(
+                kind=kind,
+                message=message,
+                task_id=state.task_id if state is not None else None,
+                iteration=state.iteration if state is not None else None,
+                data=data
+            ))
+        elif self.verbose:
+            print(message)
+    
+    def create_state(
+        self,
+        initial_message: str,
+        max_iterations: int = 10,
+        task_id: Optional[str] = None
+    ) -> State:
+        """创建包含初始消息的状态
+        
+        新运行会覆盖同一任务ID已有的检查点（需要接着运行时使用 resume）。
+        """
+        if self.checkpoints is not None and task_id is not None:
+            self.checkpoints.delete(task_id)
+        state = State(history=[], max_iterations=max_iterations, task_id=task_id)
+        state.add_event(MessageAction(content=f"User: {initial_message}"))
+        self._checkpoint(state, 0)
+        return state
+    
+    async def run_agent(
+        self,
+        initial_message: str,
+        max_iterations: int = 10,
+        task_id: Optional[str] = None
+    ) -> State:
         """运行代理"""
-        state = State(history=[], max_iterations=max_iterations)
+        state = self.create_state(initial_message, max_iterations, task_id)
         
-        # 添加初始消息
-        initial_action = MessageAction(content=f"User: {initial_message}")
-        state.add_event(initial_action)
+        await self._emit(
+            "task_start",
+            f"🚀 开始运行代理: {self.agent.name}\n📝 初始任务: {initial_message}\n{'=' * 60}",
+            state
+        )
         
-        print(f"🚀 开始运行代理: {self.agent.name}")
-        print(f"📝 初始任务: {initial_message}")
-        print("=" * 60)
+        try:
+            await self.run_loop(state)
+        finally:
+            if self.checkpoints is not None and task_id is not None:
+                self.checkpoints.close(task_id)
         
-        for iteration in range(max_iterations):
+        await self._emit(
+            "task_end", f"\n📊 运行完成，共执行 {state.iteration + 1} 次迭代", state,
+            iterations=state.iteration + 1
+        )
+        return state
+    
+    async def resume(self, task_id: str) -> State:
+        """从检查点恢复状态并继续运行"""
+        if self.checkpoints is None:
+            raise RuntimeError("控制器未配置检查点存储")
+        state = self.checkpoints.load(task_id)
+        if state is None:
+            raise KeyError(f"没有任务 {task_id} 的检查点")
+        
+        # 初始消息之后每次迭代至少追加一个事件
+        completed = state.iteration + 1 if len(state.history) > 1 else 0
+        if isinstance(state.get_last_action(), AgentFinishAction):
+            await self._emit("resume", f"✅ 任务 {task_id} 已经完成，无需恢复", state)
+            return state
+        
+        await self._emit(
+            "resume", f"♻️ 从第 {completed + 1} 次迭代恢复任务 {task_id}（{len(state.history)} 个事件）", state
+        )
+        try:
+            await self.run_loop(state, start_iteration=completed)
+        finally:
+            self.checkpoints.close(task_id)
+        return state
+    
+    def _checkpoint(self, state: State, completed_iterations: int):
+        """为状态写检查点（未配置时跳过）"""
+        if self.checkpoints is not None and state.task_id is not None:
+            self.checkpoints.record(state.task_id, state, completed_iterations)
+    
+    async def run_loop(self, state: State, start_iteration: int = 0) -> State:
+        """从指定迭代开始运行控制循环，直到完成或达到最大迭代次数"""
+        if self.tracer is None:
+            return await self._run_iterations(state, start_iteration)
+        with self.tracer.activate(), self.tracer.task(state.task_id or f"task-{id(state):x}"):
+            return await self._run_iterations(state, start_iteration)
+    
+    async def _run_iterations(self, state: State, start_iteration: int) -> State:
+        """控制循环主体"""
+        for iteration in range(start_iteration, state.max_iterations):
             state.iteration = iteration
             
-            print(f"\n🔄 迭代 {iteration + 1}/{max_iterations}")
-            
-            # 代理决策
-            action = await self.agent.step(state)
-            print(f"🤖 代理动作: {action}")
-            
-            state.add_event(action)
-            
-            # 检查是否完成
-            if isinstance(action, AgentFinishAction):
-                print(f"✅ 任务完成: {action.outputs}")
-                break
+            await self._emit("iteration", f"\n🔄 迭代 {iteration + 1}/{state.max_iterations}", state)
             
-            # 执行动作
-            observation = await self.runtime.execute_action(action)
-            print(f"👁️ 环境观察: {observation}")
-            
-            state.add_event(observation)
+            with self._trace_iteration(iteration):
+                # 代理决策
+                action = await self._agent_step(state)
+                await self._emit("action", f"🤖 代理动作: {action}", state, action_type=type(action).__name__)
+                
+                state.add_event(action)
+                
+                # 检查是否完成
+                if isinstance(action, AgentFinishAction):
+                    await self._emit("finish", f"✅ 任务完成: {action.outputs}", state)
+                    self._checkpoint(state, iteration + 1)
+                    break
+                
+                # 执行动作
+                observation = await self._execute(action)
+                await self._emit(
+                    "observation", f"👁️ 环境观察: {observation}", state,
+                    observation_type=type(observation).__name__
+                )
+                
+                state.add_event(observation)
+                self._checkpoint(state, iteration + 1)
+                
+                if self.condenser is not None:
+                    self.condenser.condense(state)
             
-            # 添加延迟
-            await asyncio.sleep(0.5)
+            # 添加延迟；即使不暂停也让出一次控制权，使并发任务轮流推进
+            await asyncio.sleep(self.step_delay)
         
-        print(f"\n📊 运行完成，共执行 {state.iteration + 1} 次迭代")
         return state
+    
+    @contextmanager
+    def _trace_iteration(self, iteration: int):
+        """记录一次迭代的时间段，并按配置对其做cProfile分析"""
+        if self.tracer is None:
+            yield
+            return
+        with self.tracer.span("iteration", "controller", iteration=iteration), self.tracer.profile(iteration):
+            yield
+    
+    async def _agent_step(self, state: State) -> Action:
+        """调用代理决策（受LLM并发上限约束）"""
+        llm_limiter, _ = self._limiters()
+        if llm_limiter is None:
+            return await self.agent.step(state)
+        async with llm_limiter:
+            return await self.agent.step(state)
+    
+    async def _execute(self, action: Action) -> Observation:
+        """执行动作（受运行时并发上限约束）"""
+        with trace_span("runtime_execute", "runtime", action=type(action).__name__):
+            _, runtime_limiter = self._limiters()
+            if runtime_limiter is None:
+                return await self.runtime.execute_action(action)
+            async with runtime_limiter:
+                return await self.runtime.execute_action(action)
+
+@dataclass
+class ScheduledTask:
+    """调度器中的一个代理任务"""
+    task_id: str
+    message: str
+    max_iterations: int
+    deadline: Optional[float] = None  # 相对提交时间的秒数
+    status: str = "pending"  # pending, running, completed, cancelled, timeout, failed
+    state: Optional[State] = None
+    error: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    
+    @property
+    def iterations(self) -> int:
+        """已执行的迭代次数"""
+        if self.state is None or self.status == "pending":
+            return 0
+        return self.state.iteration + 1
+
+class AgentScheduler:
+    """多任务调度器：在一个事件循环中并发运行多个代理控制循环
+    
+    - LLM和运行时调用分别由信号量限制并发数
+    - asyncio的信号量和就绪队列都是先进先出的，每次迭代结束都会让出控制权，
+      因此各任务按迭代轮流推进，不会有任务独占资源
+    - 每个任务可以单独取消或设置截止时间
+    - 传入 llm_scheduler 时，LLM调用改为在进程级共享的调度器中按 llm_priority 和 tenant 排队，
+      与其他代理和批量评估竞争同一个并发上限（此时忽略 max_concurrent_llm）
+    - 限流器属于调度器本身，只作用于它运行的任务，共享的控制器不会被修改
+    - tasks 中保留运行中的任务和最近结束的 history_size 个任务（None 表示全部保留），
+      更早结束的任务只计入 get_stats 的累计统计
+    """
+    
+    def __init__(
+        self,
+        controller: AgentController,
+        max_concurrent_llm: int = 16,
+        max_concurrent_runtime: int = 16,
+        max_concurrent_tasks: Optional[int] = None,
+        llm_scheduler: Optional[LLMRequestScheduler] = None,
+        llm_priority: Priority = Priority.INTERACTIVE,
+        tenant: str = "default",
+        history_size: Optional[int] = 1000
+    ):
+        self.controller = controller
+        if llm_scheduler is None:
+            self.llm_limiter = asyncio.Semaphore(max_concurrent_llm)
+        else:
+            self.llm_limiter = llm_scheduler.limiter(llm_priority, tenant)
+        self.runtime_limiter = asyncio.Semaphore(max_concurrent_runtime)
+        self._task_slots = asyncio.Semaphore(max_concurrent_tasks) if max_concurrent_tasks else None
+        self.history_size = history_size
+        self.tasks: Dict[str, ScheduledTask] = {}
+        self._handles: Dict[str, asyncio.Task] = {}  # 只保存未结束任务的句柄
+        self._finished: deque = deque()  # 仍保留在 tasks 中的已结束任务ID，按结束顺序
+        self._next_id = 0
+        # 已结束任务的累计统计（任务被清出 tasks 后仍然计入）
+        self._finished_count = 0
+        self._finished_statuses: Dict[str, int] = {}
+        self._finished_iterations = 0
+        self._first_started: Optional[float] = None
+        self._last_finished: Optional[float] = None
+    
+    def submit(
+        self,
+        message: str,
+        max_iterations: int = 10,
+        deadline: Optional[float] = None,
+        task_id: Optional[str] = None,
+        on_done: Optional[Callable[[ScheduledTask], None]] = None
+    ) -> str:
+        """提交任务，返回任务ID（on_done在任务结束后以ScheduledTask为参数调用）"""
+        if task_id is None:
+            self._next_id += 1
+            task_id = f"task-{self._next_id}"
+        if task_id in self.tasks:
+            raise ValueError(f"任务ID {task_id} 已存在")
+        
+        task = ScheduledTask(
+            task_id=task_id,
+            message=message,
+            max_iterations=max_iterations,
+            deadline=deadline
+        )
+        self.tasks[task_id] = task
+        self._handles[task_id] = asyncio.create_task(self._run_task(task, on_done))
+        return task_id
+    
+    async def _run_task(self, task: ScheduledTask, on_done: Optional[Callable[[ScheduledTask], None]] = None):
+        """运行单个任务并记录结果"""
+        try:
+            async with asyncio.timeout(task.deadline):
+                if self._task_slots is None:
+                    await self._run_controller(task)
+                else:
+                    async with self._task_slots:
+                        await self._run_controller(task)
+            task.status = "completed"
+        except TimeoutError:
+            task.status = "timeout"
+        except asyncio.CancelledError:
+            task.status = "cancelled"
+        except Exception as e:
+            task.status = "failed"
+            task.error = str(e)
+        finally:
+            task.finished_at = time.monotonic()
+            self._record_finished(task)
+            try:
+                if on_done is not None:
+                    on_done(task)
+            finally:
+                self._prune()
+    
+    def _record_finished(self, task: ScheduledTask):
+        """把结束的任务计入累计统计并释放它的句柄"""
+        self._handles.pop(task.task_id, None)
+        self._finished.append(task.task_id)
+        self._finished_count += 1
+        self._finished_statuses[task.status] = self._finished_statuses.get(task.status, 0) + 1
+        self._finished_iterations += task.iterations
+        if task.started_at is not None and (self._first_started is None or task.started_at < self._first_started):
+            self._first_started = task.started_at
+        self._last_finished = task.finished_at
+    
+    def _prune(self):
+        """只保留最近结束的 history_size 个任务"""
+        if self.history_size is None:
+            return
+        while len(self._finished) > self.history_size:
+            self.tasks.pop(self._finished.popleft(), None)
+    
+    async def _run_controller(self, task: ScheduledTask):
+        """执行控制循环"""
+        task.state = self.controller.create_state(task.message, task.max_iterations, task.task_id)
+        task.status = "running"
+        task.started_at = time.monotonic()
+        token = _scheduler_limiters.set((self.llm_limiter, self.runtime_limiter))
+        try:
+            await self.controller.run_loop(task.state)
+        finally:
+            _scheduler_limiters.reset(token)
+            if self.controller.checkpoints is not None:
+                self.controller.checkpoints.close(task.task_id)
+    
+    def cancel(self, task_id: str) -> bool:
+        """取消任务，任务已结束时返回False"""
+        handle = self._handles.get(task_id)
+        if handle is None or handle.done():
+            return False
+        return handle.cancel()
+    
+    async def wait(self, task_ids: Optional[List[str]] = None) -> List[ScheduledTask]:
+        """等待任务结束（默认等待 tasks 中的全部任务），返回调用时仍保留在 tasks 中的任务"""
+        task_ids = task_ids or list(self.tasks)
+        tasks = [self.tasks[t] for t in task_ids if t in self.tasks]
+        handles = [self._handles[t] for t in task_ids if t in self._handles]
+        await asyncio.gather(*handles, return_exceptions=True)
+        return tasks
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """汇总统计（包括已清出 tasks 的任务）：各状态任务数、总迭代数和每秒迭代数"""
+        active = [self.tasks[t] for t in self._handles]
+        statuses = dict(self._finished_statuses)
+        for task in active:
+            statuses[task.status] = statuses.get(task.status, 0) + 1
+        
+        started = [t.started_at for t in active if t.started_at is not None]
+        if self._first_started is not None:
+            started.append(self._first_started)
+        total_iterations = self._finished_iterations + sum(t.iterations for t in active)
+        finished = self._last_finished
+        wall_time = (finished - min(started)) if started and finished is not None else 0.0
+        
+        return {
+            "tasks": self._finished_count + len(active),
+            "statuses": statuses,
+            "total_iterations": total_iterations,
+            "wall_time": wall_time,
+            "iterations_per_second": total_iterations / wall_time if wall_time > 0 else 0.0
+        }
+
+class AsyncLineReader:
+    """异步逐行读取标准输入，等待输入时不阻塞事件循环
+    
+    每次读取在一个守护线程中调用 readline：
+    - 不使用 loop.connect_read_pipe：它会把终端设为非阻塞模式，而终端与stdout共享同一个
+      文件描述，后台任务输出时可能遇到 BlockingIOError
+    - 不使用默认线程池：等待输入的线程无法中断，事件循环关闭时会一直等到用户按下回车
+    - 只在需要时读取下一行，sys.stdin 缓冲区里已有的数据（例如菜单里先调用过 input()）不会丢失
+    readline 被取消时，已发起的读取继续进行，读到的行留给下一次调用。
+    """
+    
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdin
+        self._pending: Optional[asyncio.Future] = None
+    
+    def _read(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        try:
+            line, error = self.stream.readline(), None
+        except Exception as e:
+            line, error = None, e
+        
+        def deliver():
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(line)
+        
+        try:
+            loop.call_soon_threadsafe(deliver)
+        except RuntimeError:
+            pass  # 事件循环已经关闭
+    
+    async def readline(self, prompt: str = "") -> Optional[str]:
+        """读取一行（不含换行符），输入结束时返回None"""
+        if prompt:
+            sys.stdout.write(prompt)
+            sys.stdout.flush()
+        if self._pending is None:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.create_future()
+            threading.Thread(target=self._read, args=(loop, self._pending), daemon=True).start()
+        try:
+            line = await asyncio.shield(self._pending)
+        finally:
+            if self._pending is not None and self._pending.done():
+                self._pending = None
+        if not line:
+            return None
+        return line.rstrip("\r\n")
+    
+    def close(self):
+        """放弃尚未完成的读取（守护线程不会阻止进程退出）"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
 
 class ConversationManager:
-    """对话管理器"""
+    """对话管理器
+    
+    交互模式下每条输入作为后台任务提交给 AgentScheduler，
+    任务运行期间可以继续输入新任务、查看状态或按ID取消任务。
+    """
     
-    def __init__(self, controller: AgentController):
+    def __init__(
+        self,
+        controller: AgentController,
+        event_log_path: Optional[str] = None,
+        max_iterations: int = 5,
+        show_progress: bool = False
+    ):
         self.controller = controller
         self.conversation_history = []
+        # 设置后，轨迹事件以结构化二进制格式追加到事件日志，而不是以字符串形式存入JSON
+        self.event_log_path = event_log_path
+        self.event_log = EventLogWriter(event_log_path) if event_log_path else None
+        self.max_iterations = max_iterations
+        # 关闭时只在任务结束时输出摘要，避免多个任务的逐步输出与输入提示交错
+        self.show_progress = show_progress
+        self.scheduler: Optional[AgentScheduler] = None
     
-    async def start_interactive_session(self):
+    async def start_interactive_session(self, reader: Optional[AsyncLineReader] = None):
         """开始交互式会话"""
         print("🎯 OpenHands自定义代理交互式会话")
-        print("输入 'quit' 退出，'help' 查看帮助")
+        print("输入任务后在后台运行；'status' 查看任务，'cancel <id>' 取消，'help' 帮助，'quit' 退出")
         print("=" * 50)
         
-        while True:
-            try:
-                user_input = input("\n👤 你: ").strip()
+        reader = reader or AsyncLineReader()
+        self.scheduler = AgentScheduler(self.controller)
+        verbose = self.controller.verbose
+        self.controller.verbose = self.show_progress
+        try:
+            while True:
+                user_input = await reader.readline("\n👤 你: ")
+                if user_input is None:
+                    print()
+                    break
+                user_input = user_input.strip()
+                command, _, argument = user_input.partition(" ")
+                command = command.lower()
                 
-                if user_input.lower() == 'quit':
-                    print("👋 再见！")
+                if command == 'quit':
                     break
-                elif user_input.lower() == 'help':
+                elif command == 'help':
                     self._show_help()
-                    continue
-                elif not user_input:
-                    continue
-                
-                # 运行代理
-                state = await self.controller.run_agent(user_input, max_iterations=5)
-                
-                # 保存对话
-                self.conversation_history.append({
-                    "user_input": user_input,
-                    "agent_response": self._extract_agent_response(state),
-                    "events": [str(event) for event in state.history]
-                })
-                
-            except KeyboardInterrupt:
-                print("\n👋 会话被中断，再见！")
-                break
-            except Exception as e:
-                print(f"❌ 发生错误: {e}")
+                elif command in ('status', 'tasks'):
+                    self._show_status()
+                elif command == 'cancel':
+                    self._cancel(argument.strip())
+                elif command == 'wait':
+                    await self.scheduler.wait()
+                elif user_input:
+                    task_id = self.scheduler.submit(
+                        user_input, max_iterations=self.max_iterations, on_done=self._on_task_done
+                    )
+                    print(f"🚀 已启动 {task_id}")
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            print("\n👋 会话被中断")
+        finally:
+            reader.close()
+            await self._shutdown()
+            self.controller.verbose = verbose
+        print("👋 再见！")
+    
+    def _on_task_done(self, task: ScheduledTask):
+        """任务结束回调：打印摘要并保存对话"""
+        icons = {"completed": "✅", "cancelled": "🛑", "timeout": "⏰", "failed": "❌"}
+        if task.state is not None:
+            response = self._extract_agent_response(task.state)
+            self.conversation_history.append(self._record_turn(task.message, task.state))
+        else:
+            response = task.error or "任务未开始"
+        print(f"\n{icons.get(task.status, '•')} [{task.task_id}] {task.status}: {response}")
+    
+    def _show_status(self):
+        """列出会话中的任务及其实时状态"""
+        if not self.scheduler.tasks:
+            print("📭 暂无任务")
+            return
+        now = time.monotonic()
+        for task in self.scheduler.tasks.values():
+            if task.started_at is None:
+                elapsed = 0.0
+            else:
+                elapsed = (task.finished_at or now) - task.started_at
+            print(
+                f"  {task.task_id:<10} {task.status:<10} "
+                f"迭代 {task.iterations}/{task.max_iterations}  {elapsed:6.1f}s  {task.message[:40]}"
+            )
+    
+    def _cancel(self, task_id: str):
+        if not task_id:
+            print("用法: cancel <任务ID>")
+        elif task_id not in self.scheduler.tasks:
+            print(f"❓ 未知任务 {task_id}")
+        elif not self.scheduler.cancel(task_id):
+            print(f"ℹ️ {task_id} 已结束")
+        else:
+            print(f"🛑 正在取消 {task_id}")
+    
+    async def _shutdown(self):
+        """退出时取消仍在运行的任务，并等待它们记录完毕"""
+        if self.scheduler is None:
+            return
+        for task_id, task in self.scheduler.tasks.items():
+            if task.finished_at is None:
+                self.scheduler.cancel(task_id)
+        await self.scheduler.wait()
+    
+    def _record_turn(self, user_input: str, state: State) -> Dict[str, Any]:
+        """记录一轮对话，有事件日志时只保存事件在日志中的位置"""
+        turn = {
+            "user_input": user_input,
+            "agent_response": self._extract_agent_response(state),
+        }
+        if self.event_log is not None:
+            turn["event_log"] = {
+                "path": self.event_log_path,
+                "offset": self.event_log.extend(state.history),
+                "count": len(state.history),
+            }
+            self.event_log.flush()
+        else:
+            turn["events"] = [str(event) for event in state.history]
+        return turn
     
     def _show_help(self):
         """显示帮助信息"""
@@ -389,6 +3582,12 @@ class ConversationManager:
 - "你好" - 简单对话
 - "完成任务" - 结束当前任务
 
+会话命令:
+- status / tasks - 查看所有任务的状态、迭代进度和耗时
+- cancel <任务ID> - 取消正在运行的任务
+- wait - 等待所有任务结束
+- quit - 取消未完成的任务并退出
+
 代理能力:
 ✅ 执行shell命令
 ✅ 文件操作
@@ -409,6 +3608,173 @@ class ConversationManager:
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
         print(f"💾 对话历史已保存到 {filename}")
+    
+    def close(self):
+        """关闭事件日志"""
+        if self.event_log is not None:
+            self.event_log.close()
+
+# ---------------------------------------------------------------------------
+# 多进程批量场景评估
+# ---------------------------------------------------------------------------
+
+def load_scenarios(path: str) -> List[Dict[str, Any]]:
+    """读取场景文件（JSONL，每行为场景对象或任务字符串；也支持JSON数组）"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        items = json.loads(stripped)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    
+    scenarios = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"message": item}
+        scenarios.append({
+            "id": str(item.get("id", f"scenario-{i + 1}")),
+            "message": item["message"],
+            "max_iterations": int(item.get("max_iterations", 3)),
+            "deadline": item.get("deadline")
+        })
+    return scenarios
+
+def _evaluate_shard(shard: List[Dict[str, Any]], concurrency: int, llm_latency: float) -> List[Dict[str, Any]]:
+    """在工作进程中评估一批场景（进程池入口，必须是模块级函数）"""
+    return asyncio.run(_evaluate_shard_async(shard, concurrency, llm_latency))
+
+async def _evaluate_shard_async(
+    shard: List[Dict[str, Any]],
+    concurrency: int,
+    llm_latency: float
+) -> List[Dict[str, Any]]:
+    """在一个事件循环中并发运行一批场景"""
+    agent = CustomAgent(MockLLM(latency=llm_latency), "EvalAgent")
+    controller = AgentController(agent, MockRuntime(), step_delay=0, verbose=False)
+    scheduler = AgentScheduler(
+        controller,
+        max_concurrent_llm=concurrency,
+        max_concurrent_runtime=concurrency,
+        max_concurrent_tasks=concurrency
+    )
+    for scenario in shard:
+        scheduler.submit(
+            scenario["message"],
+            max_iterations=scenario["max_iterations"],
+            deadline=scenario.get("deadline"),
+            task_id=scenario["id"]
+        )
+    
+    results = []
+    for task in await scheduler.wait():
+        history = task.state.history if task.state is not None else []
+        wall_time = None
+        if task.started_at is not None and task.finished_at is not None:
+            wall_time = task.finished_at - task.started_at
+        results.append({
+            "id": task.task_id,
+            "message": task.message,
+            "status": task.status,
+            "error": task.error,
+            "actions": sum(1 for e in history if isinstance(e, Action)),
+            "observations": sum(1 for e in history if isinstance(e, Observation)),
+            "iterations": task.iterations,
+            "wall_time": wall_time,
+            "final_action": str(history[-1]) if history else None,
+            "worker_pid": os.getpid()
+        })
+    return results
+
+def summarize_results(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """汇总评估指标"""
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    wall_times = sorted(r["wall_time"] for r in results if r["wall_time"] is not None)
+    
+    def percentile(p: float) -> Optional[float]:
+        if not wall_times:
+            return None
+        return wall_times[min(len(wall_times) - 1, int(p * len(wall_times)))]
+    
+    return {
+        "scenarios": len(results),
+        "statuses": statuses,
+        "actions": sum(r["actions"] for r in results),
+        "observations": sum(r["observations"] for r in results),
+        "iterations": sum(r["iterations"] for r in results),
+        "wall_time_p50": percentile(0.50),
+        "wall_time_p95": percentile(0.95),
+        "workers": len({r["worker_pid"] for r in results}),
+        "elapsed": elapsed,
+        "scenarios_per_second": len(results) / elapsed if elapsed > 0 else 0.0
+    }
+
+class EvaluationRunner:
+    """多进程场景评估：场景分片后交给进程池，每个工作进程内再并发运行多个控制器"""
+    
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        concurrency: int = 64,
+        shard_size: int = 200,
+        llm_latency: float = 0.0
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency  # 每个工作进程内同时运行的场景数
+        self.shard_size = shard_size  # 每个分片的场景数，分片越小结果返回越及时
+        self.llm_latency = llm_latency
+    
+    def run(
+        self,
+        scenarios: List[Dict[str, Any]],
+        output_path: Optional[str] = None,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """运行评估；结果按分片完成顺序以JSONL写出，返回汇总指标"""
+        shards = [
+            scenarios[i:i + self.shard_size]
+            for i in range(0, len(scenarios), self.shard_size)
+        ]
+        results: List[Dict[str, Any]] = []
+        output = open(output_path, "w", encoding="utf-8") if output_path else None
+        
+        start = time.perf_counter()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    pool.submit(_evaluate_shard, shard, self.concurrency, self.llm_latency)
+                    for shard in shards
+                ]
+                for future in as_completed(futures):
+                    for result in future.result():
+                        results.append(result)
+                        if output is not None:
+                            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                        if on_result is not None:
+                            on_result(result)
+                    if output is not None:
+                        output.flush()
+        finally:
+            if output is not None:
+                output.close()
+        
+        return summarize_results(results, time.perf_counter() - start)
+
+def print_evaluation_summary(summary: Dict[str, Any]):
+    """打印评估汇总"""
+    print("📈 评估汇总:")
+    print(f"   场景数量: {summary['scenarios']}（{summary['statuses']}）")
+    print(f"   动作数量: {summary['actions']}")
+    print(f"   观察数量: {summary['observations']}")
+    print(f"   迭代次数: {summary['iterations']}")
+    if summary["wall_time_p50"] is not None:
+        print(f"   单场景耗时: p50 {summary['wall_time_p50'] * 1000:.1f} ms，"
+              f"p95 {summary['wall_time_p95'] * 1000:.1f} ms")
+    print(f"   总耗时: {summary['elapsed']:.2f} 秒（{summary['scenarios_per_second']:,.0f} 场景/秒，"
+          f"{summary['workers']} 个工作进程）")
 
 async def demo_agent_capabilities():
     """演示代理能力"""
@@ -445,15 +3811,569 @@ async def demo_agent_capabilities():
         print(f"   观察数量: {len(observations)}")
         print(f"   迭代次数: {state.iteration + 1}")
 
+async def benchmark_event_log(num_events: int = 1_000_000, path: str = "event_log_bench.bin"):
+    """事件日志基准：写入、回放和只读头部扫描的吞吐"""
+    print(f"📦 事件日志基准测试（{num_events} 个事件）")
+    sample_events = [
+        MessageAction(content="User: 执行 ls 命令"),
+        CmdRunAction("ls -la"),
+        CmdOutputObservation(content="total 8\n-rw-r--r-- 1 user user 42 agent_output.txt", command="ls -la"),
+        FileEditAction(path="/tmp/agent_output.txt", content="Agent response"),
+        FileReadObservation(content="File /tmp/agent_output.txt written successfully", path="/tmp/agent_output.txt"),
+        AgentFinishAction(outputs={"result": "done", "status": "completed"}),
+    ]
+    if os.path.exists(path):
+        os.remove(path)
+    
+    try:
+        start = time.perf_counter()
+        with EventLogWriter(path) as writer:
+            batch_size = 10_000
+            for i in range(0, num_events, batch_size):
+                count = min(batch_size, num_events - i)
+                writer.extend(sample_events[j % len(sample_events)] for j in range(count))
+        write_time = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        
+        with EventLogReader(path) as reader:
+            start = time.perf_counter()
+            scanned = sum(1 for _ in reader.scan())
+            scan_time = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            replayed = sum(1 for _ in reader.replay())
+            replay_time = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            commands = sum(1 for _ in reader.replay((CmdRunAction,)))
+            filter_time = time.perf_counter() - start
+        
+        print(f"   文件大小: {size_mb:.1f} MB")
+        print(f"   写入: {num_events / write_time:,.0f} 事件/秒")
+        print(f"   扫描: {scanned / scan_time:,.0f} 事件/秒")
+        print(f"   回放: {replayed / replay_time:,.0f} 事件/秒")
+        print(f"   过滤回放(CmdRunAction): {commands} 个，用时 {filter_time:.2f} 秒")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+async def benchmark_scheduler(num_tasks: int = 500, max_iterations: int = 5, llm_latency: float = 0.01):
+    """调度器基准：顺序运行与并发调度的每秒迭代数对比"""
+    print(f"🗓️ 调度器基准测试（{num_tasks} 个任务，LLM延迟 {llm_latency * 1000:.0f}ms）")
+    scenarios = ["执行 ls 命令", "创建一个文件", "你好", "执行 date 命令"]
+    
+    def make_controller() -> AgentController:
+        agent = CustomAgent(MockLLM(latency=llm_latency), "BenchAgent")
+        return AgentController(agent, MockRuntime(), step_delay=0, verbose=False)
+    
+    # 顺序运行（只取部分任务估算）
+    sample = max(1, num_tasks // 20)
+    controller = make_controller()
+    start = time.perf_counter()
+    sequential_iterations = 0
+    for i in range(sample):
+        state = await controller.run_agent(scenarios[i % len(scenarios)], max_iterations)
+        sequential_iterations += state.iteration + 1
+    sequential_rate = sequential_iterations / (time.perf_counter() - start)
+    
+    # 并发调度
+    scheduler = AgentScheduler(make_controller(), max_concurrent_llm=256, max_concurrent_runtime=256)
+    for i in range(num_tasks):
+        scheduler.submit(scenarios[i % len(scenarios)], max_iterations=max_iterations, deadline=30)
+    await scheduler.wait()
+    stats = scheduler.get_stats()
+    
+    print(f"   顺序运行: {sequential_rate:,.0f} 迭代/秒")
+    print(f"   并发调度: {stats['iterations_per_second']:,.0f} 迭代/秒 "
+          f"（{stats['total_iterations']} 次迭代，{stats['wall_time']:.2f} 秒）")
+    print(f"   任务状态: {stats['statuses']}")
+
+async def benchmark_shell_pool(num_commands: int = 200):
+    """会话池基准：常驻会话与每条命令启动新进程的单命令开销对比"""
+    print(f"🐚 Shell会话池基准测试（{num_commands} 条命令）")
+    
+    start = time.perf_counter()
+    for _ in range(num_commands):
+        process = await asyncio.create_subprocess_exec(
+            "/bin/bash", "-c", "echo ok",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        await process.communicate()
+    spawn_time = (time.perf_counter() - start) / num_commands
+    
+    async with ShellSessionPool(size=1) as pool:
+        start = time.perf_counter()
+        for _ in range(num_commands):
+            await pool.run("echo ok")
+        pool_time = (time.perf_counter() - start) / num_commands
+        
+        # 同一个会话池在多次代理运行之间复用
+        agent = CustomAgent(MockLLM(), "ShellAgent")
+        for scenario in ["执行 ls 命令", "执行 pwd 命令", "执行 date 命令"]:
+            controller = AgentController(agent, LocalRuntime(pool), step_delay=0, verbose=False)
+            await controller.run_agent(scenario, max_iterations=3)
+        sessions_started = pool.sessions_started
+    
+    print(f"   每条命令启动新进程: {spawn_time * 1000:.2f} ms/命令")
+    print(f"   常驻会话池: {pool_time * 1000:.2f} ms/命令（快 {spawn_time / pool_time:.1f} 倍）")
+    print(f"   3 次代理运行共启动会话: {sessions_started} 个")
+
+async def benchmark_snapshots(num_files: int = 10_000, rounds: int = 200, changed_per_round: int = 10):
+    """快照基准：写时复制快照/恢复与深拷贝字典的对比，以及多代理间的内容共享"""
+    import copy
+    
+    print(f"📸 工作区快照基准测试（{num_files} 个文件，每轮修改 {changed_per_round} 个）")
+    contents = [f"# module {i}\n" + "x = 1\n" * 50 for i in range(100)]
+    
+    runtime = MockRuntime()
+    plain_files = {}
+    for i in range(num_files):
+        path = f"/workspace/pkg{i % 100}/file{i}.py"
+        runtime.files[path] = contents[i % len(contents)]
+        plain_files[path] = contents[i % len(contents)]
+    
+    start = time.perf_counter()
+    for r in range(rounds):
+        snapshot = runtime.snapshot(f"round-{r}")
+        for j in range(changed_per_round):
+            runtime.files[f"/workspace/pkg{j}/file{j}.py"] = f"retry {r}"
+        runtime.restore(snapshot)
+    cow_time = (time.perf_counter() - start) / rounds
+    
+    start = time.perf_counter()
+    for r in range(min(rounds, 20)):
+        backup = copy.deepcopy(plain_files)
+        for j in range(changed_per_round):
+            plain_files[f"/workspace/pkg{j}/file{j}.py"] = f"retry {r}"
+        plain_files = backup
+    deepcopy_time = (time.perf_counter() - start) / min(rounds, 20)
+    
+    # 多个分叉的代理写入相同内容时共享存储
+    forks = [runtime.fork() for _ in range(100)]
+    for fork in forks:
+        fork.files["/workspace/README.md"] = "same content " * 100
+    
+    print(f"   写时复制 快照+修改+恢复: {cow_time * 1000:.3f} ms/轮")
+    print(f"   深拷贝字典 备份+修改+恢复: {deepcopy_time * 1000:.3f} ms/轮")
+    print(f"   101 个工作区共 {sum(len(f.files) for f in forks) + len(runtime.files)} 个文件，"
+          f"实际存储内容 {len(runtime.files.blob_store)} 份")
+
+async def benchmark_streaming_dispatch(num_steps: int = 20, token_latency: float = 0.002):
+    """流式分发基准：从发起请求到得到动作的耗时（完整补全 vs 流式提前分发）"""
+    
+    class VerboseLLM(MockLLM):
+        """先给出决定、随后附带大段解释的模拟LLM"""
+        def _generate_response(self, messages):
+            return "好的，我来执行 ls 命令查看目录。" + "接下来我会解释每个文件的用途和后续计划。" * 40
+    
+    print(f"⚡ 流式动作分发基准测试（每块生成 {token_latency * 1000:.0f}ms）")
+    llm = VerboseLLM(latency=0.02, token_latency=token_latency)
+    state = State(history=[MessageAction(content="User: 执行 ls 命令")])
+    
+    results = {}
+    for streaming in (False, True):
+        agent = CustomAgent(llm, "StreamAgent", streaming=streaming)
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            action = await agent.step(state)
+        results[streaming] = ((time.perf_counter() - start) / num_steps, action)
+    
+    blocking_time, blocking_action = results[False]
+    streaming_time, streaming_action = results[True]
+    print(f"   完整补全后解析: {blocking_time * 1000:.1f} ms → {blocking_action}")
+    print(f"   流式提前分发:   {streaming_time * 1000:.1f} ms → {streaming_action}")
+
+async def benchmark_output_spooling(iterations: int = 200, output_kb: int = 512):
+    """大输出基准：长时间运行中观察负载全部驻留内存与溢出到磁盘的内存峰值对比
+    
+    内存峰值由tracemalloc统计（可在两种模式之间重置，ru_maxrss不行）。
+    """
+    import tracemalloc
+    
+    print(f"💽 大输出溢出基准测试（{iterations} 次迭代，每次输出 {output_kb} KB）")
+    line = "building target src/module.c ... ok\n"
+    output = line * (output_kb * 1024 // len(line))
+    
+    results = {}
+    for label, threshold in (("全部驻留内存", float("inf")), ("溢出到磁盘", 64 * 1024)):
+        spool = PayloadSpool(threshold=threshold)
+        agent = CustomAgent(MockLLM(), "SpoolAgent")
+        state = State(history=[MessageAction(content="User: 执行构建")], max_iterations=iterations)
+        
+        tracemalloc.start()
+        start = time.perf_counter()
+        for i in range(iterations):
+            # 每次生成新的字符串，模拟不同的构建日志
+            state.add_event(CmdOutputObservation(content=output + str(i), command="make", spool=spool))
+            agent._build_messages(state)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        results[label] = (peak, elapsed, spool.bytes_spilled)
+        spool.close()
+    
+    for label, (peak, elapsed, spilled) in results.items():
+        print(f"   {label}: 内存峰值 {peak / 1024 / 1024:.1f} MB，"
+              f"磁盘 {spilled / 1024 / 1024:.1f} MB，用时 {elapsed:.2f} 秒")
+
+async def benchmark_checkpoints(num_events: int = 10_000, directory: str = "checkpoint_bench"):
+    """检查点基准：增量检查点与每次全量导出的单次迭代开销，以及1万事件历史的恢复耗时"""
+    import shutil
+    
+    print(f"💾 检查点基准测试（{num_events} 个事件）")
+    iterations = num_events // 2
+    store = CheckpointStore(directory, compact_every=1000)
+    state = State(history=[MessageAction(content="User: 长任务")], max_iterations=iterations, task_id="bench")
+    
+    try:
+        delta_total = 0.0
+        for i in range(iterations):
+            state.iteration = i
+            state.add_event(CmdRunAction(f"echo step {i}"))
+            state.add_event(CmdOutputObservation(content=f"step {i}", command=f"echo step {i}"))
+            start = time.perf_counter()
+            store.record("bench", state, i + 1)
+            delta_total += time.perf_counter() - start
+        store.close()
+        
+        # 对比：每次迭代全量导出历史（只测最后100次，代表历史较长时的开销）
+        full_total = 0.0
+        full_path = os.path.join(directory, "full.json")
+        for _ in range(100):
+            start = time.perf_counter()
+            with open(full_path, "w", encoding="utf-8") as f:
+                json.dump([str(event) for event in state.history], f)
+            full_total += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        restored = store.load("bench")
+        resume_time = time.perf_counter() - start
+        
+        print(f"   增量检查点: 平均 {delta_total / iterations * 1000:.3f} ms/迭代（含定期压缩）")
+        print(f"   全量导出:   {full_total / 100 * 1000:.3f} ms/迭代（历史 {len(state.history)} 个事件时）")
+        print(f"   恢复 {len(restored.history)} 个事件: {resume_time * 1000:.1f} ms，"
+              f"已完成迭代 {restored.iteration + 1}")
+    finally:
+        store.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+async def benchmark_evaluation(num_scenarios: int = 4000, llm_latency: float = 0.005):
+    """评估基准：不同工作进程数下的总耗时，观察随核数的扩展情况"""
+    print(f"🧪 批量评估基准测试（{num_scenarios} 个场景，{os.cpu_count()} 个CPU核）")
+    messages = ["你好，请介绍一下你自己", "执行 ls 命令查看当前目录", "创建一个包含当前时间的文件", "执行 date 命令"]
+    scenarios = [
+        {"id": f"bench-{i}", "message": messages[i % len(messages)], "max_iterations": 3, "deadline": None}
+        for i in range(num_scenarios)
+    ]
+    
+    worker_counts = sorted({1, 2, os.cpu_count() or 1})
+    baseline = None
+    for workers in worker_counts:
+        runner = EvaluationRunner(workers=workers, shard_size=250, llm_latency=llm_latency)
+        summary = await asyncio.to_thread(runner.run, scenarios)
+        baseline = baseline or summary["elapsed"]
+        print(f"   {workers} 个工作进程: {summary['elapsed']:.2f} 秒，"
+              f"{summary['scenarios_per_second']:,.0f} 场景/秒（加速 {baseline / summary['elapsed']:.2f} 倍）")
+
+async def benchmark_tracing(num_tasks: int = 200, max_iterations: int = 5, trace_path: str = "agent_trace.json"):
+    """追踪基准：启用追踪的额外开销，并导出Chrome Trace和耗时热点"""
+    print(f"🔍 分段追踪基准测试（{num_tasks} 个任务）")
+    scenarios = ["执行 ls 命令", "创建一个文件", "你好", "执行 date 命令"]
+    
+    async def run(tracer: Optional[Tracer]) -> float:
+        agent = CustomAgent(MockLLM(), "TraceAgent")
+        controller = AgentController(agent, MockRuntime(), step_delay=0, verbose=False, tracer=tracer)
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            controller.run_agent(scenarios[i % len(scenarios)], max_iterations, task_id=f"task-{i}")
+            for i in range(num_tasks)
+        ))
+        return time.perf_counter() - start
+    
+    plain_time = await run(None)
+    tracer = Tracer()
+    traced_time = await run(tracer)
+    span_count = len(tracer.spans())
+    tracer.export_chrome_trace(trace_path)
+    
+    print(f"   未追踪: {plain_time * 1000:.1f} ms；追踪: {traced_time * 1000:.1f} ms")
+    print(f"   共 {span_count} 个时间段，平均每个额外开销 "
+          f"{max(traced_time - plain_time, 0) / span_count * 1e6:.2f} µs")
+    print(f"   Chrome Trace 已导出到 {trace_path}")
+    print("   耗时热点:")
+    for name, entry in list(tracer.summary().items())[:6]:
+        print(f"     {name:<16} 次数 {entry['count']:>6}  总计 {entry['total_ms']:8.2f} ms  "
+              f"平均 {entry['mean_ms']:.3f} ms")
+
+async def benchmark_batch_actions(num_files: int = 50, llm_latency: float = 0.02):
+    """批量动作基准：多文件编辑时逐个动作与一次批量动作的步数和耗时对比"""
+    import shutil
+    
+    print(f"🧩 批量动作基准测试（编辑并读回 {num_files} 个文件，LLM延迟 {llm_latency * 1000:.0f}ms）")
+    workdir = tempfile.mkdtemp(prefix="batch_bench_")
+    edits = [FileEditAction(path=f"src/module_{i}.py", content=f"VALUE = {i}\n" * 100) for i in range(num_files)]
+    reads = [FileReadAction(path=f"src/module_{i}.py") for i in range(num_files)]
+    
+    try:
+        async with ShellSessionPool(size=1, workdir=workdir) as pool:
+            runtime = LocalRuntime(pool)
+            
+            # 每步一个动作：每步都要等一次LLM决策
+            start = time.perf_counter()
+            for action in edits + reads:
+                await asyncio.sleep(llm_latency)
+                await runtime.execute_action(action)
+            sequential = (len(edits) + len(reads), time.perf_counter() - start)
+            
+            # 一步一个批量动作：读依赖同路径的写，其余并发执行
+            start = time.perf_counter()
+            await asyncio.sleep(llm_latency)
+            observation = await runtime.execute_action(BatchAction(edits + reads))
+            batched = (1, time.perf_counter() - start)
+        
+        print(f"   逐个动作: {sequential[0]} 步，{sequential[1] * 1000:.1f} ms")
+        print(f"   批量动作: {batched[0]} 步，{batched[1] * 1000:.1f} ms → {observation}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+async def benchmark_condenser(iterations: int = 100_000, window: int = 100):
+    """压缩器基准：长时间运行时历史长度和内存占用（有/无压缩）"""
+    import shutil
+    import tracemalloc
+    
+    print(f"🗜️ 事件压缩基准测试（{iterations} 次迭代，窗口 {window}）")
+    archive_dir = tempfile.mkdtemp(prefix="condenser_bench_")
+    
+    async def run(condenser: Optional[Condenser]) -> Tuple[int, int, float]:
+        agent = CustomAgent(MockLLM(), "LongAgent")
+        controller = AgentController(agent, MockRuntime(), step_delay=0, verbose=False, condenser=condenser)
+        tracemalloc.start()
+        start = time.perf_counter()
+        state = await controller.run_agent("执行 ls 命令", max_iterations=iterations, task_id="long")
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return len(state.history), current, elapsed
+    
+    try:
+        condenser = CondenserPipeline([
+            DropRedundantObservations(window=window),
+            SummarizingCondenser(window=window, archive_dir=archive_dir)
+        ])
+        for label, c in (("无压缩", None), ("压缩", condenser)):
+            length, memory, elapsed = await run(c)
+            print(f"   {label}: 历史 {length} 个事件，内存 {memory / 1024:,.0f} KB，用时 {elapsed:.1f} 秒")
+        condenser.close()
+        archived = sum(os.path.getsize(os.path.join(archive_dir, f)) for f in os.listdir(archive_dir))
+        print(f"   归档到磁盘: {archived / 1024 / 1024:.1f} MB")
+    finally:
+        shutil.rmtree(archive_dir, ignore_errors=True)
+
+async def benchmark_event_bus(num_tasks: int = 200, max_iterations: int = 10):
+    """事件总线基准：并发控制器直接打印与发布到事件总线时的事件循环延迟
+    
+    输出写入一个每次写调用阻塞0.1ms的流，模拟较慢的终端或管道。
+    """
+    
+    class SlowStream(io.StringIO):
+        def write(self, text: str) -> int:
+            time.sleep(0.0001)
+            return len(text)
+    
+    print(f"📣 事件总线基准测试（{num_tasks} 个并发任务）")
+    scenarios = ["执行 ls 命令", "创建一个文件", "你好", "执行 date 命令"]
+    sink = SlowStream()
+    
+    async def run(verbose: bool, bus: Optional[EventBus]) -> Tuple[Dict[str, float], float]:
+        agent = CustomAgent(MockLLM(latency=0.001), "BusAgent")
+        controller = AgentController(agent, MockRuntime(), step_delay=0, verbose=verbose, bus=bus)
+        monitor = LoopLagMonitor()
+        monitor.start()
+        start = time.perf_counter()
+        with redirect_stdout(sink):
+            await asyncio.gather(*(
+                controller.run_agent(scenarios[i % len(scenarios)], max_iterations, task_id=f"task-{i}")
+                for i in range(num_tasks)
+            ))
+            if bus is not None:
+                await bus.close()
+        elapsed = time.perf_counter() - start
+        return await monitor.stop(), elapsed
+    
+    bus = EventBus()
+    bus.subscribe(ConsoleSubscriber(stream=sink, show_task=True), maxsize=10_000, policy="drop_oldest")
+    metrics = bus.subscribe(MetricsSubscriber(), policy="block")
+    
+    try:
+        for label, verbose, b in (("静默", False, None), ("直接打印", True, None), ("事件总线", False, bus)):
+            lag, elapsed = await run(verbose, b)
+            print(f"   {label}: 用时 {elapsed * 1000:.0f} ms，循环延迟 平均 {lag['mean_ms']:.2f} ms，"
+                  f"p99 {lag['p99_ms']:.2f} ms，最大 {lag['max_ms']:.2f} ms")
+        print(f"   指标订阅者统计: {metrics.counts}，丢弃: {bus.dropped()}")
+    finally:
+        sink.close()
+
+async def replay_command_cache(events, runtime: Optional[MockRuntime] = None) -> Dict[str, Any]:
+    """在带命令缓存的运行时上重放轨迹中的命令和文件编辑动作，返回缓存统计和用时"""
+    runtime = runtime or MockRuntime(command_cache=CommandResultCache())
+    if runtime.command_cache is None:
+        runtime.command_cache = CommandResultCache()
+    actions = 0
+    start = time.perf_counter()
+    for event in events:
+        if isinstance(event, (CmdRunAction, FileEditAction, BatchAction)):
+            await runtime.execute_action(event)
+            actions += 1
+    stats = runtime.command_cache.get_stats()
+    stats.update(actions=actions, elapsed=time.perf_counter() - start)
+    return stats
+
+async def benchmark_command_cache(num_tasks: int = 200, steps_per_task: int = 50,
+                                  event_log_path: str = "custom_agent_events.bin"):
+    """命令缓存基准：录制轨迹上的命中率，以及在真实shell中重放时有/无缓存的耗时"""
+    import shutil
+    
+    print("🗃️ 命令结果缓存基准测试")
+    if os.path.exists(event_log_path):
+        reader = EventLogReader(event_log_path)
+        trajectories = [list(reader.replay((CmdRunAction, FileEditAction, BatchAction)))]
+        reader.close()
+        print(f"   轨迹来源: {event_log_path}")
+    else:
+        # 没有录制的日志时，按代理探索代码库的典型模式生成轨迹：大量重复探查、少量编辑
+        import random
+        rng = random.Random(0)
+        probes = ["pwd", "ls -la", "ls src", "cat README.md", "date", "git status"]
+        trajectories = []
+        for _ in range(num_tasks):
+            history: List[Event] = []
+            for _ in range(steps_per_task):
+                module = f"src/module_{rng.randrange(5)}.py"
+                roll = rng.random()
+                if roll < 0.5:
+                    history.append(CmdRunAction(command=rng.choice(probes)))
+                elif roll < 0.8:
+                    history.append(CmdRunAction(command=f"{rng.choice(['cat', 'grep -n VALUE'])} {module}"))
+                elif roll < 0.95:
+                    history.append(FileEditAction(path=module, content=f"VALUE = {rng.random()}\n"))
+                else:
+                    history.append(CmdRunAction(command=f"rm -f {module}"))
+            trajectories.append(history)
+        print(f"   轨迹来源: {num_tasks} 条合成轨迹，每条 {steps_per_task} 步")
+    
+    # 每条轨迹对应一个独立的运行时（工作区），缓存不跨轨迹共享
+    totals: Dict[str, float] = {}
+    for history in trajectories:
+        for name, value in (await replay_command_cache(history)).items():
+            totals[name] = totals.get(name, 0) + value
+    lookups = totals["hits"] + totals["misses"]
+    print(f"   动作 {totals['actions']:.0f}，命中 {totals['hits']:.0f}，未命中 {totals['misses']:.0f}，"
+          f"不可缓存 {totals['bypassed']:.0f}，失效 {totals['invalidations']:.0f}，"
+          f"命中率 {totals['hits'] / lookups if lookups else 0.0:.1%}")
+    
+    workdir = tempfile.mkdtemp(prefix="command_cache_bench_")
+    try:
+        async with ShellSessionPool(size=1, workdir=workdir) as pool:
+            for label, cache in (("无缓存", None), ("有缓存", CommandResultCache())):
+                runtime = LocalRuntime(pool, command_cache=cache)
+                start = time.perf_counter()
+                for history in trajectories[:20]:
+                    for event in history:
+                        if isinstance(event, (CmdRunAction, FileEditAction, BatchAction)):
+                            await runtime.execute_action(event)
+                    if cache is not None:
+                        cache.clear()
+                print(f"   真实shell重放（前 {min(20, len(trajectories))} 条轨迹）{label}: "
+                      f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+async def benchmark_runtime_pool(rounds: int = 10, pipelined_actions: int = 200):
+    """运行时工作进程池基准：冷启动与预热进程的首个观察耗时，以及流水线请求的吞吐"""
+    print(f"🏊 运行时工作进程池基准测试（{rounds} 轮）")
+    first_action = CmdRunAction(command="pwd")
+    
+    cold = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        async with RuntimeWorkerPool(size=1) as pool:
+            async with pool.lease() as runtime:
+                await runtime.execute_action(first_action)
+                cold.append(time.perf_counter() - start)
+    
+    async with RuntimeWorkerPool(size=2, max_tasks_per_worker=rounds) as pool:
+        warm = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            async with pool.lease() as runtime:
+                await runtime.execute_action(first_action)
+                warm.append(time.perf_counter() - start)
+        
+        actions = [CmdRunAction(command=f"echo {i}") for i in range(pipelined_actions)]
+        async with pool.lease() as runtime:
+            start = time.perf_counter()
+            for action in actions:
+                await runtime.execute_action(action)
+            sequential = time.perf_counter() - start
+            start = time.perf_counter()
+            await runtime.execute_many(actions)
+            pipelined = time.perf_counter() - start
+        stats = pool.get_stats()
+    
+    print(f"   冷启动（启动进程+预导入+建工作区）首个观察: 平均 {sum(cold) / len(cold) * 1000:.1f} ms")
+    print(f"   预热进程池首个观察: 平均 {sum(warm) / len(warm) * 1000:.2f} ms")
+    print(f"   {pipelined_actions} 个动作逐个往返: {sequential * 1000:.0f} ms，流水线: {pipelined * 1000:.0f} ms")
+    print(f"   进程池统计: {stats}")
+
+# 性能基准测试（名称 -> 协程函数）
+BENCHMARKS = {
+    "event_log": benchmark_event_log,
+    "scheduler": benchmark_scheduler,
+    "shell_pool": benchmark_shell_pool,
+    "snapshots": benchmark_snapshots,
+    "streaming_dispatch": benchmark_streaming_dispatch,
+    "output_spooling": benchmark_output_spooling,
+    "checkpoints": benchmark_checkpoints,
+    "evaluation": benchmark_evaluation,
+    "tracing": benchmark_tracing,
+    "batch_actions": benchmark_batch_actions,
+    "condenser": benchmark_condenser,
+    "event_bus": benchmark_event_bus,
+    "command_cache": benchmark_command_cache,
+    "runtime_pool": benchmark_runtime_pool,
+}
+
+async def run_benchmarks():
+    """选择并运行性能基准测试"""
+    names = list(BENCHMARKS)
+    for i, name in enumerate(names, 1):
+        print(f"{i}. {name}")
+    choice = input("请选择基准测试编号（回车运行全部）: ").strip()
+    
+    if not choice:
+        selected = names
+    elif choice.isdigit() and 1 <= int(choice) <= len(names):
+        selected = [names[int(choice) - 1]]
+    else:
+        print("❌ 无效选择")
+        return
+    
+    for name in selected:
+        await BENCHMARKS[name]()
+
 async def main():
     """主函数"""
     print("🤖 OpenHands自定义代理项目")
     print("选择运行模式:")
     print("1. 能力演示")
     print("2. 交互式会话")
+    print("3. 性能基准测试")
+    print("4. 批量场景评估")
     
     try:
-        choice = input("请选择 (1 或 2): ").strip()
+        choice = input("请选择 (1、2、3 或 4): ").strip()
         
         if choice == "1":
             await demo_agent_capabilities()
@@ -463,21 +4383,52 @@ async def main():
             agent = CustomAgent(llm, "InteractiveAgent")
             runtime = MockRuntime()
             controller = AgentController(agent, runtime)
-            conversation_manager = ConversationManager(controller)
+            conversation_manager = ConversationManager(
+                controller, event_log_path="custom_agent_events.bin"
+            )
             
             # 开始交互式会话
-            await conversation_manager.start_interactive_session()
+            try:
+                await conversation_manager.start_interactive_session()
+            finally:
+                conversation_manager.close()
             
             # 保存对话
             conversation_manager.save_conversation("custom_agent_conversation.json")
+        elif choice == "3":
+            await run_benchmarks()
+        elif choice == "4":
+            path = input("场景文件路径 (JSONL): ").strip()
+            summary = await asyncio.to_thread(
+                EvaluationRunner().run, load_scenarios(path), "evaluation_results.jsonl"
+            )
+            print_evaluation_summary(summary)
+            print("💾 评估结果已保存到 evaluation_results.jsonl")
         else:
             print("❌ 无效选择")
     
     except KeyboardInterrupt:
         print("\n👋 程序被中断，再见！")
 
+def evaluation_cli(argv: List[str]):
+    """命令行批量评估: eval <场景文件> [结果文件] [工作进程数]"""
+    if not argv:
+        print("用法: python 03_openhands_custom_agent.py eval <场景文件> [结果文件] [工作进程数]")
+        return
+    output_path = argv[1] if len(argv) > 1 else "evaluation_results.jsonl"
+    workers = int(argv[2]) if len(argv) > 2 else None
+    summary = EvaluationRunner(workers=workers).run(load_scenarios(argv[0]), output_path)
+    print_evaluation_summary(summary)
+    print(f"💾 评估结果已保存到 {output_path}")
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if len(sys.argv) > 1 and sys.argv[1] == "eval":
+        evaluation_cli(sys.argv[2:])
+    elif len(sys.argv) > 4 and sys.argv[1] == "runtime-worker":
+        # 由 RuntimeWorkerPool 启动: runtime-worker <套接字> <工作进程ID> <工作区> [预导入模块...]
+        asyncio.run(_runtime_worker_main(sys.argv[2], int(sys.argv[3]), sys.argv[4], sys.argv[5:]))
+    else:
+        asyncio.run(main())
 
 """
 🎯 学习要点:
@@ -0,0 +1,72 @@
+"""
+练习项目共用的核心组件：消息类型、工具、LLM提供商和代理
+
+导入本包本身几乎没有开销：所有名称在第一次访问时才导入所在模块，
+例如只使用 MockLLMProvider 时不会加载aiohttp。
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+# 名称 -> 所在子模块
+_EXPORTS = {
+    "Message": "messages",
+    "ChatMessage": "messages",
+    "Tool": "tools",
+    "CalculatorTool": "tools",
+    "WeatherTool": "tools",
+    "FunctionTool": "tools",
+    "StreamingTool": "tools",
+    "ToolChunk": "tools",
+    "calculator_function": "tools",
+    "weather_function": "tools",
+    "calculator_tool": "tools",
+    "weather_tool": "tools",
+    "evaluate_expression": "tools",
+    "compile_schema": "validation",
+    "BM25Index": "retrieval",
+    "tokenize": "retrieval",
+    "LLMProvider": "providers",
+    "MockLLMProvider": "providers",
+    "OpenAIProvider": "openai_provider",
+    "LLMRequestScheduler": "llm_scheduler",
+    "Priority": "llm_scheduler",
+    "ScheduledProvider": "llm_scheduler",
+    "DeadlineExceeded": "llm_scheduler",
+    "get_default_scheduler": "llm_scheduler",
+    "CoalescingProvider": "coalescing",
+    "PromptSimilarityCache": "prompt_cache",
+    "SimilarityCachedProvider": "prompt_cache",
+    "SimpleAgent": "agents",
+    "SmartAgent": "agents",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # 之后的访问不再经过 __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+if TYPE_CHECKING:
+    from .agents import SimpleAgent, SmartAgent
+    from .coalescing import CoalescingProvider
+    from .llm_scheduler import (
+        DeadlineExceeded, LLMRequestScheduler, Priority, ScheduledProvider, get_default_scheduler,
+    )
+    from .messages import ChatMessage, Message
+    from .openai_provider import OpenAIProvider
+    from .prompt_cache import PromptSimilarityCache, SimilarityCachedProvider
+    from .providers import LLMProvider, MockLLMProvider
+    from .retrieval import BM25Index, tokenize
+    from .validation import compile_schema
+    from .tools import (
+        CalculatorTool, FunctionTool, StreamingTool, Tool, ToolChunk, WeatherTool,
+        calculator_function, calculator_tool, evaluate_expression, weather_function, weather_tool,
+    )
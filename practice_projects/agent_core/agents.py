@@ -0,0 +1,434 @@
+"""
+代理实现：基于关键词意图识别的 SimpleAgent 和集成LLM的 SmartAgent
+
+两种代理都有流式版本的对话方法（process_user_input_stream、chat_stream）：
+本轮调用的工具产出的进度和部分结果（ToolChunk，填写了工具名）先转发给调用方，
+最后产出一个 RESPONSE 块，内容与非流式方法的返回值相同。
+"""
+
+import asyncio
+import contextvars
+import dataclasses
+import json
+import re
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .messages import ChatMessage, Message
+from .providers import LLMProvider
+from .retrieval import BM25Index
+from .tools import RESULT, FunctionTool, Tool, ToolChunk
+
+RESPONSE = "response"  # 流式对话的最后一块：代理的完整回复
+
+# 当前流式对话接收工具输出块的回调；非流式调用时为None，工具按原来的方式执行
+_chunk_sink: contextvars.ContextVar[Optional[Callable[[ToolChunk], None]]] = contextvars.ContextVar(
+    "agent_core_chunk_sink", default=None
+)
+
+async def _forward(name: str, chunks: AsyncIterator[ToolChunk], sink: Callable[[ToolChunk], None]) -> Dict[str, Any]:
+    """把中间块（填写工具名）交给 sink，返回 RESULT 块中的最终结果"""
+    result = None
+    async for chunk in chunks:
+        if chunk.kind == RESULT:
+            result = chunk.data
+        else:
+            sink(chunk if chunk.tool is not None else dataclasses.replace(chunk, tool=name))
+    if result is None:
+        raise RuntimeError(f"工具 {name} 的流式输出没有 RESULT 块")
+    return result
+
+async def _execute_tool(tool: Tool, **kwargs) -> Dict[str, Any]:
+    """执行 Tool（或 FunctionTool）；在流式对话中改为流式执行并转发中间块"""
+    sink = _chunk_sink.get()
+    if sink is None:
+        return await tool.execute(**kwargs)
+    name = tool.get_name() if isinstance(tool, Tool) else tool.name
+    return await _forward(name, tool.stream(**kwargs), sink)
+
+async def _invoke_tool(tool: FunctionTool, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """用已校验的参数调用 FunctionTool；在流式对话中改为流式调用并转发中间块"""
+    sink = _chunk_sink.get()
+    if sink is None:
+        return await tool.invoke(arguments)
+    return await _forward(tool.name, tool.invoke_stream(arguments), sink)
+
+async def _stream_turn(turn: Callable[[], Awaitable[str]]) -> AsyncIterator[ToolChunk]:
+    """在单独的任务中执行一轮对话，边执行边产出工具的中间块，最后产出 RESPONSE 块
+    
+    调用方提前关闭生成器时取消这一轮对话。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def run() -> str:
+        _chunk_sink.set(queue.put_nowait)  # 任务有自己的上下文副本，不影响调用方
+        return await turn()
+    
+    task = asyncio.ensure_future(run())
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        yield ToolChunk(RESPONSE, task.result())
+    finally:
+        if not task.done():
+            task.cancel()
+
+class SimpleAgent:
+    """简单AI代理"""
+    
+    def __init__(self, name: str = "SimpleAgent"):
+        self.name = name
+        self.tools: Dict[str, Tool] = {}
+        self.conversation_history: List[Message] = []
+        self.history_index = BM25Index()  # 文档号为消息在对话历史中的位置
+        self.system_prompt = """你是一个有用的AI助手。你可以使用以下工具来帮助用户：
+- calculator: 执行数学计算
+- weather: 查询天气信息
+
+当用户需要计算时，使用calculator工具。
+当用户询问天气时，使用weather工具。
+请根据用户的需求选择合适的工具。"""
+    
+    def add_tool(self, tool: Tool):
+        """添加工具"""
+        self.tools[tool.get_name()] = tool
+    
+    def add_message(self, message: Message):
+        """添加消息到对话历史（同时更新检索索引）"""
+        self.history_index.add(len(self.conversation_history), message.content)
+        self.conversation_history.append(message)
+    
+    def search_history(self, query: str, k: int = 5, exclude_recent: int = 0) -> List[Message]:
+        """BM25检索与查询最相关的 k 条历史消息（按相关度排序），不包括最近 exclude_recent 条"""
+        before = len(self.conversation_history) - exclude_recent
+        return [self.conversation_history[i] for i, _ in self.history_index.search(query, k, before=before)]
+    
+    async def process_user_input(self, user_input: str) -> str:
+        """处理用户输入"""
+        # 添加用户消息
+        user_message = Message(role="user", content=user_input)
+        self.add_message(user_message)
+        
+        # 简单的意图识别和工具选择
+        response = await self._generate_response(user_input)
+        
+        # 添加助手回复
+        assistant_message = Message(role="assistant", content=response)
+        self.add_message(assistant_message)
+        
+        return response
+    
+    async def process_user_input_stream(self, user_input: str) -> AsyncIterator[ToolChunk]:
+        """流式处理用户输入：先产出工具的进度和部分结果，最后产出 RESPONSE 块（完整回复）"""
+        async for chunk in _stream_turn(lambda: self.process_user_input(user_input)):
+            yield chunk
+    
+    async def _generate_response(self, user_input: str) -> str:
+        """生成回复（简化版本，实际项目中会使用LLM）"""
+        user_input_lower = user_input.lower()
+        
+        # 计算相关关键词
+        calc_keywords = ['计算', '算', '+', '-', '*', '/', '等于', '加', '减', '乘', '除']
+        if any(keyword in user_input_lower for keyword in calc_keywords):
+            return await self._handle_calculation(user_input)
+        
+        # 天气相关关键词
+        weather_keywords = ['天气', '温度', '下雨', '晴天', '多云']
+        if any(keyword in user_input_lower for keyword in weather_keywords):
+            return await self._handle_weather_query(user_input)
+        
+        # 默认回复
+        return f"你好！我是{self.name}。我可以帮你进行计算或查询天气。请告诉我你需要什么帮助。"
+    
+    async def _handle_calculation(self, user_input: str) -> str:
+        """处理计算请求"""
+        if "calculator" not in self.tools:
+            return "抱歉，计算器工具不可用。"
+        
+        # 简单提取数学表达式（实际项目中需要更复杂的NLP处理）
+        math_pattern = r'[\d+\-*/().\s]+'
+        matches = re.findall(math_pattern, user_input)
+        
+        if matches:
+            expression = max(matches, key=len).strip()
+            result = await _execute_tool(self.tools["calculator"], expression=expression)
+            
+            if "error" in result:
+                return f"计算出错：{result['error']}"
+            else:
+                return f"计算结果：{result['expression']} = {result['result']}"
+        else:
+            return "请提供一个有效的数学表达式，例如：2 + 3 * 4"
+    
+    async def _handle_weather_query(self, user_input: str) -> str:
+        """处理天气查询"""
+        if "weather" not in self.tools:
+            return "抱歉，天气查询工具不可用。"
+        
+        # 简单提取城市名（实际项目中需要更复杂的NER）
+        cities = ["北京", "上海", "深圳", "广州", "杭州"]
+        city = None
+        for c in cities:
+            if c in user_input:
+                city = c
+                break
+        
+        if city:
+            result = await _execute_tool(self.tools["weather"], city=city)
+            
+            if "error" in result:
+                return f"查询失败：{result['error']}"
+            else:
+                weather = result["weather"]
+                return f"{city}的天气：温度{weather['temperature']}，{weather['condition']}，湿度{weather['humidity']}"
+        else:
+            return "请指定要查询的城市，例如：北京的天气怎么样？"
+    
+    def get_conversation_history(self) -> List[Dict[str, Any]]:
+        """获取对话历史"""
+        return [
+            {
+                "role": msg.role,
+                "content": msg.content,
+                "timestamp": msg.timestamp
+            }
+            for msg in self.conversation_history
+        ]
+    
+    def save_conversation(self, filename: str):
+        """保存对话历史"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.get_conversation_history(), f, ensure_ascii=False, indent=2)
+    
+    def load_conversation(self, filename: str):
+        """加载对话历史"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+                self.conversation_history = []
+                self.history_index.clear()
+                for msg in history:
+                    self.add_message(Message(
+                        role=msg["role"],
+                        content=msg["content"],
+                        timestamp=msg["timestamp"]
+                    ))
+        except FileNotFoundError:
+            print(f"文件 {filename} 不存在")
+
+class SmartAgent:
+    """智能代理（集成LLM）
+    
+    context_top_k 不为None时，发给LLM的不是完整历史，而是 build_compact_messages 构建的精简上下文：
+    系统消息、BM25检索出的 context_top_k 轮相关对话和最近 recent_messages 条消息。
+    """
+    
+    def __init__(
+        self,
+        llm_provider: LLMProvider,
+        name: str = "SmartAgent",
+        context_top_k: Optional[int] = None,
+        recent_messages: int = 4
+    ):
+        self.llm_provider = llm_provider
+        self.name = name
+        self.context_top_k = context_top_k
+        self.recent_messages = recent_messages
+        self.conversation_history: List[ChatMessage] = []
+        self.history_index = BM25Index()  # 文档号为消息在对话历史中的位置，系统消息不参与检索
+        self.tools: Dict[str, FunctionTool] = {}
+        self.system_prompt = """你是一个有用的AI助手。你可以：
+1. 回答各种问题
+2. 进行数学计算
+3. 查询天气信息
+4. 提供建议和帮助
+
+请根据用户的需求提供准确、有用的回复。如果需要使用工具，请明确说明。"""
+        
+        # 添加系统消息
+        self.add_message(ChatMessage(role="system", content=self.system_prompt))
+    
+    def add_tool(self, tool: FunctionTool):
+        """添加工具"""
+        self.tools[tool.name] = tool
+    
+    def add_message(self, message: ChatMessage):
+        """添加消息（同时更新检索索引）"""
+        content = message.content if message.role != "system" else ""
+        self.history_index.add(len(self.conversation_history), content)
+        self.conversation_history.append(message)
+    
+    def build_compact_messages(self, query: str, k: int = 3, recent: Optional[int] = None) -> List[ChatMessage]:
+        """构建精简上下文：系统消息 + 与查询相关的 k 轮历史对话 + 最近 recent 条消息（按时间顺序）
+        
+        命中用户消息时连同其后的助手回复一起带上，命中助手回复时连同之前的用户消息一起带上。
+        """
+        history = self.conversation_history
+        recent = self.recent_messages if recent is None else recent
+        start = max(len(history) - recent, 0)
+        selected = {i for i in range(start) if history[i].role == "system"}
+        for i, _ in self.history_index.search(query, k, before=start):
+            selected.add(i)
+            partner = i + 1 if history[i].role == "user" else i - 1
+            if 0 <= partner < start and history[partner].role in ("user", "assistant"):
+                selected.add(partner)
+        return [history[i] for i in sorted(selected)] + history[start:]
+    
+    async def chat(self, user_input: str) -> str:
+        """与用户对话"""
+        # 添加用户消息
+        user_message = ChatMessage(role="user", content=user_input)
+        self.add_message(user_message)
+        
+        # 获取LLM响应（有工具时附带工具定义，模型可以返回tool_calls）
+        kwargs = {}
+        if self.tools:
+            kwargs["tools"] = [tool.to_openai_format() for tool in self.tools.values()]
+        if self.context_top_k is None:
+            messages = self.conversation_history
+        else:
+            messages = self.build_compact_messages(user_input, self.context_top_k)
+        response = await self.llm_provider.chat_completion(
+            messages=messages,
+            temperature=0.7,
+            **kwargs
+        )
+        
+        if response["success"]:
+            assistant_content = response["content"]
+            
+            if response.get("tool_calls"):
+                results = await self.dispatch_tool_calls(response["tool_calls"])
+                assistant_content = self._format_tool_results(results)
+            else:
+                # 检查是否需要使用工具
+                tool_response = await self._check_and_use_tools(user_input, assistant_content)
+                if tool_response:
+                    assistant_content = tool_response
+            
+            # 添加助手回复
+            assistant_message = ChatMessage(role="assistant", content=assistant_content)
+            self.add_message(assistant_message)
+            
+            return assistant_content
+        else:
+            error_message = f"抱歉，我遇到了一些问题：{response['error']}"
+            assistant_message = ChatMessage(role="assistant", content=error_message)
+            self.add_message(assistant_message)
+            return error_message
+    
+    async def chat_stream(self, user_input: str) -> AsyncIterator[ToolChunk]:
+        """流式对话：先产出工具的进度和部分结果，最后产出 RESPONSE 块（与 chat 的返回值相同）"""
+        async for chunk in _stream_turn(lambda: self.chat(user_input)):
+            yield chunk
+    
+    async def dispatch_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """执行模型返回的tool_calls（OpenAI格式）
+        
+        参数先解析JSON并按工具的schema校验，不合法的调用直接返回错误，不会分发给工具函数。
+        """
+        results = []
+        for call in tool_calls:
+            function = call.get("function", {})
+            name = function.get("name")
+            result = {"tool_call_id": call.get("id"), "name": name}
+            tool = self.tools.get(name)
+            if tool is None:
+                results.append({**result, "success": False, "error": f"未知工具 {name!r}"})
+                continue
+            
+            arguments = function.get("arguments") or {}
+            if isinstance(arguments, str):
+                try:
+                    arguments = json.loads(arguments)
+                except json.JSONDecodeError as e:
+                    results.append({**result, "success": False, "error": f"参数不是合法的JSON: {e}"})
+                    continue
+            error = tool.validate(arguments)
+            if error is not None:
+                results.append({**result, "success": False, "error": f"参数错误: {error}", "invalid_arguments": True})
+                continue
+            results.append({**result, **await _invoke_tool(tool, arguments)})
+        return results
+    
+    def _format_tool_results(self, results: List[Dict[str, Any]]) -> str:
+        """把工具调用结果整理为回复文本"""
+        lines = []
+        for result in results:
+            if result["success"]:
+                lines.append(f"{result['name']}: {result['result']}")
+            else:
+                lines.append(f"{result['name']} 调用失败：{result['error']}")
+        return "\n".join(lines)
+    
+    async def _check_and_use_tools(self, user_input: str, llm_response: str) -> Optional[str]:
+        """检查并使用工具"""
+        user_input_lower = user_input.lower()
+        
+        # 计算工具
+        if "calculator" in self.tools and any(
+            keyword in user_input_lower 
+            for keyword in ['计算', '算', '+', '-', '*', '/', '等于']
+        ):
+            # 提取数学表达式
+            math_pattern = r'[\d+\-*/().\s]+'
+            matches = re.findall(math_pattern, user_input)
+            
+            if matches:
+                expression = max(matches, key=len).strip()
+                result = await _execute_tool(self.tools["calculator"], expression=expression)
+                
+                if result["success"]:
+                    return f"计算结果：{expression} = {result['result']}"
+                else:
+                    return f"计算出错：{result['error']}"
+        
+        # 天气工具
+        if "weather" in self.tools and any(
+            keyword in user_input_lower 
+            for keyword in ['天气', '温度', '下雨', '晴天']
+        ):
+            # 提取城市名
+            cities = ["北京", "上海", "深圳", "广州", "杭州"]
+            city = None
+            for c in cities:
+                if c in user_input:
+                    city = c
+                    break
+            
+            if city:
+                result = await _execute_tool(self.tools["weather"], city=city)
+                
+                if result["success"]:
+                    weather = result["result"]
+                    return f"{city}的天气：{weather}"
+                else:
+                    return f"查询失败：{result['error']}"
+        
+        return None
+    
+    def get_conversation_summary(self) -> Dict[str, Any]:
+        """获取对话摘要"""
+        messages = [msg for msg in self.conversation_history if msg.role != "system"]
+        return {
+            "total_messages": len(messages),
+            "user_messages": len([m for m in messages if m.role == "user"]),
+            "assistant_messages": len([m for m in messages if m.role == "assistant"]),
+            "conversation_start": messages[0].timestamp if messages else None,
+            "conversation_end": messages[-1].timestamp if messages else None
+        }
+    
+    def export_conversation(self, filename: str):
+        """导出对话"""
+        conversation_data = {
+            "agent_name": self.name,
+            "summary": self.get_conversation_summary(),
+            "messages": [asdict(msg) for msg in self.conversation_history]
+        }
+        
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(conversation_data, f, ensure_ascii=False, indent=2)
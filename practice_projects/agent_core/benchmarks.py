@@ -0,0 +1,569 @@
+"""
+agent_core 性能基准测试
+
+用法: python -m agent_core.benchmarks [基准名称 ...]（在 practice_projects 目录下运行）
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 模拟路径上的首个响应：导入、创建代理并完成一轮对话
+MOCK_FIRST_RESPONSE = (
+    "import asyncio\n"
+    "from agent_core import MockLLMProvider, SmartAgent, calculator_tool\n"
+    "agent = SmartAgent(MockLLMProvider(latency=0))\n"
+    "agent.add_tool(calculator_tool())\n"
+    "print(asyncio.run(agent.chat('帮我计算 15 * 8 + 32')))\n"
+)
+
+def _run_python(code: str, *flags: str) -> Tuple[float, subprocess.CompletedProcess]:
+    """在新解释器中执行代码，返回 (从启动到退出的耗时, 进程结果)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=_PACKAGE_PARENT, capture_output=True, text=True
+    )
+    return time.perf_counter() - start, result
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """解析 -X importtime 输出，返回 (模块, 自身微秒, 累计微秒, 嵌套深度)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def benchmark_startup(runs: int = 10, target_ms: float = 100.0):
+    """启动基准：模拟路径从冷启动到首个响应的耗时，以及导入耗时最多的模块"""
+    print(f"🚀 启动基准测试（{runs} 次冷启动）")
+    
+    _, result = _run_python(MOCK_FIRST_RESPONSE, "-X", "importtime")
+    if result.returncode != 0:
+        print(result.stderr)
+        return
+    rows = parse_importtime(result.stderr)
+    loaded = {name for name, _, _, _ in rows}
+    top_level = sorted((r for r in rows if r[3] <= 1), key=lambda r: r[2], reverse=True)
+    print(f"   导入模块 {len(rows)} 个，aiohttp {'已加载' if 'aiohttp' in loaded else '未加载'}")
+    for name, _, cumulative_us, _ in top_level[:8]:
+        print(f"     {cumulative_us / 1000:7.1f} ms  {name}")
+    
+    def measure(code: str) -> Dict[str, float]:
+        timings = []
+        for _ in range(runs):
+            elapsed, result = _run_python(code)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1])
+            timings.append(elapsed * 1000)
+        return {"median": statistics.median(timings), "min": min(timings)}
+    
+    baseline = measure("pass")
+    mock = measure(MOCK_FIRST_RESPONSE)
+    print(f"   空解释器启动: 中位数 {baseline['median']:.1f} ms")
+    status = "✅" if mock["median"] < target_ms else "⚠️"
+    print(f"   {status} 模拟路径首个响应: 中位数 {mock['median']:.1f} ms，最快 {mock['min']:.1f} ms"
+          f"（目标 < {target_ms:.0f} ms）")
+    
+    try:
+        eager = measure("import agent_core.openai_provider\n" + MOCK_FIRST_RESPONSE)
+        print(f"   同时预先导入aiohttp: 中位数 {eager['median']:.1f} ms")
+    except RuntimeError as e:
+        print(f"   跳过预先导入aiohttp的对比（{e}）")
+
+def benchmark_validation(calls: int = 100_000):
+    """参数校验基准：编译后的校验闭包与逐次解释schema（以及jsonschema，如已安装）的单次开销"""
+    from .tools import CALCULATOR_PARAMETERS, calculator_tool
+    from .validation import compile_schema, validate_interpretive
+    
+    print(f"🛡️ 参数校验基准测试（每种情况 {calls:,} 次）")
+    nested = {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "minLength": 1, "maxLength": 200},
+            "limit": {"type": "integer", "minimum": 1, "maximum": 100},
+            "filters": {
+                "type": "array", "maxItems": 10,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "field": {"type": "string", "enum": ["city", "date", "source"]},
+                        "value": {"type": ["string", "number"]}
+                    },
+                    "required": ["field", "value"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["query"],
+        "additionalProperties": False
+    }
+    cases = [
+        ("calculator 合法", CALCULATOR_PARAMETERS, {"expression": "15 * 8 + 32"}),
+        ("calculator 缺参数", CALCULATOR_PARAMETERS, {"expr": "15 * 8"}),
+        ("嵌套schema 合法", nested, {"query": "北京天气", "limit": 5,
+                                     "filters": [{"field": "city", "value": "北京"}, {"field": "date", "value": 20240101}]}),
+        ("嵌套schema 非法", nested, {"query": "北京天气", "filters": [{"field": "weather", "value": "晴"}]}),
+    ]
+    
+    try:
+        import jsonschema
+    except ImportError:
+        jsonschema = None
+    
+    def per_call_us(func, value) -> float:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func(value)
+        return (time.perf_counter() - start) / calls * 1e6
+    
+    for label, schema, value in cases:
+        validate = compile_schema(schema)
+        compiled = per_call_us(validate, value)
+        interpretive = per_call_us(lambda v: validate_interpretive(schema, v), value)
+        line = f"   {label}: 编译 {compiled:.2f} µs，解释 {interpretive:.2f} µs（{interpretive / compiled:.1f} 倍）"
+        if jsonschema is not None:
+            validator = jsonschema.Draft7Validator(schema)
+            reference = per_call_us(lambda v: next(validator.iter_errors(v), None), value)
+            line += f"，jsonschema {reference:.2f} µs"
+        print(line)
+    
+    async def dispatch_overhead() -> Tuple[float, float]:
+        tool = calculator_tool()
+        arguments = {"expression": "1 + 2"}
+        start = time.perf_counter()
+        for _ in range(calls):
+            await tool.invoke(arguments)
+        unchecked = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(calls):
+            await tool.execute(**arguments)
+        checked = time.perf_counter() - start
+        return unchecked / calls * 1e6, checked / calls * 1e6
+    
+    unchecked, checked = asyncio.run(dispatch_overhead())
+    print(f"   calculator 执行: 不校验 {unchecked:.2f} µs/次，校验后执行 {checked:.2f} µs/次")
+
+def benchmark_calculator_batch(sizes: Tuple[int, ...] = (1_000, 10_000, 100_000, 1_000_000),
+                               max_sequential: int = 100_000):
+    """批量计算基准：逐个 CalculatorTool.execute 与向量化 execute_batch 的吞吐
+    
+    逐个计算在规模超过 max_sequential 时只计算前 max_sequential 个表达式并按比例估算。
+    计时前先批量计算一次，NumPy的导入时间（首次调用时发生）不计入各规模的结果。
+    """
+    import random
+    from .tools import CalculatorTool
+    
+    print("🧮 计算器批量求值基准测试")
+    rng = random.Random(0)
+    shapes = ["{} * {} + {}", "({} + {}) / {}", "{} - {} * {}", "{} / {} - {}", "{} ** 2 + {} // {}"]
+    
+    def operand() -> str:
+        roll = rng.random()
+        if roll < 0.02:
+            return "0"  # 产生一些除零错误
+        if roll < 0.8:
+            return str(rng.randint(1, 10_000))
+        return f"{rng.uniform(0, 1000):.3f}"
+    
+    async def run(expressions: List[str]) -> Tuple[float, float, int, int]:
+        tool = CalculatorTool()
+        sample = expressions[:max_sequential]
+        start = time.perf_counter()
+        sequential = [await tool.execute(expression) for expression in sample]
+        sequential_time = (time.perf_counter() - start) * len(expressions) / len(sample)
+        start = time.perf_counter()
+        batched = await tool.execute_batch(expressions)
+        batch_time = time.perf_counter() - start
+        mismatches = sum(1 for a, b in zip(sequential, batched) if a != b)
+        errors = sum(1 for result in batched if "error" in result)
+        return sequential_time, batch_time, mismatches, errors
+    
+    asyncio.run(CalculatorTool().execute_batch(["1 + 1"]))
+    for size in sizes:
+        expressions = [rng.choice(shapes).format(operand(), operand(), operand()) for _ in range(size)]
+        sequential_time, batch_time, mismatches, errors = asyncio.run(run(expressions))
+        estimated = "（估算）" if size > max_sequential else ""
+        print(f"   {size:>9,} 个表达式: 逐个 {size / sequential_time:>10,.0f}/秒{estimated}，"
+              f"批量 {size / batch_time:>10,.0f}/秒（{sequential_time / batch_time:.1f} 倍），"
+              f"错误 {errors}，结果不一致 {mismatches}")
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def benchmark_history_index(messages: int = 1_000_000, queries: int = 200, python_queries: int = 20):
+    """对话历史检索基准：索引 messages 条中英文混合消息的内存、更新延迟和BM25查询延迟
+    
+    词汇按Zipf分布抽样（常用词出现在大量消息中），模拟真实对话的词频分布。
+    """
+    import itertools
+    import random
+    from .retrieval import BM25Index, tokenize
+    
+    print(f"🔎 对话历史检索基准测试（{messages:,} 条消息）")
+    rng = random.Random(0)
+    chinese = ["".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(2)) for _ in range(5000)]
+    english = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, 5001)))
+    
+    def text(words: int) -> str:
+        parts = rng.choices(chinese, cum_weights=weights, k=words)
+        parts += rng.choices(english, cum_weights=weights, k=words // 3)
+        rng.shuffle(parts)
+        return " ".join(parts)
+    
+    index = BM25Index()
+    timings = []
+    text_bytes = 0
+    for doc_id in range(messages):
+        content = text(rng.randint(4, 20))
+        text_bytes += len(content.encode("utf-8"))
+        start = time.perf_counter()
+        index.add(doc_id, content)
+        timings.append(time.perf_counter() - start)
+    stats = index.get_stats()
+    print(f"   词项 {stats['terms']:,}，倒排记录 {stats['postings']:,}")
+    print(f"   索引内存 {stats['memory_bytes'] / 2**20:.1f} MB，每条消息 {stats['memory_bytes'] / messages:.0f} 字节"
+          f"（消息原文平均 {text_bytes / messages:.0f} 字节）")
+    print(f"   更新延迟: 平均 {statistics.mean(timings) * 1e6:.1f} µs，p50 {_percentile(timings, 0.5) * 1e6:.1f} µs，"
+          f"p99 {_percentile(timings, 0.99) * 1e6:.1f} µs")
+    
+    query_texts = [text(rng.randint(3, 9)) for _ in range(queries)]
+    for label, search, count in (
+        ("NumPy", lambda q: index.search(q, 5), queries),
+        ("纯Python", lambda q: index._search_python(
+            [t for t in set(tokenize(q)) if t in index.postings], 5, None), python_queries),
+    ):
+        timings = []
+        for query in query_texts[:count]:
+            start = time.perf_counter()
+            search(query)
+            timings.append(time.perf_counter() - start)
+        print(f"   查询延迟（{label}，{count} 次，top-5）: p50 {_percentile(timings, 0.5) * 1000:.2f} ms，"
+              f"p99 {_percentile(timings, 0.99) * 1000:.2f} ms")
+
+# 相似提示词缓存的回放语料：(意图, 说法模板)，同一意图的不同说法应该复用同一个回答
+PARAPHRASE_INTENTS = [
+    ("weather:{city}", [
+        "{city}今天天气怎么样？", "{city}天气如何", "请问{city}的天气", "{city}现在天气怎样",
+        "告诉我{city}今天的天气", "{city}的天气怎么样啊", "What's the weather in {city_en}?",
+        "weather in {city_en} today", "How is the weather in {city_en} now?",
+    ]),
+    ("temperature:{city}", ["{city}今天多少度", "{city}现在的温度是多少", "{city}温度怎么样"]),
+    ("calc:{a}+{b}", ["帮我计算 {a} + {b}", "{a}+{b}等于多少", "请计算{a} + {b}", "计算一下 {a}+{b}"]),
+    ("define:python", ["python是什么", "什么是python", "请问python是什么？", "What is Python?"]),
+    ("define:agent", ["AI代理是什么", "什么是AI代理", "AI代理是什么呢", "what is an ai agent"]),
+    ("howto:install", ["怎么安装openhands", "如何安装openhands", "openhands怎么安装？", "how to install openhands"]),
+    ("howto:docker", ["怎么用docker运行代理", "如何用docker运行代理", "用docker运行代理的方法"]),
+    ("greeting", ["你好", "你好呀", "您好", "hello", "hi"]),
+    ("thanks", ["谢谢", "谢谢你", "非常感谢", "thanks", "thank you"]),
+    ("joke", ["讲个笑话", "给我讲个笑话吧", "讲一个笑话", "tell me a joke"]),
+]
+CITIES = [("北京", "Beijing"), ("上海", "Shanghai"), ("深圳", "Shenzhen"), ("广州", "Guangzhou"),
+          ("杭州", "Hangzhou"), ("成都", "Chengdu"), ("武汉", "Wuhan"), ("南京", "Nanjing")]
+
+def _paraphrase_corpus(requests: int, tenants: int, seed: int = 0) -> List[Tuple[str, str, str]]:
+    """生成回放语料：(租户, 提示词, 意图)，意图按Zipf分布出现"""
+    import itertools
+    import random
+    rng = random.Random(seed)
+    intents = []
+    for intent, phrasings in PARAPHRASE_INTENTS:
+        if "{city}" in intent:
+            intents += [(intent.format(city=c), [p.format(city=c, city_en=e) for p in phrasings]) for c, e in CITIES]
+        elif "{a}" in intent:
+            for _ in range(200):
+                a, b = rng.randint(1, 99), rng.randint(1, 99)
+                intents.append((intent.format(a=a, b=b), [p.format(a=a, b=b) for p in phrasings]))
+        else:
+            intents.append((intent, phrasings))
+    rng.shuffle(intents)
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, len(intents) + 1)))
+    corpus = []
+    for _ in range(requests):
+        intent, phrasings = rng.choices(intents, cum_weights=weights)[0]
+        corpus.append((f"tenant-{rng.randrange(tenants)}", rng.choice(phrasings), intent))
+    return corpus
+
+async def benchmark_prompt_cache(requests: int = 5000, tenants: int = 3,
+                                 thresholds: Tuple[float, ...] = (0.5, 0.7, 0.8, 0.9, 1.0)):
+    """相似提示词缓存基准：在回放语料上统计命中率、精确率（命中的回答属于同一意图）和命中延迟
+    
+    理想命中率：同一租户之前出现过同一意图的请求比例；精确匹配：同一租户之前出现过完全相同提示词的比例。
+    """
+    from .messages import ChatMessage
+    from .prompt_cache import PromptSimilarityCache, SimilarityCachedProvider
+    from .providers import LLMProvider
+    
+    corpus = _paraphrase_corpus(requests, tenants)
+    intent_of = {prompt: intent for _, prompt, intent in corpus}
+    
+    class IntentProvider(LLMProvider):
+        """按提示词的意图作答的模拟提供商（不等待，只统计调用次数）"""
+        calls = 0
+        
+        async def chat_completion(self, messages, **kwargs):
+            IntentProvider.calls += 1
+            return {"success": True, "content": intent_of[messages[-1].content], "model": "mock-llm"}
+    
+    seen_intents, seen_prompts = set(), set()
+    possible = exact = 0
+    for tenant, prompt, intent in corpus:
+        possible += (tenant, intent) in seen_intents
+        exact += (tenant, prompt) in seen_prompts
+        seen_intents.add((tenant, intent))
+        seen_prompts.add((tenant, prompt))
+    print(f"🧠 相似提示词缓存基准测试（{requests:,} 个请求，{tenants} 个租户，{len(intent_of)} 种说法）")
+    print(f"   理想命中率 {possible / requests:.1%}，精确匹配缓存命中率 {exact / requests:.1%}")
+    
+    system = ChatMessage(role="system", content="你是一个有用的AI助手。")
+    for threshold in thresholds:
+        cache = PromptSimilarityCache(threshold=threshold)
+        providers = {}
+        hit_times, miss_times = [], []
+        correct = 0
+        for tenant, prompt, intent in corpus:
+            provider = providers.setdefault(tenant, SimilarityCachedProvider(IntentProvider(), cache, tenant))
+            messages = [system, ChatMessage(role="user", content=prompt)]
+            start = time.perf_counter()
+            response = await provider.chat_completion(messages, temperature=0.7)
+            elapsed = time.perf_counter() - start
+            if response.get("cached"):
+                hit_times.append(elapsed)
+                correct += response["content"] == intent
+            else:
+                miss_times.append(elapsed)
+        hits = len(hit_times)
+        precision = f"{correct / hits:.1%}" if hits else "-"
+        latency = f"p50 {_percentile(hit_times, 0.5) * 1e6:.0f} µs，p99 {_percentile(hit_times, 0.99) * 1e6:.0f} µs" if hits else "-"
+        print(f"   阈值 {threshold:.1f}（{cache.bands}×{cache.rows}）: 命中率 {hits / requests:.1%}，"
+              f"精确率 {precision}，召回 {correct / possible:.1%}，命中延迟 {latency}，"
+              f"未命中开销 p50 {_percentile(miss_times, 0.5) * 1e6:.0f} µs")
+
+async def benchmark_llm_scheduler(batch_requests: int = 2000, interactive_rate: float = 30.0,
+                                  duration: float = 4.0, max_concurrency: int = 8, latency: float = 0.02,
+                                  batch_deadline: float = 4.0):
+    """LLM请求调度基准：批量评估积压时交互请求的延迟，先进先出信号量与优先级调度器对比
+    
+    两个批量租户（权重3:1）在开始时一次提交全部请求，交互请求按泊松过程持续到达。
+    """
+    import random
+    from .llm_scheduler import LLMRequestScheduler, Priority, ScheduledProvider
+    from .messages import ChatMessage
+    from .providers import MockLLMProvider
+    
+    print(f"🚦 LLM请求调度基准测试（并发上限 {max_concurrency}，上游延迟 {latency * 1000:.0f} ms，"
+          f"{batch_requests} 个批量请求 + 每秒 {interactive_rate:.0f} 个交互请求）")
+    messages = [ChatMessage(role="user", content="你好")]
+    
+    async def run(mode: str):
+        upstream = MockLLMProvider(latency=latency)
+        scheduler = LLMRequestScheduler(max_concurrency, tenant_weights={"eval-a": 3, "eval-b": 1})
+        semaphore = asyncio.Semaphore(max_concurrency)
+        rng = random.Random(0)
+        interactive_latencies = []
+        completions: Dict[str, List[float]] = {"eval-a": [], "eval-b": []}
+        expired = 0
+        start = time.perf_counter()
+        
+        async def call(priority: Priority, tenant: str, deadline: Optional[float]):
+            if mode == "fifo":
+                async with semaphore:
+                    return await upstream.chat_completion(messages)
+            provider = ScheduledProvider(upstream, scheduler, priority, tenant, deadline)
+            return await provider.chat_completion(messages)
+        
+        async def batch(tenant: str):
+            nonlocal expired
+            response = await call(Priority.BATCH, tenant, batch_deadline)
+            if response.get("expired"):
+                expired += 1
+            else:
+                completions[tenant].append(time.perf_counter() - start)
+        
+        async def interactive(user: int):
+            begin = time.perf_counter()
+            await call(Priority.INTERACTIVE, f"user-{user}", None)
+            interactive_latencies.append(time.perf_counter() - begin)
+        
+        tasks = [asyncio.create_task(batch("eval-a" if i % 2 else "eval-b")) for i in range(batch_requests)]
+        elapsed = 0.0
+        while elapsed < duration:
+            await asyncio.sleep(rng.expovariate(interactive_rate))
+            elapsed = time.perf_counter() - start
+            tasks.append(asyncio.create_task(interactive(rng.randrange(10))))
+        await asyncio.gather(*tasks)
+        
+        window = duration / 2
+        shares = {tenant: sum(1 for t in times if t < window) for tenant, times in completions.items()}
+        label = "先进先出信号量" if mode == "fifo" else "优先级调度器"
+        print(f"   {label}: 交互 p50 {_percentile(interactive_latencies, 0.5) * 1000:.0f} ms，"
+              f"p99 {_percentile(interactive_latencies, 0.99) * 1000:.0f} ms，"
+              f"最大 {max(interactive_latencies) * 1000:.0f} ms（{len(interactive_latencies)} 个）")
+        print(f"      批量完成 {sum(map(len, completions.values()))}，过期丢弃 {expired}，"
+              f"前 {window:.0f} 秒完成 eval-a:eval-b = {shares['eval-a']}:{shares['eval-b']}，"
+              f"总耗时 {time.perf_counter() - start:.1f} 秒")
+        if mode == "scheduler":
+            print(f"      防饿死提升 {scheduler.get_stats()['promoted']} 次")
+    
+    for mode in ("fifo", "scheduler"):
+        await run(mode)
+
+async def benchmark_tool_streaming(turns: int = 200, head: float = 0.02, tail_scale: float = 0.05,
+                                   tail_cap: float = 2.0):
+    """流式工具基准：长尾工具下用户看到第一块输出的时间（TTFB），chat 与 chat_stream 对比
+    
+    模型返回一个tool_call，工具在 head 秒后产出第一段部分结果，之后的尾部耗时服从帕累托分布
+    （tail_scale × Pareto(1.5)，最长 tail_cap 秒）。各轮对话并发执行，两种方式使用相同的耗时序列。
+    """
+    import random
+    from .providers import LLMProvider
+    from .tools import PROGRESS, FunctionTool, ToolChunk
+    from .agents import RESPONSE, SmartAgent
+    
+    rng = random.Random(0)
+    tails = [min(tail_scale * rng.paretovariate(1.5), tail_cap) for _ in range(turns)]
+    
+    class ToolCallProvider(LLMProvider):
+        """总是要求调用 search 工具的模拟提供商（不等待）"""
+        
+        async def chat_completion(self, messages, **kwargs):
+            call = {"id": "call-1", "function": {"name": "search", "arguments": json.dumps({"turn": len(messages)})}}
+            return {"success": True, "content": "", "tool_calls": [call], "model": "mock-llm"}
+    
+    def make_tool(tail: float) -> FunctionTool:
+        async def search(turn: int):
+            yield ToolChunk(PROGRESS, "正在检索")
+            await asyncio.sleep(head)
+            yield "前几条结果"
+            await asyncio.sleep(tail)
+            yield "剩余结果"
+        parameters = {"type": "object", "properties": {"turn": {"type": "integer"}}, "required": ["turn"]}
+        return FunctionTool("search", "检索（长尾耗时）", parameters, search)
+    
+    def make_agent(tail: float) -> SmartAgent:
+        agent = SmartAgent(ToolCallProvider())
+        agent.add_tool(make_tool(tail))
+        return agent
+    
+    async def blocking(tail: float) -> Tuple[float, float]:
+        start = time.perf_counter()
+        await make_agent(tail).chat("检索资料")
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed
+    
+    async def streaming(tail: float) -> Tuple[float, float]:
+        start = time.perf_counter()
+        first = None
+        async for chunk in make_agent(tail).chat_stream("检索资料"):
+            if first is None and chunk.kind != PROGRESS:
+                first = time.perf_counter() - start
+            if chunk.kind == RESPONSE:
+                return first, time.perf_counter() - start
+    
+    print(f"📡 流式工具基准测试（{turns} 轮并发对话，首段 {head * 1000:.0f} ms，"
+          f"尾部 p50 {_percentile(tails, 0.5) * 1000:.0f} ms / p99 {_percentile(tails, 0.99) * 1000:.0f} ms）")
+    for label, run in (("chat（等待完整回复）", blocking), ("chat_stream（转发部分结果）", streaming)):
+        results = await asyncio.gather(*(run(tail) for tail in tails))
+        ttfb = [first for first, _ in results]
+        total = [elapsed for _, elapsed in results]
+        print(f"   {label}: 首块 p50 {_percentile(ttfb, 0.5) * 1000:.1f} ms，p99 {_percentile(ttfb, 0.99) * 1000:.1f} ms；"
+              f"完整回复 p50 {_percentile(total, 0.5) * 1000:.1f} ms，p99 {_percentile(total, 0.99) * 1000:.1f} ms")
+
+async def benchmark_coalescing(requests: int = 3000, rate: float = 2000.0, warmup_share: float = 0.3,
+                               latency: float = 0.05, windows: Tuple[float, ...] = (0.002, 0.005, 0.01)):
+    """请求合并基准：并发会话同时发出请求时节省的上游调用数和增加的排队延迟
+    
+    请求按泊松过程到达；warmup_share 的请求是相同的系统提示词预热请求，其余请求各不相同。
+    模拟提供商的批量接口整批只有一次延迟。
+    """
+    import random
+    from .coalescing import CoalescingProvider
+    from .messages import ChatMessage
+    from .providers import MockLLMProvider
+    
+    class CountingProvider(MockLLMProvider):
+        """统计上游请求数的模拟提供商"""
+        
+        def __init__(self):
+            super().__init__(latency=latency)
+            self.calls = 0
+        
+        async def chat_completion(self, messages, **kwargs):
+            self.calls += 1
+            return await super().chat_completion(messages, **kwargs)
+        
+        async def batch_chat_completion(self, requests):
+            self.calls += 1
+            return await super().batch_chat_completion(requests)
+    
+    system = ChatMessage(role="system", content="你是一个有用的AI助手。")
+    rng = random.Random(0)
+    workload = []
+    for i in range(requests):
+        prompt = "预热" if rng.random() < warmup_share else f"第 {i} 个问题"
+        workload.append((rng.expovariate(rate), [system, ChatMessage(role="user", content=prompt)]))
+    
+    print(f"🔗 请求合并基准测试（{requests} 个请求，每秒 {rate:.0f} 个，{warmup_share:.0%} 为相同的预热请求，"
+          f"上游延迟 {latency * 1000:.0f} ms）")
+    configs = [("直接调用", None, False), ("只去重", 0.0, False)]
+    configs += [(f"去重 + 攒批 {window * 1000:g} ms", window, True) for window in windows]
+    for label, window, batch in configs:
+        upstream = CountingProvider()
+        provider = upstream if window is None else CoalescingProvider(upstream, window=window, batch=batch)
+        latencies = []
+        
+        async def call(messages):
+            begin = time.perf_counter()
+            await provider.chat_completion(messages, temperature=0.7)
+            latencies.append(time.perf_counter() - begin)
+        
+        tasks = []
+        for gap, messages in workload:
+            await asyncio.sleep(gap)
+            tasks.append(asyncio.create_task(call(messages)))
+        await asyncio.gather(*tasks)
+        line = (f"   {label}: 上游调用 {upstream.calls}（节省 {1 - upstream.calls / requests:.1%}），"
+                f"延迟 p50 {_percentile(latencies, 0.5) * 1000:.1f} ms，p99 {_percentile(latencies, 0.99) * 1000:.1f} ms")
+        if window is not None:
+            stats = provider.get_stats()
+            line += (f"；去重 {stats['deduplicated']}，{stats['batches']} 批共 {stats['batched_requests']} 个请求，"
+                     f"排队 p50 {stats['wait_p50'] * 1000:.1f} ms，p99 {stats['wait_p99'] * 1000:.1f} ms")
+        print(line)
+
+# 性能基准测试（名称 -> 函数；协程函数会在新的事件循环中运行）
+BENCHMARKS = {
+    "startup": benchmark_startup,
+    "validation": benchmark_validation,
+    "calculator_batch": benchmark_calculator_batch,
+    "history_index": benchmark_history_index,
+    "prompt_cache": benchmark_prompt_cache,
+    "llm_scheduler": benchmark_llm_scheduler,
+    "tool_streaming": benchmark_tool_streaming,
+    "coalescing": benchmark_coalescing,
+}
+
+def main(argv: List[str]):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"未知基准 {name}，可选: {', '.join(BENCHMARKS)}")
+            continue
+        result = BENCHMARKS[name]()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        print()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
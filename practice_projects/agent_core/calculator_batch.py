@@ -0,0 +1,246 @@
+"""
+计算器批量求值：按表达式结构分组，每组用NumPy数组运算一次算完
+
+- 表达式中的数字替换为占位符得到结构模板，同一结构（且各操作数的整数/浮点类型相同）归为一组
+- 每种模板只解析一次，编译为对操作数列做数组运算的函数
+- 整数按int64计算并用浮点影子值检测溢出；除零、溢出、非有限值等无法保证与逐个eval
+  结果一致的元素回退到 evaluate_expression，因此结果和错误信息与逐个计算完全相同
+- 浮点乘方逐元素调用Python的乘方（NumPy的向量化pow与C库结果可能相差1个ULP）
+- 未安装NumPy时全部逐个计算
+"""
+
+import ast
+import functools
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .tools import evaluate_expression, function_error_message
+
+# 单个结果: (值, 错误信息)，成功时错误信息为None
+BatchResult = Tuple[Any, Optional[str]]
+
+_NUMBER = re.compile(r"[0-9]+(?:\.[0-9]*)?|\.[0-9]+")
+_FLOAT = re.compile(r"[0-9]+\.[0-9]*|\.[0-9]+")
+_INT = re.compile(r"[0-9]+")
+_ALLOWED = re.compile(r"[0-9+\-*/().\s]*")  # 与 ALLOWED_EXPRESSION_CHARS 相同的字符集
+_MAX_LITERAL = 18  # 更长的数字字面量（整数可能超出int64）不参与向量化
+_INT_LIMIT = 2 ** 62  # int64运算的安全范围，中间结果超出时回退到Python整数
+_EXACT_FLOAT_INT = 2 ** 53  # 两个整数相除时，超出此范围的操作数转换为浮点会损失精度
+MIN_GROUP_SIZE = 16  # 小于此规模的分组直接逐个计算，解析模板和建数组的开销不划算
+
+# 数组运算函数: 操作数列 -> (结果数组, 需要回退的元素掩码或None)
+_Evaluator = Callable[[List[Any]], Tuple[Any, Any]]
+
+class _Unsupported(Exception):
+    """模板包含不支持向量化的语法"""
+
+def _compile_node(node: ast.AST, slots: Dict[int, int], kinds: str, np) -> Tuple[_Evaluator, bool]:
+    """把模板AST节点编译为数组运算函数，返回 (函数, 结果是否为整数)"""
+    if isinstance(node, ast.Name):
+        index = slots[id(node)]
+        return (lambda cols: (cols[index], None)), kinds[index] == "x"
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand, is_int = _compile_node(node.operand, slots, kinds, np)
+        if isinstance(node.op, ast.UAdd):
+            return operand, is_int
+
+        def negate(cols):
+            values, bad = operand(cols)
+            return np.negative(values), bad
+        return negate, is_int
+
+    if not isinstance(node, ast.BinOp):
+        raise _Unsupported(type(node).__name__)
+
+    left, left_int = _compile_node(node.left, slots, kinds, np)
+    right, right_int = _compile_node(node.right, slots, kinds, np)
+    op = type(node.op)
+    if op not in (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Pow):
+        raise _Unsupported(op.__name__)
+
+    if left_int and right_int and op is not ast.Div:
+        int_ops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+                   ast.FloorDiv: np.floor_divide, ast.Pow: np.power}
+        float_ops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+                     ast.FloorDiv: np.true_divide, ast.Pow: np.power}
+        int_op, float_op = int_ops[op], float_ops[op]
+
+        def int_binop(cols):
+            a, bad_a = left(cols)
+            b, bad_b = right(cols)
+            # 用浮点影子值判断int64是否会溢出；整除除零和负指数交给Python处理
+            with np.errstate(all="ignore"):
+                shadow = float_op(a.astype(np.float64), b.astype(np.float64))
+            bad = ~(np.abs(shadow) < _INT_LIMIT)
+            if op is ast.FloorDiv:
+                bad |= b == 0
+            elif op is ast.Pow:
+                bad |= b < 0
+            safe_b = np.where(bad, 1, b) if op in (ast.FloorDiv, ast.Pow) else b
+            values = int_op(np.where(bad, 0, a), safe_b)
+            return values, _merge(bad, bad_a, bad_b)
+        return int_binop, True
+
+    float_ops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+                 ast.Div: np.true_divide, ast.FloorDiv: np.floor_divide, ast.Pow: _python_power(np)}
+    float_op = float_ops[op]
+    exact_division = op is ast.Div and left_int and right_int
+
+    def float_binop(cols):
+        a, bad_a = left(cols)
+        b, bad_b = right(cols)
+        bad = _merge(None, bad_a, bad_b)
+        if exact_division:
+            # Python对整数做精确除法；只有操作数都能精确表示为浮点时结果才一致
+            inexact = (np.abs(a) >= _EXACT_FLOAT_INT) | (np.abs(b) >= _EXACT_FLOAT_INT)
+            bad = inexact if bad is None else bad | inexact
+        a = a.astype(np.float64, copy=False)
+        b = b.astype(np.float64, copy=False)
+        with np.errstate(all="ignore"):
+            values = float_op(a, b)
+        # 除零、溢出、复数结果等：Python会抛出异常或给出不同的值，回退逐个计算
+        invalid = ~np.isfinite(values)
+        if op in (ast.Div, ast.FloorDiv):
+            invalid |= b == 0
+        bad = invalid if bad is None else bad | invalid
+        return values, bad
+    return float_binop, False
+
+def _python_power(np):
+    """逐元素的Python浮点乘方；抛出异常或得到复数的元素返回NaN，随后回退逐个计算"""
+    def power(a, b):
+        values = []
+        for x, y in zip(a.tolist(), b.tolist()):
+            try:
+                value = x ** y
+            except (OverflowError, ZeroDivisionError):
+                value = float("nan")
+            values.append(value if isinstance(value, float) else float("nan"))
+        return np.array(values, dtype=np.float64)
+    return power
+
+def _merge(bad, *others):
+    for other in others:
+        if other is None:
+            continue
+        bad = other if bad is None else bad | other
+    return bad
+
+@functools.lru_cache(maxsize=1024)
+def _compile_template(template: str, kinds: str) -> Optional[_Evaluator]:
+    """解析结构模板并编译（结果按模板缓存），语法错误或不支持时返回None"""
+    import numpy as np
+    try:
+        tree = ast.parse(template, mode="eval")
+    except SyntaxError:
+        return None
+    names = sorted(
+        (node for node in ast.walk(tree) if isinstance(node, ast.Name)),
+        key=lambda node: (node.lineno, node.col_offset)
+    )
+    if [node.id for node in names] != list(kinds):
+        return None
+    slots = {id(node): i for i, node in enumerate(names)}
+    try:
+        evaluator, _ = _compile_node(tree.body, slots, kinds, np)
+    except _Unsupported:
+        return None
+    return evaluator
+
+def _scalar(expression: str) -> BatchResult:
+    try:
+        return evaluate_expression(expression), None
+    except ValueError as e:
+        return None, str(e)
+
+def _screen(expressions: List[str]) -> Tuple[str, List[int]]:
+    """把表达式拼成一段文本，供正则一次处理全部表达式
+
+    含换行或不允许字符的表达式不参与向量化，它们在文本中替换为空行。
+    这些表达式很少见，先对整段文本检查一次，只有发现问题时才逐个检查。
+    """
+    text = "\n".join(expressions)
+    if text.count("\n") == len(expressions) - 1 and _ALLOWED.fullmatch(text):
+        return text, []
+
+    screened = list(expressions)
+    rejected = []
+    for i, expression in enumerate(expressions):
+        if "\n" in expression or not _ALLOWED.fullmatch(expression):
+            screened[i] = ""
+            rejected.append(i)
+    return "\n".join(screened), rejected
+
+def _unsupported_literals(numbers: List[str], np):
+    """找出不参与向量化的字面量：前导零整数（Python中是语法错误）和过长的数字"""
+    lengths = np.fromiter(map(len, numbers), dtype=np.int64, count=len(numbers))
+    literals = np.array(numbers, dtype=f"S{_MAX_LITERAL}")
+    chars = literals.view(np.uint8).reshape(-1, _MAX_LITERAL)
+    leading_zero = (chars[:, 0] == ord("0")) & (chars[:, 1] >= ord("0")) & (chars[:, 1] <= ord("9"))
+    return literals, np.flatnonzero(leading_zero | (lengths > _MAX_LITERAL))
+
+def evaluate_batch(expressions: List[str]) -> List[BatchResult]:
+    """批量计算算术表达式，返回与输入顺序一致的 (值, 错误信息) 列表"""
+    try:
+        import numpy as np
+    except ImportError:
+        return [_scalar(expression) for expression in expressions]
+    if not expressions:
+        return []
+
+    results: List[Optional[BatchResult]] = [None] * len(expressions)
+    text, fallback = _screen(expressions)
+
+    # 模板中浮点数替换为y、整数替换为x，同一模板的表达式结构和操作数类型都相同
+    templates = _INT.sub("x", _FLOAT.sub("y", text)).split("\n")
+    template_ids: Dict[str, int] = {}
+    ids = np.array([template_ids.setdefault(t, len(template_ids)) for t in templates], dtype=np.int64)
+    unique = list(template_ids)
+    slot_counts = np.array([len(t) - len(t.replace("x", "").replace("y", "")) for t in unique], dtype=np.int64)
+    # 全部数字字面量（按出现顺序），每个表达式的字面量从 starts[i] 开始
+    literals, unsupported = _unsupported_literals(_NUMBER.findall(text), np)
+    counts = slot_counts[ids]
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    rejected = np.zeros(len(expressions), dtype=bool)
+    if len(unsupported):
+        rejected[np.searchsorted(ends, unsupported, side="right")] = True
+        fallback.extend(np.flatnonzero(rejected).tolist())
+
+    order = np.argsort(ids, kind="stable")
+    boundaries = np.concatenate(([0], np.cumsum(np.bincount(ids, minlength=len(unique)))))
+    for template_id, template in enumerate(unique):
+        indices = order[boundaries[template_id]:boundaries[template_id + 1]]
+        indices = indices[~rejected[indices]]
+        kinds = "".join(c for c in template if c in "xy")
+        evaluator = _compile_template(template, kinds) if len(indices) >= MIN_GROUP_SIZE and kinds else None
+        if evaluator is None:
+            fallback.extend(indices.tolist())
+            continue
+
+        offsets = starts[indices]
+        cols = [
+            literals[offsets + k].astype(np.int64 if kind == "x" else np.float64)
+            for k, kind in enumerate(kinds)
+        ]
+        values, bad = evaluator(cols)
+        if bad is None:
+            good_indices, good_values = indices, values
+        else:
+            good_indices, good_values = indices[~bad], values[~bad]
+            fallback.extend(indices[bad].tolist())
+        for index, value in zip(good_indices.tolist(), good_values.tolist()):
+            results[index] = (value, None)
+
+    for index in fallback:
+        if results[index] is None:
+            results[index] = _scalar(expressions[index])
+    return results
+
+def calculator_function_batch(arguments_list: List[Dict[str, Any]]) -> List[BatchResult]:
+    """calculator_function 的批量版本（FunctionTool 的 batch_function），结果值为字符串"""
+    return [
+        (str(value), None) if error is None else (None, function_error_message(error))
+        for value, error in evaluate_batch([arguments["expression"] for arguments in arguments_list])
+    ]
@@ -0,0 +1,161 @@
+"""
+请求合并：在 LLMProvider 前对 chat_completion 做在途去重和微批处理
+
+- 在途去重：消息和调用参数完全相同的请求正在执行时，新请求不再发往上游，
+  等待同一个结果（结果带 deduplicated=True）
+- 微批处理：下层提供商支持批量接口（supports_batch）时，第一个请求到达后等待 window 秒，
+  期间到达的请求（最多 max_batch 个）通过 batch_chat_completion 一次发出；
+  不支持批量接口时请求立即逐个发出，只做去重
+- 上游调用在独立的任务中执行，某个调用方被取消不影响等待同一结果的其他调用方
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .messages import ChatMessage
+from .providers import LLMProvider
+
+def request_key(messages: List[ChatMessage], kwargs: Dict[str, Any]) -> str:
+    """请求的指纹：全部消息（角色和内容，不含时间戳）和调用参数"""
+    payload = json.dumps(
+        [[message.role, message.content] for message in messages] + [kwargs],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+class CoalescingProvider(LLMProvider):
+    """合并相同的在途请求，并把短时间窗口内的并发请求攒成一批发给上游
+
+    batch 为None时按下层提供商的 supports_batch 决定是否攒批；window 为攒批等待的秒数。
+    注意：temperature 大于0时相同请求本可以得到不同的回答，去重后所有调用方得到同一个回答。
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        window: float = 0.005,
+        max_batch: int = 32,
+        batch: Optional[bool] = None,
+        wait_samples: int = 10_000
+    ):
+        self.provider = provider
+        self.window = window
+        self.max_batch = max_batch
+        self.batch = provider.supports_batch if batch is None else batch
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pending: List[Tuple[List[ChatMessage], Dict[str, Any], asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()  # 正在执行的上游调用（保持引用，避免任务被回收）
+        # 统计
+        self.requests = 0
+        self.deduplicated = 0
+        self.upstream_calls = 0  # 单个调用和批量调用各算一次
+        self.batches = 0
+        self.batched_requests = 0
+        self._waits: Deque[float] = deque(maxlen=wait_samples)  # 攒批增加的排队时间（秒）
+
+    async def chat_completion(self, messages: List[ChatMessage], **kwargs) -> Dict[str, Any]:
+        self.requests += 1
+        key = request_key(messages, kwargs)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return {**await asyncio.shield(future), "deduplicated": True}
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        if self.batch and self.window > 0:
+            self._enqueue(messages, kwargs, future)
+        else:
+            self._start(self._call_single(messages, kwargs, future))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            future.exception()  # 所有调用方都已取消时避免"exception was never retrieved"警告
+
+    def _start(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _enqueue(self, messages: List[ChatMessage], kwargs: Dict[str, Any], future: asyncio.Future):
+        self._pending.append((messages, kwargs, future, time.monotonic()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        """把攒下的请求发往上游（只有一个请求时走单个调用）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        now = time.monotonic()
+        for *_, enqueued_at in pending:
+            self._waits.append(now - enqueued_at)
+        if len(pending) == 1:
+            messages, kwargs, future, _ = pending[0]
+            self._start(self._call_single(messages, kwargs, future))
+        elif pending:
+            self._start(self._call_batch(pending))
+
+    async def _call_single(self, messages: List[ChatMessage], kwargs: Dict[str, Any], future: asyncio.Future):
+        self.upstream_calls += 1
+        try:
+            response = await self.provider.chat_completion(messages, **kwargs)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(response)
+
+    async def _call_batch(self, pending: List[Tuple[List[ChatMessage], Dict[str, Any], asyncio.Future, float]]):
+        self.upstream_calls += 1
+        self.batches += 1
+        self.batched_requests += len(pending)
+        futures = [future for _, _, future, _ in pending]
+        try:
+            responses = await self.provider.batch_chat_completion([(messages, kwargs) for messages, kwargs, _, _ in pending])
+            if len(responses) != len(pending):
+                raise RuntimeError(f"批量接口返回 {len(responses)} 个结果，请求了 {len(pending)} 个")
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, response in zip(futures, responses):
+            if not future.done():
+                future.set_result(response)
+
+    @property
+    def supports_batch(self) -> bool:
+        return self.provider.supports_batch
+
+    @property
+    def accepts_tenant(self) -> bool:
+        return self.provider.accepts_tenant  # 调用参数原样转发给下层提供商
+
+    def get_stats(self) -> Dict[str, Any]:
+        """合并统计：节省的上游调用数和攒批增加的排队时间（秒）"""
+        waits = sorted(self._waits)
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "upstream_calls": self.upstream_calls,
+            "saved_calls": self.deduplicated + self.batched_requests - self.batches,
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p99": waits[min(int(len(waits) * 0.99), len(waits) - 1)] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
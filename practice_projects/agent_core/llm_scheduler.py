@@ -0,0 +1,322 @@
+"""
+LLM请求调度器：所有调用方共享的进程级调度器，放在 LLMProvider.chat_completion 之前
+
+- 优先级：INTERACTIVE（交互）> NORMAL > BATCH（批量评估等后台任务），高优先级先执行
+- 同一优先级内按租户加权公平排队（WFQ）：每个请求按 cost / 租户权重 计算虚拟完成时间，
+  虚拟完成时间最早的先执行，某个租户一次提交大量请求也不会挤占其他租户
+- 并发上限：同时在执行的请求数不超过 max_concurrency
+- 防饿死：等待超过 starvation_after 秒的请求不论优先级最先执行
+- 截止时间：超过截止时间仍未得到执行机会的请求直接丢弃（抛出 DeadlineExceeded），
+  不再占用上游配额
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .messages import ChatMessage
+from .providers import LLMProvider
+
+class Priority(IntEnum):
+    """请求优先级（数值越小越优先）"""
+    INTERACTIVE = 0
+    NORMAL = 1
+    BATCH = 2
+
+class DeadlineExceeded(TimeoutError):
+    """请求在截止时间前没有得到执行机会"""
+
+@dataclass(eq=False)
+class _Request:
+    priority: Priority
+    tenant: str
+    start_tag: float
+    finish_tag: float
+    enqueued_at: float
+    future: asyncio.Future
+    state: str = "waiting"  # waiting, granted, expired, cancelled
+
+class LLMRequestScheduler:
+    """优先级 + 租户加权公平排队的并发调度器（在单个事件循环中使用）"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        starvation_after: float = 5.0,
+        wait_samples: int = 10_000
+    ):
+        self.max_concurrency = max_concurrency
+        self.tenant_weights = dict(tenant_weights or {})  # 未配置的租户权重为1
+        self.starvation_after = starvation_after
+        self._active = 0
+        self._waiting = 0
+        self._seq = itertools.count()
+        # 每个优先级: 按虚拟完成时间排序的堆，以及按到达顺序排列的队列（用于防饿死）
+        self._queues: Dict[Priority, List[Tuple[float, int, _Request]]] = {p: [] for p in Priority}
+        self._arrivals: Dict[Priority, Deque[_Request]] = {p: deque() for p in Priority}
+        self._virtual_time: Dict[Priority, float] = {p: 0.0 for p in Priority}
+        self._last_finish: Dict[Tuple[Priority, str], float] = {}
+        # 统计
+        self._waits: Dict[Priority, Deque[float]] = {p: deque(maxlen=wait_samples) for p in Priority}
+        self._granted: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._expired: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._promoted = 0
+
+    async def acquire(
+        self,
+        priority: Priority = Priority.NORMAL,
+        tenant: str = "default",
+        deadline: Optional[float] = None,
+        cost: float = 1.0
+    ):
+        """等待执行名额（之后必须调用 release）；deadline 为相对当前时间的秒数，到期仍未轮到时抛出 DeadlineExceeded"""
+        priority = Priority(priority)
+        now = time.monotonic()
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            self._granted[priority] += 1
+            self._waits[priority].append(0.0)
+            return
+
+        key = (priority, tenant)
+        start_tag = max(self._virtual_time[priority], self._last_finish.get(key, 0.0))
+        finish_tag = start_tag + cost / self.tenant_weights.get(tenant, 1.0)
+        self._last_finish[key] = finish_tag
+        loop = asyncio.get_running_loop()
+        request = _Request(priority, tenant, start_tag, finish_tag, now, loop.create_future())
+        heapq.heappush(self._queues[priority], (finish_tag, next(self._seq), request))
+        self._arrivals[priority].append(request)
+        self._waiting += 1
+
+        timer = loop.call_later(deadline, self._expire, request) if deadline is not None else None
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            if request.state == "granted":
+                self.release()
+            elif request.state == "waiting":
+                request.state = "cancelled"
+                self._waiting -= 1
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def release(self):
+        """归还执行名额，并把名额交给下一个请求"""
+        self._active -= 1
+        self._dispatch()
+
+    def limiter(
+        self,
+        priority: Priority = Priority.NORMAL,
+        tenant: str = "default",
+        deadline: Optional[float] = None
+    ) -> "SchedulerSlot":
+        """返回可重复使用的 async with 限流器（可以替代 asyncio.Semaphore）"""
+        return SchedulerSlot(self, priority, tenant, deadline)
+
+    def _expire(self, request: _Request):
+        if request.state != "waiting":
+            return
+        request.state = "expired"
+        self._waiting -= 1
+        self._expired[request.priority] += 1
+        request.future.set_exception(DeadlineExceeded(
+            f"{request.priority.name} 请求（租户 {request.tenant}）等待 "
+            f"{time.monotonic() - request.enqueued_at:.2f} 秒后超过截止时间"
+        ))
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._waiting:
+            request = self._next_request()
+            request.state = "granted"
+            self._waiting -= 1
+            self._active += 1
+            self._virtual_time[request.priority] = max(self._virtual_time[request.priority], request.start_tag)
+            self._granted[request.priority] += 1
+            self._waits[request.priority].append(time.monotonic() - request.enqueued_at)
+            request.future.set_result(None)
+
+    def _next_request(self) -> _Request:
+        """选择下一个请求：先是等待过久的请求（最早到达的优先），然后按优先级和虚拟完成时间"""
+        now = time.monotonic()
+        oldest = None
+        for arrivals in self._arrivals.values():
+            while arrivals and arrivals[0].state != "waiting":
+                arrivals.popleft()
+            if arrivals and (oldest is None or arrivals[0].enqueued_at < oldest.enqueued_at):
+                oldest = arrivals[0]
+        if oldest is not None and now - oldest.enqueued_at >= self.starvation_after:
+            if oldest.priority != Priority.INTERACTIVE:
+                self._promoted += 1
+            return oldest
+
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue:
+                _, _, request = heapq.heappop(queue)
+                if request.state == "waiting":
+                    return request
+        raise RuntimeError("等待计数与队列不一致")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """调度统计：每个优先级的执行数、丢弃数和排队时间分位数（秒）"""
+        classes = {}
+        for priority in Priority:
+            waits = sorted(self._waits[priority])
+            classes[priority.name.lower()] = {
+                "granted": self._granted[priority],
+                "expired": self._expired[priority],
+                "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p99": waits[min(int(len(waits) * 0.99), len(waits) - 1)] if waits else 0.0,
+                "wait_max": waits[-1] if waits else 0.0,
+            }
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "promoted": self._promoted,
+            "classes": classes,
+        }
+
+class SchedulerSlot:
+    """调度器的 async with 限流器：进入时按固定的优先级、租户和截止时间排队"""
+
+    def __init__(self, scheduler: LLMRequestScheduler, priority: Priority, tenant: str, deadline: Optional[float]):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.priority, self.tenant, self.deadline)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.scheduler.release()
+        return False
+
+_default_scheduler: Optional[LLMRequestScheduler] = None
+
+def get_default_scheduler() -> LLMRequestScheduler:
+    """进程级共享的调度器（第一次调用时创建）"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = LLMRequestScheduler()
+    return _default_scheduler
+
+def set_default_scheduler(scheduler: LLMRequestScheduler):
+    """替换进程级共享的调度器（例如调整并发上限）"""
+    global _default_scheduler
+    _default_scheduler = scheduler
+
+class ScheduledProvider(LLMProvider):
+    """经过调度器调用下层提供商
+
+    priority、tenant、deadline 可以在构造时设置默认值，也可以在每次 chat_completion 时传入；
+    超过截止时间的请求返回 {"success": False, "expired": True, ...}，不会发给下层提供商。
+    下层提供商支持批量接口时，一批请求只占用一个执行名额（按整批的请求数计入租户的公平份额）。
+    """
+
+    accepts_tenant = True
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        scheduler: Optional[LLMRequestScheduler] = None,
+        priority: Priority = Priority.NORMAL,
+        tenant: str = "default",
+        deadline: Optional[float] = None
+    ):
+        self.provider = provider
+        self.scheduler = scheduler if scheduler is not None else get_default_scheduler()
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+
+    async def chat_completion(
+        self,
+        messages: List[ChatMessage],
+        priority: Optional[Priority] = None,
+        tenant: Optional[str] = None,
+        deadline: Optional[float] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        try:
+            await self.scheduler.acquire(
+                self.priority if priority is None else priority,
+                tenant or self.tenant,
+                self.deadline if deadline is None else deadline
+            )
+        except DeadlineExceeded as e:
+            return {"success": False, "error": f"请求已丢弃：{e}", "expired": True}
+        try:
+            return await self.provider.chat_completion(messages, **kwargs)
+        finally:
+            self.scheduler.release()
+
+    @property
+    def supports_batch(self) -> bool:
+        return self.provider.supports_batch
+
+    async def batch_chat_completion(
+        self,
+        requests: List[Tuple[List[ChatMessage], Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """整批只申请一个名额：取批内最高的优先级和最晚的截止时间；
+        得到名额时已经超过自身截止时间的请求单独返回过期结果，其余请求一次发给下层提供商
+        """
+        if not self.supports_batch:
+            return await super().batch_chat_completion(requests)
+        if not requests:
+            return []
+        options = []
+        for _, kwargs in requests:
+            kwargs = dict(kwargs)
+            priority = kwargs.pop("priority", None)
+            tenant = kwargs.pop("tenant", None)
+            deadline = kwargs.pop("deadline", None)
+            options.append((
+                self.priority if priority is None else Priority(priority),
+                tenant or self.tenant,
+                self.deadline if deadline is None else deadline,
+                kwargs
+            ))
+        tenants = {tenant for _, tenant, _, _ in options}
+        deadlines = [deadline for _, _, deadline, _ in options]
+        start = time.monotonic()
+        try:
+            await self.scheduler.acquire(
+                min(priority for priority, _, _, _ in options),
+                tenants.pop() if len(tenants) == 1 else self.tenant,
+                None if None in deadlines else max(deadlines),
+                cost=len(requests)
+            )
+        except DeadlineExceeded as e:
+            return [{"success": False, "error": f"请求已丢弃：{e}", "expired": True} for _ in requests]
+
+        try:
+            waited = time.monotonic() - start
+            results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+            live = []
+            for i, ((messages, _), (priority, tenant, deadline, kwargs)) in enumerate(zip(requests, options)):
+                if deadline is not None and waited > deadline:
+                    results[i] = {
+                        "success": False, "expired": True,
+                        "error": f"请求已丢弃：{priority.name} 请求（租户 {tenant}）等待 {waited:.2f} 秒后超过截止时间",
+                    }
+                else:
+                    live.append((i, (messages, kwargs)))
+            if live:
+                responses = await self.provider.batch_chat_completion([request for _, request in live])
+                for (i, _), response in zip(live, responses):
+                    results[i] = response
+            return results
+        finally:
+            self.scheduler.release()
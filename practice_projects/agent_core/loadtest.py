@@ -0,0 +1,452 @@
+"""
+开环压力测试：本地 OpenAI 兼容替身服务 + 按目标到达率驱动 SmartAgent 会话的负载生成器
+
+- 替身服务（aiohttp）实现 POST /v1/chat/completions，支持 stream=true（SSE分块），
+  延迟服从可配置的分布，可按比例返回 5xx 错误和 429（带 Retry-After）
+- 负载生成器是开环的：请求按泊松过程在预定时间到达，不等待之前的请求完成；
+  所有会话都在忙时请求排队等待空闲会话，延迟从预定到达时间开始计算（排队时间计入延迟）
+- 报告吞吐、延迟 p50/p95/p99、按类型统计的错误，以及客户端进程每个请求消耗的CPU时间
+  （不指定 --base-url 时替身服务在子进程中运行，不计入客户端CPU）
+
+用法（在 practice_projects 目录下运行，需要安装aiohttp）:
+  python -m agent_core.loadtest serve [--port 8400] [--latency lognormal:0.3,0.5] [--error-rate 0.01] [--rate-limit-rate 0.02]
+  python -m agent_core.loadtest run [--base-url http://127.0.0.1:8400/v1] [--rate 50] [--duration 30] [--sessions 64]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .messages import ChatMessage
+from .providers import LLMProvider
+
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 延迟采样函数: 随机数生成器 -> 秒
+LatencySampler = Callable[[random.Random], float]
+
+def parse_latency(spec: str) -> LatencySampler:
+    """解析延迟分布（单位秒）
+
+    constant:S | uniform:A,B | exponential:MEAN | lognormal:MEDIAN,SIGMA | pareto:SCALE,ALPHA[,CAP]
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(value) for value in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"延迟分布参数不是数字: {spec!r}") from None
+    arity = {"constant": (1,), "uniform": (2,), "exponential": (1,), "lognormal": (2,), "pareto": (2, 3)}
+    if kind not in arity:
+        raise ValueError(f"未知的延迟分布 {kind!r}，可选: {', '.join(arity)}")
+    if len(values) not in arity[kind]:
+        raise ValueError(f"延迟分布 {kind} 需要 {'或'.join(map(str, arity[kind]))} 个参数: {spec!r}")
+    if any(value < 0 for value in values):
+        raise ValueError(f"延迟分布参数不能为负数: {spec!r}")
+
+    if kind == "constant":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] else 0.0
+    if kind == "lognormal":
+        mu = math.log(values[0]) if values[0] else -math.inf
+        return lambda rng: rng.lognormvariate(mu, values[1]) if values[0] else 0.0
+    cap = values[2] if len(values) == 3 else math.inf
+    return lambda rng: min(values[0] * rng.paretovariate(values[1]), cap)
+
+@dataclass
+class StandInConfig:
+    """替身服务的行为配置"""
+    latency: str = "lognormal:0.3,0.5"  # 首个token之前的延迟
+    error_rate: float = 0.0  # 返回 500/502/503 的比例
+    rate_limit_rate: float = 0.0  # 返回 429 的比例
+    retry_after: float = 1.0  # 429 响应的 Retry-After（秒）
+    token_interval: float = 0.01  # 流式响应相邻两块之间的间隔（秒）
+    chunk_chars: int = 8  # 流式响应每块的字符数
+    model: str = "stand-in"
+    seed: Optional[int] = None
+
+def _reply_text(payload: Dict[str, Any]) -> str:
+    """替身回复：复述最后一条用户消息"""
+    last = next((m.get("content") or "" for m in reversed(payload.get("messages", [])) if m.get("role") == "user"), "")
+    return f"（替身服务）收到你的问题：{last[:200]}。这是一个用于压力测试的模拟回答。"
+
+def _usage(payload: Dict[str, Any], content: str) -> Dict[str, int]:
+    """粗略估计token数（约4个字符一个token）"""
+    prompt = sum(len(m.get("content") or "") for m in payload.get("messages", [])) // 4 + 1
+    completion = len(content) // 4 + 1
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+def create_app(config: StandInConfig):
+    """创建替身服务的 aiohttp 应用（GET /stats 返回各类响应的计数）"""
+    from aiohttp import web
+
+    sample_latency = parse_latency(config.latency)
+    rng = random.Random(config.seed)
+    stats: Counter = Counter()
+
+    def error(status: int, message: str, kind: str, headers: Optional[Dict[str, str]] = None):
+        return web.json_response(
+            {"error": {"message": message, "type": kind, "code": status}}, status=status, headers=headers
+        )
+
+    async def chat_completions(request):
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            stats["400"] += 1
+            return error(400, "请求体不是合法的JSON", "invalid_request_error")
+        if not isinstance(payload, dict) or not isinstance(payload.get("messages"), list):
+            stats["400"] += 1
+            return error(400, "缺少 messages", "invalid_request_error")
+
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats["429"] += 1
+            return error(429, "Rate limit reached", "rate_limit_error", {"Retry-After": f"{config.retry_after:g}"})
+        if roll < config.rate_limit_rate + config.error_rate:
+            status = rng.choice((500, 502, 503))
+            stats[str(status)] += 1
+            return error(status, "替身服务模拟的上游错误", "server_error")
+
+        await asyncio.sleep(sample_latency(rng))
+        content = _reply_text(payload)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = payload.get("model") or config.model
+
+        if not payload.get("stream"):
+            stats["200"] += 1
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": _usage(payload, content),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            await send({"role": "assistant", "content": ""})
+            for i in range(0, len(content), config.chunk_chars):
+                if i and config.token_interval:
+                    await asyncio.sleep(config.token_interval)
+                await send({"content": content[i:i + config.chunk_chars]})
+            await send({}, "stop")
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            stats["client_disconnected"] += 1  # 客户端提前断开（例如只读取了前几块）
+            return response
+        stats["200"] += 1
+        return response
+
+    async def get_stats(request):
+        return web.json_response(dict(stats))
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+def serve(config: StandInConfig, host: str = "127.0.0.1", port: int = 8400):
+    """运行替身服务（阻塞，Ctrl+C 结束）"""
+    from aiohttp import web
+    print(f"🎭 OpenAI替身服务: http://{host}:{port}/v1（延迟 {config.latency}，"
+          f"错误率 {config.error_rate:.1%}，429比例 {config.rate_limit_rate:.1%}）")
+    web.run_app(create_app(config), host=host, port=port, print=None)
+
+def classify_response(response: Dict[str, Any]) -> str:
+    """把 chat_completion 的返回值归类：ok、http_429、http_5xx 等，或 client_error（连接失败、超时等）"""
+    if response.get("success"):
+        return "ok"
+    match = re.match(r"API错误 (\d+)", response.get("error", ""))
+    return f"http_{match.group(1)}" if match else "client_error"
+
+class _OutcomeRecorder(LLMProvider):
+    """记录最近一次调用结果类型的包装（每个会话一个，会话同一时间只执行一轮）"""
+
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.outcomes: List[str] = []
+
+    async def chat_completion(self, messages: List[ChatMessage], **kwargs) -> Dict[str, Any]:
+        try:
+            response = await self.provider.chat_completion(messages, **kwargs)
+        except Exception as e:
+            self.outcomes.append(f"exception:{type(e).__name__}")
+            raise
+        self.outcomes.append(classify_response(response))
+        return response
+
+PROMPTS = [
+    "帮我计算 {i} * 7 + 3",
+    "北京今天天气怎么样",
+    "你好，请介绍一下你自己",
+    "上海的温度是多少",
+    "第 {i} 个问题：如何提高代码质量",
+    "谢谢",
+]
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+@dataclass
+class LoadReport:
+    target_rate: float
+    duration: float
+    sessions: int
+    arrivals: int
+    completed: int
+    elapsed: float  # 从第一个请求到全部请求结束（或放弃等待）的时间
+    latencies: List[float]  # 成功请求的延迟（秒，从预定到达时间开始）
+    outcomes: Counter  # 结果类型 -> 次数（ok、http_429、client_error、unfinished 等）
+    cpu_seconds: float  # 客户端进程消耗的CPU时间
+    max_lag: float  # 实际发出请求比预定到达时间晚的最大值（负载生成器自身跟不上时变大）
+    queue_waits: List[float] = field(default_factory=list)  # 等待空闲会话的时间
+
+    @property
+    def throughput(self) -> float:
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def cpu_per_request(self) -> float:
+        return self.cpu_seconds / self.completed if self.completed else 0.0
+
+async def run_load(
+    make_provider: Callable[[], LLMProvider],
+    rate: float,
+    duration: float,
+    sessions: int = 64,
+    session_turns: int = 20,
+    context_top_k: Optional[int] = None,
+    drain_timeout: float = 30.0,
+    seed: int = 0
+) -> LoadReport:
+    """开环驱动 SmartAgent 会话：duration 秒内按每秒 rate 个的泊松过程发起对话轮次
+
+    同时存在 sessions 个会话，每个会话完成 session_turns 轮后换成新会话（对话历史不会无限增长）。
+    到达时间结束后最多再等待 drain_timeout 秒，仍未完成的请求记为 unfinished。
+    """
+    from .agents import SmartAgent
+    from .tools import calculator_tool, weather_tool
+
+    rng = random.Random(seed)
+    outcomes: Counter = Counter()
+    latencies: List[float] = []
+    queue_waits: List[float] = []
+
+    def new_session():
+        recorder = _OutcomeRecorder(make_provider())
+        agent = SmartAgent(recorder, context_top_k=context_top_k)
+        agent.add_tool(calculator_tool())
+        agent.add_tool(weather_tool())
+        return [agent, recorder, session_turns]
+
+    idle: asyncio.Queue = asyncio.Queue()
+    for _ in range(sessions):
+        idle.put_nowait(new_session())
+
+    async def turn(scheduled: float, prompt: str):
+        session = await idle.get()
+        queue_waits.append(time.perf_counter() - scheduled)
+        agent, recorder, remaining = session
+        recorder.outcomes.clear()
+        try:
+            await agent.chat(prompt)
+        except Exception as e:
+            outcomes[f"exception:{type(e).__name__}"] += 1
+        else:
+            # 一轮对话只调用一次LLM；出错时以第一个失败的调用为准
+            failures = [outcome for outcome in recorder.outcomes if outcome != "ok"]
+            outcome = failures[0] if failures else "ok"
+            outcomes[outcome] += 1
+            if outcome == "ok":
+                latencies.append(time.perf_counter() - scheduled)
+        finally:
+            session[2] = remaining - 1
+            idle.put_nowait(session if session[2] > 0 else new_session())
+
+    tasks = []
+    max_lag = 0.0
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    offset = rng.expovariate(rate)
+    while offset < duration:
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        max_lag = max(max_lag, time.perf_counter() - scheduled)
+        prompt = PROMPTS[len(tasks) % len(PROMPTS)].format(i=len(tasks))
+        tasks.append(asyncio.ensure_future(turn(scheduled, prompt)))
+        offset += rng.expovariate(rate)
+
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            outcomes["unfinished"] += len(pending)
+    elapsed = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+
+    return LoadReport(
+        target_rate=rate,
+        duration=duration,
+        sessions=sessions,
+        arrivals=len(tasks),
+        completed=outcomes["ok"],
+        elapsed=elapsed,
+        latencies=latencies,
+        outcomes=outcomes,
+        cpu_seconds=cpu_seconds,
+        max_lag=max_lag,
+        queue_waits=queue_waits,
+    )
+
+def print_load_report(report: LoadReport):
+    """打印压力测试报告"""
+    print(f"   到达 {report.arrivals} 个（目标 {report.target_rate:g}/秒，实际 {report.arrivals / report.duration:.1f}/秒），"
+          f"成功 {report.completed} 个，吞吐 {report.throughput:.1f} 请求/秒（{report.elapsed:.1f} 秒）")
+    if report.latencies:
+        print(f"   延迟 p50 {_percentile(report.latencies, 0.5) * 1000:.0f} ms，"
+              f"p95 {_percentile(report.latencies, 0.95) * 1000:.0f} ms，"
+              f"p99 {_percentile(report.latencies, 0.99) * 1000:.0f} ms，"
+              f"最大 {max(report.latencies) * 1000:.0f} ms")
+    if report.queue_waits:
+        print(f"   等待空闲会话 p50 {_percentile(report.queue_waits, 0.5) * 1000:.1f} ms，"
+              f"p99 {_percentile(report.queue_waits, 0.99) * 1000:.1f} ms；负载生成器最大滞后 {report.max_lag * 1000:.1f} ms")
+    errors = {outcome: count for outcome, count in report.outcomes.items() if outcome != "ok"}
+    if errors:
+        total = sum(report.outcomes.values())
+        print("   错误: " + "，".join(
+            f"{outcome} {count}（{count / total:.1%}）" for outcome, count in sorted(errors.items(), key=lambda item: -item[1])
+        ))
+    else:
+        print("   错误: 无")
+    print(f"   客户端CPU {report.cpu_seconds:.2f} 秒，每个成功请求 {report.cpu_per_request * 1000:.2f} ms")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_server(config: StandInConfig, port: int, timeout: float = 10.0) -> subprocess.Popen:
+    """在子进程中启动替身服务，等待端口可以连接"""
+    args = [
+        sys.executable, "-m", "agent_core.loadtest", "serve", "--port", str(port),
+        "--latency", config.latency, "--error-rate", str(config.error_rate),
+        "--rate-limit-rate", str(config.rate_limit_rate), "--token-interval", str(config.token_interval),
+    ]
+    if config.seed is not None:
+        args += ["--seed", str(config.seed)]
+    process = subprocess.Popen(args, cwd=_PACKAGE_PARENT, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"替身服务启动失败（退出码 {process.returncode}）")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f"替身服务在 {timeout:.0f} 秒内没有开始监听端口 {port}")
+
+def _add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default=StandInConfig.latency,
+                        help="延迟分布: constant:S | uniform:A,B | exponential:MEAN | lognormal:MEDIAN,SIGMA | pareto:SCALE,ALPHA[,CAP]")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回5xx的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--token-interval", type=float, default=StandInConfig.token_interval, help="流式响应的分块间隔（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m agent_core.loadtest", description="SmartAgent + OpenAIProvider 开环压力测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="运行OpenAI兼容的替身服务")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8400)
+    _add_server_arguments(serve_parser)
+
+    run_parser = commands.add_parser("run", help="运行负载生成器（不指定 --base-url 时自动启动替身服务）")
+    run_parser.add_argument("--base-url", default=None, help="被测服务地址，例如 http://127.0.0.1:8400/v1")
+    run_parser.add_argument("--api-key", default="loadtest")
+    run_parser.add_argument("--model", default="stand-in")
+    run_parser.add_argument("--rate", type=float, default=50.0, help="目标到达率（请求/秒）")
+    run_parser.add_argument("--duration", type=float, default=30.0, help="发起请求的时长（秒）")
+    run_parser.add_argument("--sessions", type=int, default=64, help="并发会话数")
+    run_parser.add_argument("--session-turns", type=int, default=20, help="每个会话的轮数")
+    run_parser.add_argument("--context-top-k", type=int, default=None, help="SmartAgent 的 context_top_k")
+    run_parser.add_argument("--drain-timeout", type=float, default=30.0, help="到达结束后等待未完成请求的秒数")
+    _add_server_arguments(run_parser)
+
+    args = parser.parse_args(argv)
+    config = StandInConfig(
+        latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        token_interval=args.token_interval, seed=args.seed
+    )
+    try:
+        parse_latency(config.latency)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.command == "serve":
+        serve(config, args.host, args.port)
+        return 0
+    if args.rate <= 0 or args.duration <= 0 or args.sessions <= 0 or args.session_turns <= 0:
+        parser.error("--rate、--duration、--sessions 和 --session-turns 必须为正数")
+
+    from .openai_provider import OpenAIProvider
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        port = _free_port()
+        server = _start_server(config, port)
+        base_url = f"http://127.0.0.1:{port}/v1"
+    try:
+        print(f"📈 开环压力测试: {base_url}（每秒 {args.rate:g} 个请求，{args.duration:g} 秒，{args.sessions} 个会话）")
+        report = asyncio.run(run_load(
+            lambda: OpenAIProvider(args.api_key, model=args.model, base_url=base_url),
+            args.rate, args.duration, args.sessions, args.session_turns,
+            context_top_k=args.context_top_k, drain_timeout=args.drain_timeout, seed=args.seed or 0
+        ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print_load_report(report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,30 @@
+"""
+消息类型：简单代理使用的 Message 和LLM对话使用的 ChatMessage
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+@dataclass
+class Message:
+    """消息类"""
+    role: str  # 'user', 'assistant', 'system'
+    content: str
+    timestamp: float = None
+    
+    def __post_init__(self):
+        if self.timestamp is None:
+            self.timestamp = time.time()
+
+@dataclass
+class ChatMessage:
+    """聊天消息"""
+    role: str  # 'system', 'user', 'assistant'
+    content: str
+    timestamp: Optional[str] = None
+    
+    def __post_init__(self):
+        if self.timestamp is None:
+            self.timestamp = datetime.now().isoformat()
@@ -0,0 +1,77 @@
+"""
+OpenAI API提供商（导入本模块会加载aiohttp，只在实际使用时通过 agent_core.OpenAIProvider 按需导入）
+"""
+
+from typing import Any, Dict, List
+
+import aiohttp
+
+from .messages import ChatMessage
+from .providers import LLMProvider
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI API提供商"""
+    
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", base_url: str = "https://api.openai.com/v1"):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+    
+    async def chat_completion(
+        self, 
+        messages: List[ChatMessage], 
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """调用OpenAI Chat Completion API"""
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # 转换消息格式
+        api_messages = [
+            {"role": msg.role, "content": msg.content} 
+            for msg in messages
+        ]
+        
+        payload = {
+            "model": self.model,
+            "messages": api_messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **kwargs
+        }
+        
+        async with aiohttp.ClientSession() as session:
+            try:
+                async with session.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=headers,
+                    json=payload
+                ) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        message = result["choices"][0]["message"]
+                        completion = {
+                            "success": True,
+                            "content": message.get("content") or "",
+                            "usage": result.get("usage", {}),
+                            "model": result.get("model", self.model)
+                        }
+                        if message.get("tool_calls"):
+                            completion["tool_calls"] = message["tool_calls"]
+                        return completion
+                    else:
+                        error_text = await response.text()
+                        return {
+                            "success": False,
+                            "error": f"API错误 {response.status}: {error_text}"
+                        }
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": f"请求异常: {str(e)}"
+                }
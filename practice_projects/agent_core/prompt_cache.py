@@ -0,0 +1,273 @@
+"""
+近似重复提示词缓存：MinHash签名 + LSH分桶，在 LLMProvider 前复用相似问题的回答
+
+- 提示词先归一化（NFKC、转小写、去掉"请问""怎么样"等不影响语义的口语词和英文停用词），
+  再用 retrieval.tokenize 切分为词项集合（英文单词、汉字二元组）
+- MinHash签名分成若干段（band），任意一段完全相同的条目成为候选，再用词项集合的
+  精确Jaccard相似度确认，因此命中的相似度一定不低于阈值
+- 提示词的算式骨架必须完全相同：从第一个数字到最后一个数字的部分（连同两侧的运算符，
+  忽略空白），因此"15 + 8"与"15 + 9"、"15 * 8"词项相似但不会互相命中
+- 缓存按作用域隔离：租户、之前的对话上下文和调用参数都相同才会复用
+"""
+
+import hashlib
+import json
+import random
+import re
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+from .messages import ChatMessage
+from .providers import LLMProvider
+from .retrieval import tokenize
+
+# 不影响问题语义的中文口语词（按长度从长到短替换）
+FILLER_PHRASES = sorted([
+    "请问", "请", "帮我", "帮忙", "麻烦", "告诉我", "一下", "现在", "今天", "目前",
+    "怎么样", "怎样", "如何", "好不好", "是什么", "什么样", "多少",
+    "的", "了", "吗", "呢", "呀", "啊", "吧", "嘛",
+], key=len, reverse=True)
+_FILLER = re.compile("|".join(map(re.escape, FILLER_PHRASES)))
+
+ENGLISH_STOPWORDS = frozenset(
+    "a an the is are was were be what whats how hows s it its tell me please "
+    "can could would you i in on at of for to do does today now current currently about like".split()
+)
+# 算式骨架：第一个数字到最后一个数字之间的全部字符，两侧的运算符和括号也包括在内
+_OPERATORS = r"+\-*/×÷^%!=<>()"
+_FORMULA = re.compile(rf"[{_OPERATORS}\s]*[0-9](?:.*[0-9])?[{_OPERATORS}\s]*", re.DOTALL)
+_WHITESPACE = re.compile(r"\s+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+def normalize_prompt(text: str) -> str:
+    """归一化提示词：NFKC（全角转半角）、转小写、去掉口语词"""
+    return _FILLER.sub("", unicodedata.normalize("NFKC", text).lower())
+
+def _shingles(normalized: str) -> FrozenSet[str]:
+    return frozenset(token for token in tokenize(normalized) if token not in ENGLISH_STOPWORDS)
+
+def prompt_shingles(text: str) -> FrozenSet[str]:
+    """归一化后的词项集合（去掉英文停用词）"""
+    return _shingles(normalize_prompt(text))
+
+def _skeleton(normalized: str) -> str:
+    match = _FORMULA.search(normalized)
+    return _WHITESPACE.sub("", match.group()) if match else ""
+
+def formula_skeleton(text: str) -> str:
+    """提示词的算式骨架（数字、其间的运算符和标点，去掉空白）；没有数字时为空字符串"""
+    return _skeleton(normalize_prompt(text))
+
+def choose_bands(threshold: float, num_perm: int, recall: float = 0.95) -> Tuple[int, int]:
+    """选择 (段数, 每段行数)：相似度等于阈值的条目成为候选的概率不低于 recall，在此前提下每段行数尽量多"""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            best = (bands, rows)
+    return best
+
+@dataclass
+class _Entry:
+    scope: Hashable
+    shingles: FrozenSet[str]
+    skeleton: str
+    band_keys: List[Tuple[Hashable, int, Tuple[int, ...]]]
+    response: Dict[str, Any]
+    created_at: float
+
+class PromptSimilarityCache:
+    """MinHash LSH相似提示词缓存（LRU淘汰，可选过期时间）"""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        maxsize: int = 10_000,
+        ttl: Optional[float] = None,
+        seed: int = 1
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold 必须在 (0, 1] 之间")
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl  # 秒，None表示不过期
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(self.bands * self.rows)
+        ]
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[Hashable, int, Tuple[int, ...]], set] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def signature(self, shingles: FrozenSet[str]) -> List[int]:
+        """MinHash签名：每个哈希排列下词项哈希的最小值"""
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+
+    def _band_keys(self, scope: Hashable, shingles: FrozenSet[str]) -> List[Tuple[Hashable, int, Tuple[int, ...]]]:
+        signature = self.signature(shingles)
+        rows = self.rows
+        return [(scope, band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def lookup(self, scope: Hashable, prompt: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """查找相似提示词的缓存回答，返回 (回答, Jaccard相似度)；没有时返回None"""
+        normalized = normalize_prompt(prompt)
+        shingles = _shingles(normalized)
+        if not shingles:
+            return None
+        skeleton = _skeleton(normalized)
+        now = time.monotonic()
+        best: Optional[Tuple[float, int]] = None
+        seen = set()
+        for key in self._band_keys(scope, shingles):
+            for entry_id in self._buckets.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                entry = self._entries[entry_id]
+                if entry.skeleton != skeleton:
+                    continue
+                if self.ttl is not None and now - entry.created_at > self.ttl:
+                    continue
+                similarity = len(shingles & entry.shingles) / len(shingles | entry.shingles)
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, entry_id)
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best[1])
+        return self._entries[best[1]].response, best[0]
+
+    def store(self, scope: Hashable, prompt: str, response: Dict[str, Any]):
+        """缓存回答（超过 maxsize 时淘汰最久未使用的条目）"""
+        normalized = normalize_prompt(prompt)
+        shingles = _shingles(normalized)
+        if not shingles:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        band_keys = self._band_keys(scope, shingles)
+        self._entries[entry_id] = _Entry(
+            scope, shingles, _skeleton(normalized), band_keys, response, time.monotonic()
+        )
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for key in entry.band_keys:
+            bucket = self._buckets[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def clear(self):
+        """清空缓存和命中统计"""
+        self._entries.clear()
+        self._buckets.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bands": self.bands,
+            "rows": self.rows,
+        }
+
+def _context_fingerprint(messages: List[ChatMessage], kwargs: Dict[str, Any]) -> str:
+    """之前的对话上下文和调用参数的指纹（不含时间戳）"""
+    payload = json.dumps(
+        [[message.role, message.content] for message in messages[:-1]] + [kwargs],
+        ensure_ascii=False, sort_keys=True, default=str
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+class SimilarityCachedProvider(LLMProvider):
+    """在 LLMProvider 前加一层相似提示词缓存
+
+    最后一条消息是用户消息时，按 (租户, 之前的上下文, 调用参数) 作用域查找相似提示词；
+    命中时直接返回缓存的回答（带 cached=True 和 similarity），否则调用下层提供商并缓存成功的回答。
+    多个包装实例可以共享同一个 PromptSimilarityCache，租户之间互不复用。
+    调用时传入的 tenant 会继续转发给接受租户参数的下层提供商（例如 ScheduledProvider），
+    下层提供商支持批量接口时 batch_chat_completion 只把未命中的请求发给下层。
+    """
+
+    accepts_tenant = True
+
+    def __init__(self, provider: LLMProvider, cache: Optional[PromptSimilarityCache] = None, tenant: str = "default"):
+        self.provider = provider
+        self.cache = cache if cache is not None else PromptSimilarityCache()
+        self.tenant = tenant
+
+    @property
+    def supports_batch(self) -> bool:
+        return self.provider.supports_batch
+
+    def _downstream(self, tenant: Optional[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """发给下层提供商的调用参数：调用方指定的租户只转发给接受租户参数的提供商"""
+        if tenant is not None and self.provider.accepts_tenant:
+            return {**kwargs, "tenant": tenant}
+        return kwargs
+
+    def _lookup(self, messages: List[ChatMessage], tenant: Optional[str], kwargs: Dict[str, Any]):
+        """返回 (作用域, 命中的响应)；不参与缓存的请求作用域为None"""
+        if not messages or messages[-1].role != "user":
+            return None, None
+        scope = (tenant or self.tenant, _context_fingerprint(messages, kwargs))
+        cached = self.cache.lookup(scope, messages[-1].content)
+        if cached is None:
+            return scope, None
+        response, similarity = cached
+        return scope, {**response, "cached": True, "similarity": similarity}
+
+    async def chat_completion(self, messages: List[ChatMessage], tenant: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        scope, cached = self._lookup(messages, tenant, kwargs)
+        if cached is not None:
+            return cached
+
+        response = await self.provider.chat_completion(messages, **self._downstream(tenant, kwargs))
+        if scope is not None and response.get("success"):
+            self.cache.store(scope, messages[-1].content, response)
+        return response
+
+    async def batch_chat_completion(
+        self,
+        requests: List[Tuple[List[ChatMessage], Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        misses = []
+        for i, (messages, kwargs) in enumerate(requests):
+            kwargs = dict(kwargs)
+            tenant = kwargs.pop("tenant", None)
+            scope, cached = self._lookup(messages, tenant, kwargs)
+            if cached is not None:
+                results[i] = cached
+            else:
+                misses.append((i, scope, messages, self._downstream(tenant, kwargs)))
+        if misses:
+            responses = await self.provider.batch_chat_completion(
+                [(messages, kwargs) for _, _, messages, kwargs in misses]
+            )
+            for (i, scope, messages, _), response in zip(misses, responses):
+                if scope is not None and response.get("success"):
+                    self.cache.store(scope, messages[-1].content, response)
+                results[i] = response
+        return results
@@ -0,0 +1,95 @@
+"""
+LLM提供商抽象和模拟实现（OpenAIProvider 在 openai_provider 模块中，按需导入aiohttp）
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple
+
+from .messages import ChatMessage
+
+class LLMProvider(ABC):
+    """LLM提供商抽象基类"""
+    
+    # 后端是否有批量接口（一次上游请求处理多组消息），CoalescingProvider 据此决定是否攒批
+    supports_batch = False
+    # chat_completion 是否接受 tenant 参数（调度器、缓存等包装层）；上层包装只向接受的提供商转发租户
+    accepts_tenant = False
+    
+    @abstractmethod
+    async def chat_completion(
+        self, 
+        messages: List[ChatMessage], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        pass
+    
+    async def batch_chat_completion(
+        self,
+        requests: List[Tuple[List[ChatMessage], Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """批量调用：requests 为 (消息, 调用参数) 列表，返回顺序一致的结果；默认逐个并发调用"""
+        return list(await asyncio.gather(*(self.chat_completion(messages, **kwargs) for messages, kwargs in requests)))
+
+class MockLLMProvider(LLMProvider):
+    """模拟LLM提供商（用于测试，支持批量接口：整批只有一次API延迟）"""
+    
+    supports_batch = True
+    
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency  # 模拟API延迟（秒）
+        self.responses = {
+            "计算": "我可以帮你进行数学计算。请告诉我具体的计算表达式。",
+            "天气": "我可以查询天气信息。请告诉我你想查询哪个城市的天气。",
+            "你好": "你好！我是AI助手，很高兴为你服务。有什么我可以帮助你的吗？",
+            "谢谢": "不客气！如果还有其他问题，随时可以问我。"
+        }
+    
+    async def chat_completion(
+        self, 
+        messages: List[ChatMessage], 
+        **kwargs
+    ) -> Dict[str, Any]:
+        """模拟LLM响应"""
+        
+        # 模拟API延迟
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+    
+    async def batch_chat_completion(
+        self,
+        requests: List[Tuple[List[ChatMessage], Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """模拟批量接口：整批只等待一次API延迟"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._respond(messages) for messages, _ in requests]
+    
+    def _respond(self, messages: List[ChatMessage]) -> Dict[str, Any]:
+        """按最后一条消息的关键词生成模拟响应"""
+        if not messages:
+            return {
+                "success": False,
+                "error": "没有消息"
+            }
+        
+        last_message = messages[-1].content.lower()
+        
+        # 简单的关键词匹配
+        for keyword, response in self.responses.items():
+            if keyword in last_message:
+                return {
+                    "success": True,
+                    "content": response,
+                    "usage": {"total_tokens": 50},
+                    "model": "mock-llm"
+                }
+        
+        # 默认响应
+        return {
+            "success": True,
+            "content": "我理解了你的问题。让我想想如何最好地帮助你...",
+            "usage": {"total_tokens": 30},
+            "model": "mock-llm"
+        }
@@ -0,0 +1,143 @@
+"""
+对话历史检索：增量维护的BM25倒排索引
+
+- 分词同时支持中文和英文：英文和数字按单词切分（转小写），连续的汉字切成二元组
+  （只有一个汉字时保留单字），不依赖分词词典
+- 倒排表用 array 存储文档号和词频，每条倒排记录约6字节
+- 查询时有NumPy则对每个查询词的倒排表做向量化打分，否则逐条累加
+"""
+
+import math
+import re
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_TOKEN = re.compile(r"[一-鿿]+|[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """把中英文混合文本切分为检索用的词项"""
+    tokens = []
+    for run in _TOKEN.findall(text.lower()):
+        if run[0] < "一" or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class BM25Index:
+    """增量BM25索引：文档号由调用方指定（例如消息在对话历史中的位置），必须递增"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # 词项 -> (文档号数组, 词频数组)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array("I")  # 按文档号索引，未索引的位置为0
+        self.doc_count = 0
+        self.total_length = 0
+
+    def add(self, doc_id: int, text: str):
+        """索引一个文档（文档号必须大于之前索引的所有文档号）"""
+        if doc_id < len(self.doc_lengths):
+            raise ValueError(f"文档号 {doc_id} 不大于已索引的文档号")
+        tokens = tokenize(text)
+        self.doc_lengths.extend([0] * (doc_id + 1 - len(self.doc_lengths)))
+        if not tokens:
+            return
+        self.doc_lengths[doc_id] = len(tokens)
+        self.doc_count += 1
+        self.total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("I"), array("H"))
+            entry[0].append(doc_id)
+            entry[1].append(min(tf, 65535))
+
+    def clear(self):
+        """清空索引"""
+        self.postings.clear()
+        self.doc_lengths = array("I")
+        self.doc_count = 0
+        self.total_length = 0
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 5, before: Optional[int] = None) -> List[Tuple[int, float]]:
+        """返回与查询最相关的 k 个 (文档号, 分数)，按分数从高到低
+
+        before 不为None时只在文档号小于 before 的文档中检索（例如排除最近几条消息）。
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or k <= 0:
+            return []
+        try:
+            import numpy as np
+        except ImportError:
+            return self._search_python(terms, k, before)
+        return self._search_numpy(np, terms, k, before)
+
+    def _search_python(self, terms: Iterable[str], k: int, before: Optional[int]) -> List[Tuple[int, float]]:
+        average = self.total_length / self.doc_count
+        scores: Dict[int, float] = {}
+        for term in terms:
+            docs, tfs = self.postings[term]
+            idf = self._idf(len(docs))
+            for doc_id, tf in zip(docs, tfs):
+                if before is not None and doc_id >= before:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def _search_numpy(self, np, terms: Iterable[str], k: int, before: Optional[int]) -> List[Tuple[int, float]]:
+        average = self.total_length / self.doc_count
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        all_docs, all_scores = [], []
+        for term in terms:
+            docs, tfs = self.postings[term]
+            docs = np.frombuffer(docs, dtype=np.uint32)
+            tfs = np.frombuffer(tfs, dtype=np.uint16).astype(np.float64)
+            if before is not None:
+                # 文档号按添加顺序递增，截断即可
+                end = int(np.searchsorted(docs, before))
+                docs, tfs = docs[:end], tfs[:end]
+            norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average)
+            all_docs.append(docs)
+            all_scores.append(self._idf(len(self.postings[term][0])) * tfs * (self.k1 + 1) / (tfs + norm))
+
+        docs = np.concatenate(all_docs)
+        if not len(docs):
+            return []
+        # 按文档号累加各查询词的分数，只在有分数的文档中选前k个
+        scores = np.bincount(docs, weights=np.concatenate(all_scores))
+        candidates = np.flatnonzero(scores)
+        scores = scores[candidates]
+        if len(candidates) > k:
+            # 保留所有不低于第k高分数的文档，同分时和逐条累加一样按文档号排序
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+            top = np.flatnonzero(scores >= kth)
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -scores[top]))][:k]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def memory_bytes(self) -> int:
+        """索引占用的内存（字节，包括词项字符串、字典和数组）"""
+        total = sys.getsizeof(self.postings) + sys.getsizeof(self.doc_lengths)
+        for term, (docs, tfs) in self.postings.items():
+            total += sys.getsizeof(term) + sys.getsizeof((docs, tfs))
+            total += sys.getsizeof(docs) + sys.getsizeof(tfs)
+        return total
+
+    def get_stats(self) -> Dict[str, int]:
+        """索引统计"""
+        return {
+            "documents": self.doc_count,
+            "terms": len(self.postings),
+            "postings": sum(len(docs) for docs, _ in self.postings.values()),
+            "memory_bytes": self.memory_bytes(),
+        }
@@ -0,0 +1,325 @@
+"""
+内存浸泡测试：用模拟提供商长时间驱动代理，检查内存是否随时间增长
+
+- 同时保持 sessions 个会话，每个会话运行 session_turns 轮后关闭并换一个新会话
+- 每隔 interval 秒采样一次RSS和tracemalloc当前分配量
+- 结束时对比tracemalloc快照，列出分配增长最多的代码位置
+- 两项检查：会话存活期间每个会话占用的内存不超过 budget_bytes；
+  会话关闭后残留的内存（泄漏）平均每个会话不超过 leak_budget_bytes（不计 asyncio 事件循环内部的分配）
+
+用法: python -m agent_core.soak [simple|smart|custom ...] [--duration 秒] [--budget-kb N]（在 practice_projects 目录下运行）
+"""
+
+import _weakrefset
+import argparse
+import asyncio
+import contextlib
+import gc
+import importlib.util
+import io
+import os
+import sys
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPTS = [
+    "帮我计算 {i} * 7 + 3",
+    "北京今天天气怎么样",
+    "你好，第 {i} 次见面",
+    "上海的温度是多少",
+    "执行 ls 命令",
+    "创建一个文件记录第 {i} 轮",
+    "谢谢",
+]
+
+def current_rss() -> int:
+    """当前进程的常驻内存（字节）；没有 /proc 时退回到历史峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class SoakSession(ABC):
+    """一个被驱动的会话：turn 执行一轮对话，close 释放会话"""
+
+    @abstractmethod
+    async def turn(self, prompt: str):
+        pass
+
+    def close(self):
+        pass
+
+class SimpleAgentSession(SoakSession):
+    def __init__(self):
+        from .agents import SimpleAgent
+        from .tools import CalculatorTool, WeatherTool
+        self.agent = SimpleAgent()
+        self.agent.add_tool(CalculatorTool())
+        self.agent.add_tool(WeatherTool())
+
+    async def turn(self, prompt: str):
+        await self.agent.process_user_input(prompt)
+
+class SmartAgentSession(SoakSession):
+    def __init__(self):
+        from .agents import SmartAgent
+        from .providers import MockLLMProvider
+        from .tools import calculator_tool, weather_tool
+        self.agent = SmartAgent(MockLLMProvider(latency=0))
+        self.agent.add_tool(calculator_tool())
+        self.agent.add_tool(weather_tool())
+
+    async def turn(self, prompt: str):
+        await self.agent.chat(prompt)
+
+def _load_custom_agent_module():
+    """导入 03_openhands_custom_agent.py（文件名不是合法的模块名，按路径加载）"""
+    name = "openhands_custom_agent"
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(_PACKAGE_PARENT, "03_openhands_custom_agent.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+class CustomAgentSession(SoakSession):
+    """项目3的自定义代理：每轮作为任务提交给 ConversationManager 的调度器"""
+
+    def __init__(self, max_iterations: int = 3):
+        module = _load_custom_agent_module()
+        agent = module.CustomAgent(module.MockLLM(), "SoakAgent")
+        controller = module.AgentController(agent, module.MockRuntime(), step_delay=0, verbose=False)
+        self.manager = module.ConversationManager(controller, max_iterations=max_iterations)
+        self.manager.scheduler = module.AgentScheduler(controller)
+
+    async def turn(self, prompt: str):
+        scheduler = self.manager.scheduler
+        # 任务结束回调会打印摘要，浸泡测试中丢弃
+        with contextlib.redirect_stdout(io.StringIO()):
+            task_id = scheduler.submit(prompt, max_iterations=self.manager.max_iterations,
+                                       on_done=self.manager._on_task_done)
+            await scheduler.wait([task_id])
+
+    def close(self):
+        self.manager.close()
+        self.manager.controller.close()
+        self.manager.scheduler = None
+
+SOAK_DRIVERS: Dict[str, Callable[[], SoakSession]] = {
+    "simple": SimpleAgentSession,
+    "smart": SmartAgentSession,
+    "custom": CustomAgentSession,
+}
+
+@dataclass
+class SoakSample:
+    elapsed: float
+    turns: int
+    live_sessions: int
+    rss: int
+    traced: int  # tracemalloc跟踪的已分配字节数（不含测试框架自身和快照）
+
+@dataclass
+class SoakReport:
+    agent: str
+    turns: int
+    sessions_completed: int
+    samples: List[SoakSample]
+    per_session_bytes: float  # 会话存活期间每个会话占用的内存（各次采样的最大值）
+    retained_per_session_bytes: float  # 会话全部关闭后平均每个会话残留的内存
+    top_growth: List[str]  # 会话存活时相对基线增长最多的代码位置
+    top_retained: List[str]  # 会话关闭后仍然残留的代码位置
+    failures: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ])
+
+# 事件循环内部的分配（就绪队列、回调句柄、任务的弱引用集合等）会随任务调度波动，
+# 不属于会话本身，统计会话关闭后的残留时排除
+_EVENT_LOOP_FILTERS = [
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(asyncio.__file__), "*")),
+    tracemalloc.Filter(False, _weakrefset.__file__),
+]
+
+def _traced_size(snapshot: tracemalloc.Snapshot) -> int:
+    """快照中（过滤掉测试框架自身和tracemalloc之后）已分配的字节数"""
+    return sum(trace.size for trace in snapshot.traces)
+
+def _top_growth(snapshot: tracemalloc.Snapshot, baseline: tracemalloc.Snapshot, top: int) -> List[str]:
+    stats = [s for s in snapshot.compare_to(baseline, "lineno") if s.size_diff > 0][:top]
+    return [
+        f"{s.size_diff / 1024:+10.1f} KB {s.count_diff:+8d} 块  "
+        f"{os.path.relpath(s.traceback[0].filename, _PACKAGE_PARENT)}:{s.traceback[0].lineno}"
+        for s in stats
+    ]
+
+async def run_soak(
+    agent: str,
+    duration: float = 60.0,
+    sessions: int = 8,
+    session_turns: int = 200,
+    interval: float = 5.0,
+    budget_bytes: int = 1024 * 1024,
+    leak_budget_bytes: int = 1024,
+    max_turns: Optional[int] = None,
+    top: int = 10,
+    on_sample: Optional[Callable[[SoakSample], Any]] = None
+) -> SoakReport:
+    """驱动 agent 类型的代理 duration 秒（或 max_turns 轮），返回采样和检查结果"""
+    make_session = SOAK_DRIVERS[agent]
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        # 预热：以正式运行的方式驱动一批会话再关闭，让导入模块、编译正则、各种缓存和
+        # 事件循环内部结构的一次性分配发生在基线之前
+        warmup = [make_session() for _ in range(sessions)]
+        for i in range(len(PROMPTS) * 2):
+            for session in warmup:
+                await session.turn(PROMPTS[i % len(PROMPTS)].format(i=i))
+        for session in warmup:
+            session.close()
+        warmup = session = None
+        for _ in range(3):
+            await asyncio.sleep(0)
+        gc.collect()
+        baseline = _snapshot()
+        baseline_traced = _traced_size(baseline)
+
+        # 各会话的剩余轮数错开，避免同时关闭
+        live = [[make_session(), session_turns * (i + 1) // sessions] for i in range(sessions)]
+        samples: List[SoakSample] = []
+        turns = completed = 0
+        per_session = 0.0
+        live_snapshot = baseline
+        start = last_sample = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now - last_sample >= interval:
+                last_sample = now
+                snapshot = _snapshot()
+                traced = _traced_size(snapshot)
+                sample = SoakSample(now - start, turns, len(live), current_rss(), traced)
+                samples.append(sample)
+                if on_sample is not None:
+                    on_sample(sample)
+                if (traced - baseline_traced) / sessions > per_session:
+                    per_session = (traced - baseline_traced) / sessions
+                    live_snapshot = snapshot
+                snapshot = None
+            if now - start >= duration or (max_turns is not None and turns >= max_turns):
+                break
+
+            for slot in live:
+                session = slot[0]
+                await session.turn(PROMPTS[turns % len(PROMPTS)].format(i=turns))
+                turns += 1
+                slot[1] -= 1
+                if slot[1] <= 0:
+                    session.close()
+                    slot[0], slot[1] = make_session(), session_turns
+                    completed += 1
+
+        for slot in live:
+            slot[0].close()
+        completed += len(live)
+        live.clear()
+        slot = session = None  # 循环变量仍引用最后的会话
+        for _ in range(3):
+            await asyncio.sleep(0)  # 让事件循环执行已排队的回调（例如任务完成回调）
+        gc.collect()
+        final = _snapshot().filter_traces(_EVENT_LOOP_FILTERS)
+        loop_baseline = baseline.filter_traces(_EVENT_LOOP_FILTERS)
+        retained = max(_traced_size(final) - _traced_size(loop_baseline), 0)
+        report = SoakReport(
+            agent=agent,
+            turns=turns,
+            sessions_completed=completed,
+            samples=samples,
+            per_session_bytes=per_session,
+            retained_per_session_bytes=retained / completed,
+            top_growth=_top_growth(live_snapshot, baseline, top),
+            top_retained=_top_growth(final, loop_baseline, top),
+        )
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    if report.per_session_bytes > budget_bytes:
+        report.failures.append(
+            f"会话内存 {report.per_session_bytes / 1024:.1f} KB/会话 超过预算 {budget_bytes / 1024:.0f} KB"
+        )
+    if report.retained_per_session_bytes > leak_budget_bytes:
+        report.failures.append(
+            f"会话关闭后残留 {report.retained_per_session_bytes:.0f} 字节/会话 超过预算 {leak_budget_bytes} 字节"
+        )
+    return report
+
+def print_report(report: SoakReport):
+    """打印浸泡测试报告"""
+    print(f"   {report.turns:,} 轮，{report.sessions_completed} 个会话")
+    print(f"   会话存活期间: {report.per_session_bytes / 1024:.1f} KB/会话，"
+          f"会话关闭后残留: {report.retained_per_session_bytes:.0f} 字节/会话")
+    if report.samples:
+        first, last = report.samples[0], report.samples[-1]
+        print(f"   RSS {first.rss / 2**20:.1f} MB → {last.rss / 2**20:.1f} MB，"
+              f"tracemalloc {first.traced / 2**20:.1f} MB → {last.traced / 2**20:.1f} MB")
+    for title, lines in (("存活会话增长最多的位置", report.top_growth), ("关闭后残留最多的位置", report.top_retained)):
+        if lines:
+            print(f"   {title}:")
+            for line in lines:
+                print(f"     {line}")
+    if report.passed:
+        print("   ✅ 通过")
+    for failure in report.failures:
+        print(f"   ❌ {failure}")
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m agent_core.soak", description="代理内存浸泡测试")
+    parser.add_argument("agents", nargs="*", help=f"代理类型: {', '.join(SOAK_DRIVERS)}（默认全部）")
+    parser.add_argument("--duration", type=float, default=60.0, help="每种代理运行的秒数")
+    parser.add_argument("--sessions", type=int, default=8, help="同时存活的会话数")
+    parser.add_argument("--session-turns", type=int, default=200, help="每个会话的轮数")
+    parser.add_argument("--interval", type=float, default=5.0, help="采样间隔（秒）")
+    parser.add_argument("--budget-kb", type=float, default=1024, help="每个存活会话的内存预算（KB）")
+    parser.add_argument("--leak-budget", type=int, default=1024, help="每个已关闭会话允许残留的字节数")
+    parser.add_argument("--top", type=int, default=10, help="列出增长最多的代码位置数")
+    args = parser.parse_args(argv)
+    unknown = [agent for agent in args.agents if agent not in SOAK_DRIVERS]
+    if unknown:
+        parser.error(f"未知代理类型: {', '.join(unknown)}")
+
+    failed = False
+    for agent in args.agents or list(SOAK_DRIVERS):
+        print(f"🧪 内存浸泡测试: {agent}（{args.duration:.0f} 秒，{args.sessions} 个会话，每个会话 {args.session_turns} 轮）")
+        report = asyncio.run(run_soak(
+            agent, args.duration, args.sessions, args.session_turns, args.interval,
+            int(args.budget_kb * 1024), args.leak_budget, top=args.top,
+            on_sample=lambda s: print(f"     {s.elapsed:7.0f} 秒 {s.turns:>9,} 轮  RSS {s.rss / 2**20:7.1f} MB  "
+                                      f"tracemalloc {s.traced / 2**20:7.1f} MB")
+        ))
+        print_report(report)
+        print()
+        failed |= not report.passed
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
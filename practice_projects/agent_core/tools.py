@@ -0,0 +1,310 @@
+"""
+工具：Tool 抽象、函数工具 FunctionTool，以及两种形式共用的计算器和天气实现
+
+流式工具：耗时较长的工具可以在执行过程中产出 ToolChunk（进度、部分结果），
+最后产出一个 RESULT 块，其中是与 execute 返回值相同的结果字典。
+- Tool.stream 默认只产出 execute 的结果，StreamingTool 子类实现 stream，execute 收集最终结果
+- FunctionTool 的函数可以是异步生成器：产出的 ToolChunk 原样转发，其他值作为部分结果；
+  没有显式产出 RESULT 块时，最终结果为全部部分结果组成的列表
+"""
+
+import asyncio
+import inspect
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .validation import compile_schema
+
+ALLOWED_EXPRESSION_CHARS = frozenset('0123456789+-*/().')
+
+DISALLOWED_CHARS_ERROR = "表达式包含不允许的字符"
+
+# 模拟天气数据（WeatherTool）
+WEATHER_DATA = {
+    "北京": {"temperature": "22°C", "condition": "晴天", "humidity": "45%"},
+    "上海": {"temperature": "25°C", "condition": "多云", "humidity": "60%"},
+    "深圳": {"temperature": "28°C", "condition": "小雨", "humidity": "75%"},
+}
+
+# 天气函数工具（weather_function）还支持广州和杭州
+FUNCTION_WEATHER_DATA = {
+    **WEATHER_DATA,
+    "广州": {"temperature": "30°C", "condition": "晴天", "humidity": "50%"},
+    "杭州": {"temperature": "24°C", "condition": "多云", "humidity": "55%"},
+}
+
+def evaluate_expression(expression: str):
+    """计算算术表达式，表达式不合法或计算失败时抛出ValueError"""
+    # 简单的安全计算（实际项目中需要更严格的安全检查）
+    if not all(c in ALLOWED_EXPRESSION_CHARS or c.isspace() for c in expression):
+        raise ValueError(DISALLOWED_CHARS_ERROR)
+    try:
+        return eval(expression)
+    except Exception as e:
+        raise ValueError(f"计算错误: {str(e)}") from e
+
+def function_error_message(error: str) -> str:
+    """calculator_function 的错误信息：字符检查失败也带"计算错误:"前缀"""
+    return f"计算错误: {error}" if error == DISALLOWED_CHARS_ERROR else error
+
+def lookup_weather(city: str, data: Dict[str, Dict[str, str]] = WEATHER_DATA) -> Dict[str, str]:
+    """查询城市天气，未知城市抛出ValueError"""
+    if city not in data:
+        raise ValueError(f"未找到城市 {city} 的天气信息")
+    return data[city]
+
+# 流式输出块的类型
+PROGRESS = "progress"  # 进度信息（例如"已完成 3/10"），不属于结果
+PARTIAL = "partial"    # 部分结果，可以先展示给用户
+RESULT = "result"      # 最终结果（与 execute / invoke 的返回值相同），每次执行只有一个
+
+@dataclass
+class ToolChunk:
+    """工具执行过程中产出的一块输出；tool 为工具名，由代理在转发时填写"""
+    kind: str
+    data: Any
+    tool: Optional[str] = None
+
+async def collect_result(chunks: AsyncIterator[ToolChunk]) -> Dict[str, Any]:
+    """消费流式输出，返回 RESULT 块中的最终结果（中间块被丢弃）"""
+    result = None
+    async for chunk in chunks:
+        if chunk.kind == RESULT:
+            result = chunk.data
+    if result is None:
+        raise RuntimeError("工具的流式输出没有 RESULT 块")
+    return result
+
+class Tool(ABC):
+    """工具基类"""
+    
+    @abstractmethod
+    def get_name(self) -> str:
+        pass
+    
+    @abstractmethod
+    def get_description(self) -> str:
+        pass
+    
+    @abstractmethod
+    async def execute(self, **kwargs) -> Dict[str, Any]:
+        pass
+    
+    async def stream(self, **kwargs) -> AsyncIterator[ToolChunk]:
+        """流式执行：默认只产出 execute 的结果"""
+        yield ToolChunk(RESULT, await self.execute(**kwargs))
+
+class StreamingTool(Tool):
+    """流式工具基类：子类实现 stream（产出中间块，最后产出 RESULT 块），execute 只返回最终结果"""
+    
+    @abstractmethod
+    async def stream(self, **kwargs) -> AsyncIterator[ToolChunk]:
+        yield  # pragma: no cover
+    
+    async def execute(self, **kwargs) -> Dict[str, Any]:
+        return await collect_result(self.stream(**kwargs))
+
+class CalculatorTool(Tool):
+    """计算器工具"""
+    
+    def get_name(self) -> str:
+        return "calculator"
+    
+    def get_description(self) -> str:
+        return "执行基本数学计算，支持加减乘除"
+    
+    async def execute(self, expression: str) -> Dict[str, Any]:
+        try:
+            result = evaluate_expression(expression)
+        except ValueError as e:
+            return {"error": str(e)}
+        return {"result": result, "expression": expression}
+    
+    async def execute_batch(self, expressions: List[str]) -> List[Dict[str, Any]]:
+        """批量计算：同结构的表达式分组后用NumPy向量化求值，单个表达式出错不影响其他表达式"""
+        from .calculator_batch import evaluate_batch
+        
+        results = await asyncio.to_thread(evaluate_batch, expressions)
+        return [
+            {"result": value, "expression": expression} if error is None else {"error": error}
+            for expression, (value, error) in zip(expressions, results)
+        ]
+
+class WeatherTool(Tool):
+    """天气查询工具（模拟）"""
+    
+    def get_name(self) -> str:
+        return "weather"
+    
+    def get_description(self) -> str:
+        return "查询指定城市的天气信息"
+    
+    async def execute(self, city: str) -> Dict[str, Any]:
+        try:
+            return {"city": city, "weather": lookup_weather(city)}
+        except ValueError as e:
+            return {"error": str(e)}
+
+class FunctionTool:
+    """函数工具类（参数schema在构造时编译为校验函数，执行前先校验参数）
+    
+    batch_function 可选：接收参数字典列表，返回 (结果, 错误信息) 列表，供 execute_batch 批量执行。
+    function 是异步生成器时为流式工具：stream / invoke_stream 逐块产出，execute / invoke 只返回最终结果。
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        parameters: Dict[str, Any],
+        function: Callable,
+        batch_function: Optional[Callable[[List[Dict[str, Any]]], List[tuple]]] = None
+    ):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.function = function
+        self.batch_function = batch_function
+        self.streaming = inspect.isasyncgenfunction(function)
+        self._validate = compile_schema(parameters)
+    
+    def validate(self, arguments: Dict[str, Any]) -> Optional[str]:
+        """校验参数，返回第一个错误信息，通过时返回None"""
+        return self._validate(arguments)
+    
+    def to_openai_format(self) -> Dict[str, Any]:
+        """转换为OpenAI函数调用格式"""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters
+            }
+        }
+    
+    async def execute(self, **kwargs) -> Dict[str, Any]:
+        """执行函数"""
+        error = self._validate(kwargs)
+        if error is not None:
+            return {"success": False, "error": f"参数错误: {error}", "invalid_arguments": True}
+        return await self.invoke(kwargs)
+    
+    async def stream(self, **kwargs) -> AsyncIterator[ToolChunk]:
+        """流式执行：先校验参数，再逐块产出（非流式函数只有一个 RESULT 块）"""
+        error = self._validate(kwargs)
+        if error is not None:
+            yield ToolChunk(RESULT, {"success": False, "error": f"参数错误: {error}", "invalid_arguments": True})
+            return
+        async for chunk in self.invoke_stream(kwargs):
+            yield chunk
+    
+    async def execute_batch(self, arguments_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量执行：参数逐个校验，合法的参数交给 batch_function 一次处理（没有时逐个调用）"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(arguments_list)
+        valid = []
+        for i, arguments in enumerate(arguments_list):
+            error = self._validate(arguments)
+            if error is None:
+                valid.append(i)
+            else:
+                results[i] = {"success": False, "error": f"参数错误: {error}", "invalid_arguments": True}
+        
+        if self.batch_function is None:
+            for i in valid:
+                results[i] = await self.invoke(arguments_list[i])
+            return results
+        
+        outputs = await asyncio.to_thread(self.batch_function, [arguments_list[i] for i in valid])
+        for i, (value, error) in zip(valid, outputs):
+            results[i] = {"success": True, "result": value} if error is None else {"success": False, "error": error}
+        return results
+    
+    async def invoke(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """用已校验的参数调用函数"""
+        if self.streaming:
+            return await collect_result(self.invoke_stream(arguments))
+        try:
+            if asyncio.iscoroutinefunction(self.function):
+                result = await self.function(**arguments)
+            else:
+                result = self.function(**arguments)
+            return {"success": True, "result": result}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    async def invoke_stream(self, arguments: Dict[str, Any]) -> AsyncIterator[ToolChunk]:
+        """用已校验的参数流式调用函数，最后一块是 RESULT（函数出错时为失败结果）"""
+        if not self.streaming:
+            yield ToolChunk(RESULT, await self.invoke(arguments))
+            return
+        partials = []
+        agen = self.function(**arguments)
+        try:
+            async for item in agen:
+                if not isinstance(item, ToolChunk):
+                    item = ToolChunk(PARTIAL, item)
+                if item.kind == RESULT:
+                    yield ToolChunk(RESULT, {"success": True, "result": item.data})
+                    return
+                if item.kind == PARTIAL:
+                    partials.append(item.data)
+                yield item
+        except Exception as e:
+            yield ToolChunk(RESULT, {"success": False, "error": str(e)})
+            return
+        finally:
+            await agen.aclose()
+        yield ToolChunk(RESULT, {"success": True, "result": partials})
+
+# 工具函数定义
+def calculator_function(expression: str) -> str:
+    """计算器函数"""
+    try:
+        return str(evaluate_expression(expression))
+    except ValueError as e:
+        raise ValueError(function_error_message(str(e))) from e
+
+async def weather_function(city: str) -> str:
+    """天气查询函数"""
+    weather = lookup_weather(city, FUNCTION_WEATHER_DATA)
+    return f"{weather['condition']}，{weather['temperature']}，湿度{weather['humidity']}"
+
+CALCULATOR_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "expression": {
+            "type": "string",
+            "description": "数学表达式"
+        }
+    },
+    "required": ["expression"]
+}
+
+WEATHER_PARAMETERS = {
+    "type": "object",
+    "properties": {
+        "city": {
+            "type": "string",
+            "description": "城市名称"
+        }
+    },
+    "required": ["city"]
+}
+
+def _calculator_function_batch(arguments_list: List[Dict[str, Any]]) -> List[tuple]:
+    """计算器的批量函数（首次调用时才导入 calculator_batch 和NumPy，不影响启动时间）"""
+    from .calculator_batch import calculator_function_batch
+    return calculator_function_batch(arguments_list)
+
+def calculator_tool() -> FunctionTool:
+    """计算器函数工具（支持 execute_batch 批量向量化计算）"""
+    return FunctionTool(
+        "calculator", "执行数学计算", CALCULATOR_PARAMETERS, calculator_function,
+        batch_function=_calculator_function_batch
+    )
+
+def weather_tool() -> FunctionTool:
+    """天气查询函数工具"""
+    return FunctionTool("weather", "查询城市天气", WEATHER_PARAMETERS, weather_function)
@@ -0,0 +1,241 @@
+"""
+JSON Schema 参数校验：FunctionTool 构造时把 parameters 编译为校验闭包
+
+支持工具参数常用的子集: type、enum、const、properties、required、
+additionalProperties、items、min/maxLength、pattern、minimum、maximum、
+exclusiveMinimum、exclusiveMaximum、min/maxItems。未识别的关键字会被忽略。
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# 校验函数: (值, 路径) -> 错误信息，通过时返回None
+Check = Callable[[Any, str], Optional[str]]
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool))
+                         or (isinstance(v, float) and v.is_integer()),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "null": lambda v: v is None,
+}
+
+_JSON_TYPE_NAMES = {
+    str: "string", bool: "boolean", int: "integer", float: "number",
+    dict: "object", list: "array", type(None): "null",
+}
+
+class SchemaError(ValueError):
+    """schema 本身不合法"""
+
+def _prefix(path: str) -> str:
+    return f"{path}: " if path else ""
+
+def _child(path: str, name) -> str:
+    if isinstance(name, int):
+        return f"{path}[{name}]"
+    return f"{path}.{name}" if path else name
+
+def _type_name(value: Any) -> str:
+    return _JSON_TYPE_NAMES.get(type(value), type(value).__name__)
+
+def _accept(value: Any, path: str) -> Optional[str]:
+    return None
+
+def _compile(schema: Dict[str, Any]) -> Check:
+    if not isinstance(schema, dict):
+        raise SchemaError(f"schema 应为对象，实际为 {_type_name(schema)}")
+    checks: List[Check] = []
+    
+    if "type" in schema:
+        names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        try:
+            type_checks = tuple(_TYPE_CHECKS[name] for name in names)
+        except KeyError as e:
+            raise SchemaError(f"未知类型 {e.args[0]!r}") from None
+        expected = " 或 ".join(names)
+        if len(type_checks) == 1:
+            type_check = type_checks[0]
+            
+            def check_type(value, path):
+                if not type_check(value):
+                    return f"{_prefix(path)}类型应为 {expected}，实际为 {_type_name(value)}"
+        else:
+            def check_type(value, path):
+                if not any(check(value) for check in type_checks):
+                    return f"{_prefix(path)}类型应为 {expected}，实际为 {_type_name(value)}"
+        checks.append(check_type)
+    
+    if "enum" in schema:
+        options = list(schema["enum"])
+        
+        def check_enum(value, path):
+            if value not in options:
+                return f"{_prefix(path)}值应为 {options} 之一，实际为 {value!r}"
+        checks.append(check_enum)
+    
+    if "const" in schema:
+        constant = schema["const"]
+        
+        def check_const(value, path):
+            if value != constant:
+                return f"{_prefix(path)}值应为 {constant!r}，实际为 {value!r}"
+        checks.append(check_const)
+    
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    if min_length is not None or max_length is not None or pattern is not None:
+        def check_string(value, path):
+            if not isinstance(value, str):
+                return None
+            if min_length is not None and len(value) < min_length:
+                return f"{_prefix(path)}长度不能小于 {min_length}"
+            if max_length is not None and len(value) > max_length:
+                return f"{_prefix(path)}长度不能大于 {max_length}"
+            if pattern is not None and not pattern.search(value):
+                return f"{_prefix(path)}不匹配模式 {pattern.pattern!r}"
+        checks.append(check_string)
+    
+    bounds = [
+        (schema[key], op, text) for key, op, text in (
+            ("minimum", lambda v, b: v >= b, ">="),
+            ("maximum", lambda v, b: v <= b, "<="),
+            ("exclusiveMinimum", lambda v, b: v > b, ">"),
+            ("exclusiveMaximum", lambda v, b: v < b, "<"),
+        ) if key in schema
+    ]
+    if bounds:
+        def check_bounds(value, path):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return None
+            for bound, op, text in bounds:
+                if not op(value, bound):
+                    return f"{_prefix(path)}值应 {text} {bound}，实际为 {value!r}"
+        checks.append(check_bounds)
+    
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        properties = tuple((name, _compile(sub)) for name, sub in schema.get("properties", {}).items())
+        known = frozenset(name for name, _ in properties)
+        required = tuple(schema.get("required", ()))
+        additional = schema.get("additionalProperties", True)
+        additional_check = _compile(additional) if isinstance(additional, dict) else None
+        
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return None
+            for name in required:
+                if name not in value:
+                    return f"{_prefix(path)}缺少必需参数 {name!r}"
+            for name, check in properties:
+                if name in value:
+                    error = check(value[name], _child(path, name))
+                    if error is not None:
+                        return error
+            if additional is not True:
+                for name in value:
+                    if name in known:
+                        continue
+                    if additional_check is None:
+                        return f"{_prefix(path)}不允许的参数 {name!r}"
+                    error = additional_check(value[name], _child(path, name))
+                    if error is not None:
+                        return error
+        checks.append(check_object)
+    
+    if "items" in schema or "minItems" in schema or "maxItems" in schema:
+        item_check = _compile(schema["items"]) if "items" in schema else None
+        min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+        
+        def check_array(value, path):
+            if not isinstance(value, list):
+                return None
+            if min_items is not None and len(value) < min_items:
+                return f"{_prefix(path)}元素数不能少于 {min_items}"
+            if max_items is not None and len(value) > max_items:
+                return f"{_prefix(path)}元素数不能多于 {max_items}"
+            if item_check is not None:
+                for i, item in enumerate(value):
+                    error = item_check(item, _child(path, i))
+                    if error is not None:
+                        return error
+        checks.append(check_array)
+    
+    if not checks:
+        return _accept
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+    
+    def check_all(value, path):
+        for check in checks:
+            error = check(value, path)
+            if error is not None:
+                return error
+    return check_all
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any], Optional[str]]:
+    """把schema编译为校验函数，返回第一个错误信息，通过时返回None"""
+    check = _compile(schema)
+    
+    def validate(value: Any) -> Optional[str]:
+        return check(value, "")
+    return validate
+
+def validate_interpretive(schema: Dict[str, Any], value: Any, path: str = "") -> Optional[str]:
+    """逐次解释schema的参考实现（与 compile_schema 语义相同，用于对照和基准测试）"""
+    if "type" in schema:
+        names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        if not any(_TYPE_CHECKS[name](value) for name in names):
+            return f"{_prefix(path)}类型应为 {' 或 '.join(names)}，实际为 {_type_name(value)}"
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{_prefix(path)}值应为 {list(schema['enum'])} 之一，实际为 {value!r}"
+    if "const" in schema and value != schema["const"]:
+        return f"{_prefix(path)}值应为 {schema['const']!r}，实际为 {value!r}"
+    if isinstance(value, str):
+        if "minLength" in schema and len(value) < schema["minLength"]:
+            return f"{_prefix(path)}长度不能小于 {schema['minLength']}"
+        if "maxLength" in schema and len(value) > schema["maxLength"]:
+            return f"{_prefix(path)}长度不能大于 {schema['maxLength']}"
+        if "pattern" in schema and not re.search(schema["pattern"], value):
+            return f"{_prefix(path)}不匹配模式 {schema['pattern']!r}"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        for key, text in (("minimum", ">="), ("maximum", "<="), ("exclusiveMinimum", ">"), ("exclusiveMaximum", "<")):
+            if key in schema:
+                bound = schema[key]
+                ok = {">=": value >= bound, "<=": value <= bound, ">": value > bound, "<": value < bound}[text]
+                if not ok:
+                    return f"{_prefix(path)}值应 {text} {bound}，实际为 {value!r}"
+    if isinstance(value, dict):
+        for name in schema.get("required", ()):
+            if name not in value:
+                return f"{_prefix(path)}缺少必需参数 {name!r}"
+        properties = schema.get("properties", {})
+        for name, sub in properties.items():
+            if name in value:
+                error = validate_interpretive(sub, value[name], _child(path, name))
+                if error is not None:
+                    return error
+        additional = schema.get("additionalProperties", True)
+        if additional is not True:
+            for name in value:
+                if name in properties:
+                    continue
+                if not isinstance(additional, dict):
+                    return f"{_prefix(path)}不允许的参数 {name!r}"
+                error = validate_interpretive(additional, value[name], _child(path, name))
+                if error is not None:
+                    return error
+    if isinstance(value, list):
+        if "minItems" in schema and len(value) < schema["minItems"]:
+            return f"{_prefix(path)}元素数不能少于 {schema['minItems']}"
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            return f"{_prefix(path)}元素数不能多于 {schema['maxItems']}"
+        if "items" in schema:
+            for i, item in enumerate(value):
+                error = validate_interpretive(schema["items"], item, _child(path, i))
+                if error is not None:
+                    return error
+    return None
@@ -0,0 +1,24 @@
+"""
+practice_projects 测试的公共设置：把 practice_projects 加入导入路径，按路径加载项目3的模块
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+PRACTICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PRACTICE_DIR not in sys.path:
+    sys.path.insert(0, PRACTICE_DIR)
+
+@pytest.fixture(scope="session")
+def custom_agent():
+    """03_openhands_custom_agent.py 模块（文件名不是合法的模块名，按路径加载）"""
+    name = "openhands_custom_agent"
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(PRACTICE_DIR, "03_openhands_custom_agent.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
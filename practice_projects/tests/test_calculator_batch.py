@@ -0,0 +1,78 @@
+"""
+计算器批量求值（evaluate_batch）的测试：向量化结果和错误信息与逐个计算完全一致
+"""
+
+import asyncio
+import random
+import sys
+
+import pytest
+
+from agent_core import calculator_batch
+from agent_core.calculator_batch import evaluate_batch
+from agent_core.tools import CalculatorTool, calculator_tool, evaluate_expression
+
+def scalar(expression):
+    try:
+        return evaluate_expression(expression), None
+    except ValueError as e:
+        return None, str(e)
+
+def same(a, b):
+    """值和类型都相同（1 与 1.0 视为不同；NaN 只在两边都是 NaN 时相同）"""
+    (value_a, error_a), (value_b, error_b) = a, b
+    return type(value_a) is type(value_b) and repr(value_a) == repr(value_b) and error_a == error_b
+
+def mixed_expressions(count: int, seed: int = 0):
+    """同结构的表达式足够多以走向量化路径，其中夹杂除零、溢出、乘方和非法输入"""
+    rng = random.Random(seed)
+    templates = [
+        "{a} + {b} * {c}", "({a} - {b}) / {c}", "{a} // {b}", "{a} % {b}", "-{a} * {b}",
+        "{a}.5 * {b}", "{a} / {b}.25", "{a} ** 2", "{f} ** 0.5", "{big} * {big}",
+    ]
+    expressions = []
+    for _ in range(count):
+        template = rng.choice(templates)
+        expressions.append(template.format(
+            a=rng.randint(0, 50), b=rng.randint(0, 5), c=rng.randint(0, 3),
+            f=rng.choice(["2.0", "0.1", "1e3"]), big=rng.choice(["3037000499", "4611686018427387904"])
+        ))
+    expressions += ["007 + 1", "1 +", "abc", "2 *\n3", "(1 + 2", "1" * 25 + " + 1", "", "1 / 0.0"]
+    rng.shuffle(expressions)
+    return expressions
+
+def test_batch_matches_scalar_evaluation():
+    expressions = mixed_expressions(2000)
+    results = evaluate_batch(expressions)
+    assert len(results) == len(expressions)
+    for expression, result in zip(expressions, results):
+        assert same(result, scalar(expression)), expression
+
+def test_without_numpy_every_expression_is_evaluated_individually(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    expressions = mixed_expressions(200, seed=1)
+    assert all(same(a, scalar(e)) for e, a in zip(expressions, evaluate_batch(expressions)))
+
+def test_small_groups_skip_vectorization(monkeypatch):
+    compiled = []
+    original = calculator_batch._compile_template
+    monkeypatch.setattr(calculator_batch, "_compile_template",
+                        lambda template, kinds: compiled.append(template) or original(template, kinds))
+    evaluate_batch(["1 + 2"] * (calculator_batch.MIN_GROUP_SIZE - 1))
+    assert compiled == []
+    evaluate_batch(["1 + 2"] * calculator_batch.MIN_GROUP_SIZE)
+    assert compiled == ["x + x"]
+
+@pytest.mark.parametrize("expressions", [[], ["1 + 1"], ["2 * 3"] * 40 + ["1 / 0"]])
+def test_tool_batch_apis_match_single_calls(expressions):
+    async def scenario():
+        tool, function_tool = CalculatorTool(), calculator_tool()
+        batch = await tool.execute_batch(expressions)
+        single = [await tool.execute(expression) for expression in expressions]
+        function_batch = await function_tool.execute_batch([{"expression": e} for e in expressions])
+        function_single = [await function_tool.execute(expression=e) for e in expressions]
+        return batch, single, function_batch, function_single
+
+    batch, single, function_batch, function_single = asyncio.run(scenario())
+    assert batch == single
+    assert function_batch == function_single
@@ -0,0 +1,168 @@
+"""
+请求合并（CoalescingProvider）以及与调度、相似提示词缓存叠加使用的测试
+"""
+
+import asyncio
+
+from agent_core.coalescing import CoalescingProvider
+from agent_core.llm_scheduler import LLMRequestScheduler, ScheduledProvider
+from agent_core.messages import ChatMessage
+from agent_core.prompt_cache import SimilarityCachedProvider
+from agent_core.providers import LLMProvider, MockLLMProvider
+
+class RecordingProvider(MockLLMProvider):
+    """记录每次上游调用（单个或批量）收到的调用参数"""
+
+    def __init__(self, latency: float = 0.01):
+        super().__init__(latency=latency)
+        self.single_calls = []
+        self.batch_calls = []
+
+    async def chat_completion(self, messages, **kwargs):
+        self.single_calls.append(kwargs)
+        return await super().chat_completion(messages, **kwargs)
+
+    async def batch_chat_completion(self, requests):
+        self.batch_calls.append([kwargs for _, kwargs in requests])
+        return await super().batch_chat_completion(requests)
+
+class TenantRecordingScheduler(LLMRequestScheduler):
+    """记录申请名额时的租户和开销"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.acquired = []
+
+    async def acquire(self, priority=None, tenant="default", deadline=None, cost=1.0):
+        self.acquired.append((tenant, cost))
+        await super().acquire(priority, tenant, deadline, cost)
+
+def user(text: str):
+    return [ChatMessage(role="user", content=text)]
+
+def test_wrappers_forward_batch_support():
+    upstream = RecordingProvider()
+    scheduled = ScheduledProvider(upstream, LLMRequestScheduler())
+    cached = SimilarityCachedProvider(scheduled)
+    assert scheduled.supports_batch and cached.supports_batch
+    assert CoalescingProvider(cached).batch
+
+    class NoBatch(LLMProvider):
+        async def chat_completion(self, messages, **kwargs):
+            return {"success": True, "content": "ok"}
+
+    assert not SimilarityCachedProvider(ScheduledProvider(NoBatch(), LLMRequestScheduler())).supports_batch
+
+def test_stacked_providers_batch_upstream_and_keep_tenants():
+    upstream = RecordingProvider()
+    scheduler = TenantRecordingScheduler(max_concurrency=4)
+    provider = CoalescingProvider(
+        SimilarityCachedProvider(ScheduledProvider(upstream, scheduler)), window=0.01
+    )
+
+    async def scenario():
+        return await asyncio.gather(
+            provider.chat_completion(user("你好 1"), tenant="a"),
+            provider.chat_completion(user("谢谢 2"), tenant="a"),
+            provider.chat_completion(user("天气 3"), tenant="a"),
+        )
+
+    responses = asyncio.run(scenario())
+    assert all(response["success"] for response in responses)
+    assert upstream.single_calls == [] and len(upstream.batch_calls) == 1
+    assert scheduler.acquired == [("a", 3)]  # 整批一个名额，按请求数计入租户a
+
+def test_similarity_cache_forwards_tenant_only_to_providers_that_accept_it():
+    upstream = RecordingProvider(latency=0)
+    scheduler = TenantRecordingScheduler()
+    scheduled = SimilarityCachedProvider(ScheduledProvider(upstream, scheduler))
+    plain = SimilarityCachedProvider(upstream)
+
+    async def scenario():
+        await scheduled.chat_completion(user("你好"), tenant="b")
+        await plain.chat_completion(user("谢谢"), tenant="b")
+
+    asyncio.run(scenario())
+    assert scheduler.acquired == [("b", 1.0)]
+    assert upstream.single_calls == [{}, {}]  # 租户参数不会传给真正的后端
+
+def test_scheduled_batch_expires_only_requests_past_their_own_deadline():
+    upstream = RecordingProvider(latency=0)
+    scheduler = LLMRequestScheduler(max_concurrency=1)
+    provider = ScheduledProvider(upstream, scheduler)
+
+    async def scenario():
+        await scheduler.acquire()  # 占住唯一的名额
+        batch = asyncio.ensure_future(provider.batch_chat_completion([
+            (user("你好"), {"deadline": 0.01}),
+            (user("谢谢"), {"deadline": 5.0}),
+        ]))
+        await asyncio.sleep(0.05)
+        scheduler.release()
+        return await batch
+
+    short, long = asyncio.run(scenario())
+    assert short["expired"] and not short["success"]
+    assert long["success"]
+    assert upstream.batch_calls == [[{}]]
+
+def test_identical_inflight_requests_share_one_upstream_call():
+    upstream = RecordingProvider()
+    provider = CoalescingProvider(upstream, batch=False)
+
+    async def scenario():
+        return await asyncio.gather(*(provider.chat_completion(user("你好")) for _ in range(5)))
+
+    responses = asyncio.run(scenario())
+    assert len(upstream.single_calls) == 1
+    assert [response.get("deduplicated", False) for response in responses] == [False] + [True] * 4
+    assert len({response["content"] for response in responses}) == 1
+    stats = provider.get_stats()
+    assert stats["deduplicated"] == 4 and stats["saved_calls"] == 4 and stats["upstream_calls"] == 1
+
+def test_batch_fans_results_back_to_each_caller_in_order():
+    upstream = RecordingProvider()
+    provider = CoalescingProvider(upstream, window=0.01, max_batch=3)
+    prompts = ["你好", "谢谢", "天气", "计算", "你好 2"]
+
+    async def scenario():
+        return await asyncio.gather(*(provider.chat_completion(user(p)) for p in prompts))
+
+    responses = asyncio.run(scenario())
+    expected = [MockLLMProvider(latency=0)._respond(user(p))["content"] for p in prompts]
+    assert [response["content"] for response in responses] == expected
+    # max_batch 个请求立即成批发出，剩下的等窗口结束
+    assert [len(call) for call in upstream.batch_calls] == [3, 2]
+    assert provider.get_stats()["saved_calls"] == 3
+
+def test_batch_failure_reaches_every_caller():
+    class FailingBatch(MockLLMProvider):
+        async def batch_chat_completion(self, requests):
+            raise RuntimeError("上游不可用")
+
+    provider = CoalescingProvider(FailingBatch(latency=0), window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(provider.chat_completion(user(p)) for p in ("你好", "谢谢", "你好")),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert provider._inflight == {}
+
+def test_cancelled_caller_does_not_cancel_shared_request():
+    upstream = RecordingProvider(latency=0.05)
+    provider = CoalescingProvider(upstream, batch=False)
+
+    async def scenario():
+        first = asyncio.ensure_future(provider.chat_completion(user("你好")))
+        second = asyncio.ensure_future(provider.chat_completion(user("你好")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    response = asyncio.run(scenario())
+    assert response["success"] and response["deduplicated"]
+    assert len(upstream.single_calls) == 1
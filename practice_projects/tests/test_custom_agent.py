@@ -0,0 +1,467 @@
+"""
+项目3自定义代理的回归测试（异步代码用 asyncio.run 执行，不依赖 pytest-asyncio）
+"""
+
+import asyncio
+import os
+
+import pytest
+
+BIG_OUTPUT = "head -c 300000 /dev/zero | tr '\\0' a"
+
+def test_concurrent_spills_get_separate_segments(custom_agent, tmp_path):
+    spool = custom_agent.PayloadSpool(threshold=1024, directory=str(tmp_path))
+    first, second = spool.writer(), spool.writer()
+    for i in range(10):
+        first.write("a" * 500)
+        second.write("b" * 500)
+    payloads = [first.finish(), second.finish()]
+    assert all(payload.spilled for payload in payloads)
+    assert payloads[0].load() == "a" * 5000
+    assert payloads[1].load() == "b" * 5000
+    spool.close()
+
+def test_large_observation_while_command_is_streaming(custom_agent, tmp_path):
+    spool = custom_agent.PayloadSpool(threshold=1024, directory=str(tmp_path))
+    writer = spool.writer()
+    writer.write("x" * 4096)
+    observation = custom_agent.CmdOutputObservation("y" * 4096, "cat", spool=spool)
+    writer.write("z")
+    assert observation.content == "y" * 4096
+    assert writer.finish().load() == "x" * 4096 + "z"
+    spool.close()
+
+def test_local_runtime_parallel_and_cancelled_large_outputs(custom_agent, tmp_path):
+    m = custom_agent
+    
+    async def scenario():
+        spool = m.PayloadSpool(directory=str(tmp_path))
+        async with m.ShellSessionPool(size=2, workdir=str(tmp_path)) as pool:
+            runtime = m.LocalRuntime(pool, spool=spool)
+            observations = await asyncio.gather(
+                runtime.execute_action(m.CmdRunAction(BIG_OUTPUT)),
+                runtime.execute_action(m.CmdRunAction(BIG_OUTPUT + "; echo b")),
+            )
+            assert [len(o.content) for o in observations] == [300000, 300002]
+            
+            task = asyncio.create_task(runtime.execute_action(m.CmdRunAction(BIG_OUTPUT + "; sleep 5")))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            
+            observation = await runtime.execute_action(m.CmdRunAction(BIG_OUTPUT))
+            assert isinstance(observation, m.CmdOutputObservation)
+            assert observation.payload.spilled and len(observation.content) == 300000
+        spool.close()
+    
+    asyncio.run(scenario())
+
+def test_unparsable_command_is_rejected_without_waiting(custom_agent, tmp_path):
+    m = custom_agent
+    
+    async def scenario():
+        async with m.ShellSessionPool(size=1, workdir=str(tmp_path)) as pool:
+            runtime = m.LocalRuntime(pool, command_timeout=3)
+            observation = await asyncio.wait_for(runtime.execute_action(m.CmdRunAction("echo 'x")), 1)
+            assert isinstance(observation, m.ErrorObservation)
+            assert observation.error_type == "syntax_error"
+            # 不完整的复合命令在eval中报错，不会吞掉结束标记
+            output, exit_code = await asyncio.wait_for(pool.run("if true; then echo hi", timeout=None), 1)
+            assert exit_code == 2 and "syntax error" in output
+            # shlex 不支持但bash合法的语法仍然可以执行，会话状态保留
+            assert await pool.run("cat <<EOF\ndon't\nEOF") == ("don't\n", 0)
+            await pool.run("export GREETING=hi")
+            assert await pool.run("echo $GREETING") == ("hi\n", 0)
+    
+    asyncio.run(scenario())
+
+def test_local_runtime_file_paths_stay_in_workdir(custom_agent, tmp_path):
+    m = custom_agent
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (tmp_path / "secret.txt").write_text("secret")
+    (workdir / "link").symlink_to(tmp_path)
+    
+    async def scenario():
+        async with m.ShellSessionPool(size=1, workdir=str(workdir)) as pool:
+            runtime = m.LocalRuntime(pool)
+            for path in [str(tmp_path / "outside.txt"), "../outside.txt", "sub/../../outside.txt", "link/outside.txt"]:
+                observation = await runtime.execute_action(m.FileEditAction(path, "x"))
+                assert isinstance(observation, m.ErrorObservation), path
+            assert not (tmp_path / "outside.txt").exists()
+            for path in [str(tmp_path / "secret.txt"), "../secret.txt", "link/secret.txt"]:
+                assert isinstance(await runtime.execute_action(m.FileReadAction(path)), m.ErrorObservation), path
+            await runtime.execute_action(m.FileEditAction("sub/ok.txt", "ok"))
+            assert (await runtime.execute_action(m.FileReadAction("sub/ok.txt"))).content == "ok"
+    
+    asyncio.run(scenario())
+
+def test_blob_store_frees_content_of_discarded_snapshots_and_forks(custom_agent):
+    m = custom_agent
+    store = m.BlobStore(collect_threshold=1)
+    files = m.VirtualFileSystem(store)
+    files["/a.txt"] = "keep"
+    base = files.snapshot("base")
+    files["/b.txt"] = "discarded"
+    files.restore(base)  # 达到回收阈值，恢复时自动回收
+    assert len(store) == 1 and files["/a.txt"] == "keep"
+    
+    later = files.snapshot("later")
+    files["/c.txt"] = "in later only"
+    middle = files.snapshot("middle")
+    files.restore(later)
+    store.collect_garbage(force=True)
+    assert len(store) == 2  # middle 快照仍然引用 c.txt
+    files.release(middle)
+    store.collect_garbage(force=True)
+    assert len(store) == 1
+    
+    fork = files.fork()
+    fork["/d.txt"] = "fork only"
+    store.collect_garbage(force=True)
+    assert len(store) == 2
+    del fork
+    store.collect_garbage(force=True)
+    assert len(store) == 1
+    
+    files.restore(base)
+    assert files["/a.txt"] == "keep"
+
+def test_blob_store_collection_is_amortized(custom_agent):
+    m = custom_agent
+    store = m.BlobStore(collect_threshold=100)
+    files = m.VirtualFileSystem(store)
+    base = files.snapshot()
+    for round_number in range(50):
+        for i in range(10):
+            files[f"/f{i}.txt"] = f"{round_number}-{i}"
+        files.restore(base)
+    # 被丢弃的内容最多累积到回收阈值
+    assert len(store) < 100
+
+def test_overwrites_and_deletes_without_snapshots_are_collected(custom_agent):
+    m = custom_agent
+    store = m.BlobStore(collect_threshold=100)
+    files = m.VirtualFileSystem(store)
+    for i in range(5000):
+        files["/log.txt"] = f"第 {i} 次写入"
+    assert len(store) < 100
+    assert files["/log.txt"] == "第 4999 次写入"
+    for i in range(300):
+        files[f"/tmp/{i}.txt"] = str(i)
+        del files[f"/tmp/{i}.txt"]
+    assert len(store) < 100
+    store.collect_garbage(force=True)
+    assert len(store) == 1
+
+def test_virtual_file_system_get_on_directory_returns_default(custom_agent):
+    files = custom_agent.VirtualFileSystem()
+    files["/workspace/a.txt"] = "a"
+    assert files.get("/") is None
+    assert files.get("/workspace", "missing") == "missing"
+    assert files.get("/workspace/a.txt") == "a"
+
+def test_classify_command_defaults_and_mutating_forms(custom_agent):
+    classify = custom_agent.classify_command
+    assert classify("grep -r TODO") == custom_agent.CommandEffect("read", frozenset({"."}))
+    assert classify("grep -rn TODO src") == custom_agent.CommandEffect("read", frozenset({"src"}))
+    assert classify("grep -e TODO src") == custom_agent.CommandEffect("read", frozenset({"src"}))
+    assert classify("find -name '*.py'") == custom_agent.CommandEffect("read", frozenset({"."}))
+    assert classify("du -sh") == custom_agent.CommandEffect("read", frozenset({"."}))
+    assert classify("find src -name '*.pyc' -delete") == custom_agent.CommandEffect("mutating", frozenset({"src"}))
+    for command in ("find . -exec rm {} +", "find . -execdir touch x ;", "find . -okdir rm",
+                    "find . -fprint out.txt", "find . -fprint0 out.txt"):
+        assert classify(command).kind == "mutating" and classify(command).paths is None, command
+    for command in ("sed --in-place s/a/b/ f.txt", "sed --in-place=.bak s/a/b/ f.txt", "sed -ni s/a/b/ f.txt"):
+        assert classify(command).kind == "mutating", command
+    assert classify("sed -n 1p f.txt") == custom_agent.CommandEffect("read", frozenset({"f.txt"}))
+
+def test_command_cache_invalidates_recursive_grep_and_unknown_effects(custom_agent):
+    m = custom_agent
+    
+    async def scenario():
+        runtime = m.MockRuntime(command_cache=m.CommandResultCache())
+        cache = runtime.command_cache
+        await runtime.execute_action(m.CmdRunAction(command="grep -r VALUE"))
+        await runtime.execute_action(m.CmdRunAction(command="pwd"))
+        assert len(cache) == 2
+        await runtime.execute_action(m.FileEditAction(path="src/a.py", content="VALUE = 1\n"))
+        assert len(cache) == 1  # 递归grep依赖整个工作区
+        cache.invalidate()
+        assert len(cache) == 0
+    
+    asyncio.run(scenario())
+
+def test_fresh_run_replaces_existing_checkpoints(custom_agent, tmp_path):
+    m = custom_agent
+    store = m.CheckpointStore(str(tmp_path))
+    controller = m.AgentController(m.CustomAgent(m.MockLLM()), m.MockRuntime(), step_delay=0,
+                                   verbose=False, checkpoints=store)
+    
+    first = controller.create_state("第一次运行", task_id="task")
+    first.add_event(m.CmdRunAction(command="echo first"))
+    store.record("task", first, 1)
+    store.close("task")
+    
+    controller.create_state("第二次运行", task_id="task")
+    store.close("task")
+    restored = store.load("task")
+    assert [event.content for event in restored.history] == ["User: 第二次运行"]
+
+def test_runtime_pool_kills_workers_that_miss_handshake_or_reset(custom_agent, tmp_path):
+    m = custom_agent
+    
+    async def scenario():
+        pool = m.RuntimeWorkerPool(size=1, base_dir=str(tmp_path), spawn_timeout=0.001, spawn_attempts=2)
+        try:
+            await pool.start()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("握手超时应当报错")
+        finally:
+            await pool.close()
+        assert pool.workers_killed == 2 and pool.workers_started == 2
+        
+        async with m.RuntimeWorkerPool(size=1, base_dir=str(tmp_path), reset_timeout=1e-6) as pool:
+            async with pool.lease() as runtime:
+                first = runtime.worker
+                await runtime.execute_action(m.CmdRunAction(command="echo hi > a.txt"))
+            await asyncio.gather(*pool._background)
+            assert pool.get_stats()["workers_killed"] == 1
+            assert first.process.returncode is not None
+            async with pool.lease() as runtime:
+                assert runtime.worker is not first
+                observation = await runtime.execute_action(m.CmdRunAction(command="ls"))
+                assert "a.txt" not in observation.content
+    
+    asyncio.run(scenario())
+
+def _condenser_events(m, count):
+    events = []
+    for i in range(count):
+        command = f"echo {i % 3}"
+        events.append(m.CmdRunAction(command=command))
+        events.append(m.CmdOutputObservation(content="same", command="cat log"))
+        events.append(m.CmdOutputObservation(content="", command="message"))
+    return events
+
+def test_drop_redundant_observations_incremental_matches_full_scan(custom_agent):
+    m = custom_agent
+    events = _condenser_events(m, 40)
+    
+    incremental = m.State(history=[m.MessageAction(content="User: 任务")])
+    condenser = m.DropRedundantObservations(window=5)
+    for event in events:
+        incremental.add_event(event)
+        condenser.condense(incremental)
+    
+    full = m.State(history=[m.MessageAction(content="User: 任务")])
+    for event in events:
+        full.add_event(event)
+    m.DropRedundantObservations(window=5).condense(full)
+    assert [id(e) for e in incremental.history[1:]] == [id(e) for e in full.history[1:]]
+    
+    # 前缀被摘要折叠后重新检查，不会沿用失效的位置
+    pipeline = m.CondenserPipeline([m.SummarizingCondenser(window=10, slack=5), condenser])
+    for event in _condenser_events(m, 20):
+        incremental.add_event(event)
+        pipeline.condense(incremental)
+    assert isinstance(incremental.history[1], m.CondensationSummary)
+    assert len(incremental.history) <= 1 + 1 + 10 + 5
+
+def test_summarizing_condenser_does_not_hold_archive_files_open(custom_agent, tmp_path):
+    m = custom_agent
+    condenser = m.SummarizingCondenser(window=4, slack=2, archive_dir=str(tmp_path))
+    state = m.State(history=[m.MessageAction(content="User: 任务")], task_id="task")
+    for event in _condenser_events(m, 10):
+        state.add_event(event)
+        condenser.condense(state)
+    open_files = os.listdir(f"/proc/{os.getpid()}/fd")
+    assert not any(os.path.realpath(f"/proc/{os.getpid()}/fd/{fd}").endswith(".archive") for fd in open_files)
+    
+    summary = state.history[1]
+    with m.EventLogReader(summary.archive_path) as reader:
+        assert len(list(reader)) == summary.folded_count
+
+def test_async_line_reader_keeps_terminal_blocking_and_survives_cancel(custom_agent):
+    import pty
+    m = custom_agent
+    master, slave = pty.openpty()
+    stream = os.fdopen(slave, "r", encoding="utf-8")
+    
+    async def scenario():
+        reader = m.AsyncLineReader(stream)
+        waiting = asyncio.ensure_future(reader.readline())
+        await asyncio.sleep(0.05)
+        assert os.get_blocking(slave)  # 终端与stdout共享，不能被设为非阻塞
+        waiting.cancel()
+        os.write(master, b"first\nsecond\n")
+        assert await asyncio.wait_for(reader.readline(), 5) == "first"  # 取消前发起的读取没有丢失
+        assert await asyncio.wait_for(reader.readline(), 5) == "second"
+        reader.close()
+    
+    try:
+        asyncio.run(scenario())
+    finally:
+        stream.close()
+        os.close(master)
+
+def test_checkpoints_survive_repeated_crash_and_resume(custom_agent, tmp_path):
+    m = custom_agent
+    
+    def crash(store, command):
+        """写入未完成迭代的事件和半条记录后“崩溃”（不关闭文件）"""
+        writer = store._writer("task")
+        writer.append(m.CmdRunAction(command=command))
+        writer.flush()
+        with open(store._path("task", "delta"), "ab") as f:
+            f.write(m.encode_event(m.CmdOutputObservation(content="写了一半", command=command))[:9])
+    
+    store = m.CheckpointStore(str(tmp_path))
+    state = m.State(history=[], max_iterations=10, task_id="task")
+    state.add_event(m.MessageAction(content="User: 任务"))
+    store.record("task", state, 1)
+    crash(store, "未完成 1")
+    
+    for iteration, command in ((2, "echo 2"), (3, "echo 3")):
+        store = m.CheckpointStore(str(tmp_path))
+        state = store.load("task")
+        state.add_event(m.CmdRunAction(command=command))
+        store.record("task", state, iteration)
+        crash(store, f"未完成 {iteration}")
+    
+    restored = m.CheckpointStore(str(tmp_path)).load("task")
+    assert [getattr(e, "command", getattr(e, "content", None)) for e in restored.history] == [
+        "User: 任务", "echo 2", "echo 3"
+    ]
+    assert restored.total_events == 3 and restored.iteration == 2
+
+def test_runtime_pool_retries_failed_replacement_spawns(custom_agent, tmp_path):
+    m = custom_agent
+    
+    async def scenario():
+        async with m.RuntimeWorkerPool(size=1, max_tasks_per_worker=1, base_dir=str(tmp_path),
+                                       respawn_backoff=0.01) as pool:
+            spawn = pool._spawn
+            failures = iter([RuntimeError("启动失败"), RuntimeError("再次失败")])
+            
+            async def flaky_spawn():
+                error = next(failures, None)
+                if error is not None:
+                    raise error
+                return await spawn()
+            
+            pool._spawn = flaky_spawn
+            async with pool.lease() as runtime:
+                first = runtime.worker
+            # 用满次数的进程被回收，替换进程失败两次后启动成功
+            async with pool.lease() as runtime:
+                assert runtime.worker is not first
+                observation = await asyncio.wait_for(
+                    runtime.execute_action(m.CmdRunAction(command="echo ok")), 10
+                )
+                assert observation.content.strip() == "ok"
+            assert pool.get_stats()["spawn_failures"] == 2
+            
+            # 池中没有存活或正在启动的进程时，lease 直接报错而不是一直等待
+            await asyncio.gather(*pool._background)
+            await (await pool._idle.get()).close()
+            pool._workers.clear()
+            with pytest.raises(RuntimeError):
+                async with pool.lease():
+                    pass
+    
+    asyncio.run(scenario())
+
+def test_spool_reclaims_ranges_of_dropped_payloads(custom_agent, tmp_path):
+    import gc
+    spool = custom_agent.PayloadSpool(threshold=1024, directory=str(tmp_path))
+    payloads = [spool.store(str(i) * 4096) for i in range(4)]
+    assert spool.get_stats()["file_size"] == 4 * 4096
+    del payloads[1]
+    gc.collect()
+    assert spool.bytes_live == 3 * 4096 and spool.get_stats()["free_ranges"] == 1
+    reused = spool.store("x" * 4096)  # 复用中间的空闲区间
+    assert spool.get_stats()["file_size"] == 4 * 4096 and spool.get_stats()["free_ranges"] == 0
+    assert [p.load() for p in payloads] == [str(i) * 4096 for i in (0, 2, 3)]
+    assert reused.load() == "x" * 4096
+    
+    for _ in range(200):
+        spool.store("y" * 100_000)  # 负载用完即丢弃，文件不会增长
+    assert spool.get_stats()["file_size"] == 4 * 4096
+    del payloads, reused
+    gc.collect()
+    assert spool.get_stats() == {"bytes_spilled": 5 * 4096 + 200 * 100_000, "bytes_live": 0,
+                                 "file_size": 0, "free_ranges": 0}
+    spool.close()
+
+def test_closed_spool_refuses_stores_and_reads(custom_agent, tmp_path):
+    m = custom_agent
+    spool = m.PayloadSpool(threshold=1024, directory=str(tmp_path))
+    observation = m.CmdOutputObservation("a" * 4096, "cat", spool=spool)
+    observation.content = "b" * 4096  # 重新赋值仍写入原来的溢出文件
+    assert observation.payload._spool is spool and observation.content == "b" * 4096
+    spool.close()
+    with pytest.raises(ValueError):
+        observation.content
+    with pytest.raises(ValueError):
+        spool.store("c" * 4096)
+    with pytest.raises(ValueError):
+        spool.writer()
+
+def test_scheduler_keeps_bounded_history_and_cumulative_stats(custom_agent):
+    m = custom_agent
+    
+    async def scenario():
+        controller = m.AgentController(m.CustomAgent(m.MockLLM()), m.MockRuntime(), step_delay=0, verbose=False)
+        scheduler = m.AgentScheduler(controller, history_size=3)
+        for i in range(10):
+            scheduler.submit(f"你好 {i}", max_iterations=2)
+        finished = await scheduler.wait()
+        assert len(finished) == 10 and all(task.status == "completed" for task in finished)
+        assert list(scheduler.tasks) == ["task-8", "task-9", "task-10"]
+        assert scheduler._handles == {}
+        stats = scheduler.get_stats()
+        assert stats["tasks"] == 10 and stats["statuses"] == {"completed": 10}
+        assert stats["total_iterations"] == sum(task.iterations for task in finished)
+        
+        task_id = scheduler.submit("再来一次", max_iterations=1)
+        assert [task.task_id for task in await scheduler.wait([task_id])] == [task_id]
+        assert len(scheduler.tasks) == 3 and scheduler.get_stats()["tasks"] == 11
+    
+    asyncio.run(scenario())
+
+def test_schedulers_sharing_a_controller_use_their_own_limiters(custom_agent):
+    m = custom_agent
+    
+    active = peak = 0
+    
+    async def scenario():
+        nonlocal active, peak
+        agent = m.CustomAgent(m.MockLLM(latency=0.01))
+        step = agent.step
+        
+        async def counting_step(state):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            try:
+                return await step(state)
+            finally:
+                active -= 1
+        
+        agent.step = counting_step
+        controller = m.AgentController(agent, m.MockRuntime(), step_delay=0, verbose=False)
+        narrow = m.AgentScheduler(controller, max_concurrent_llm=1)
+        m.AgentScheduler(controller, max_concurrent_llm=8)
+        assert controller.llm_limiter is None and controller.runtime_limiter is None
+        for i in range(4):
+            narrow.submit(f"你好 {i}", max_iterations=2)
+        await narrow.wait()
+        assert peak == 1
+    
+    asyncio.run(scenario())
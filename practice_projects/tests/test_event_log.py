@@ -0,0 +1,92 @@
+"""
+事件日志的测试：编码/解码往返、回放、头部扫描，以及末尾残缺记录的处理
+"""
+
+import os
+import sys
+
+import pytest
+
+def sample_events(m):
+    return [
+        m.MessageAction(content="User: 你好"),
+        m.CmdRunAction(command="ls -la"),
+        m.FileEditAction(path="src/a.py", content="VALUE = 1\n"),
+        m.FileReadAction(path="src/a.py"),
+        m.BatchAction(actions=[m.CmdRunAction(command="pwd"), m.FileReadAction(path="b.txt")]),
+        m.CmdOutputObservation(content="总计 8\n文件", command="ls -la", exit_code=2),
+        m.FileReadObservation(content="VALUE = 1\n", path="src/a.py"),
+        m.ErrorObservation(content="失败", error_type="file_error"),
+        m.BatchObservation(observations=[m.ErrorObservation(content="x")]),
+        m.AgentFinishAction(outputs={"result": "完成", "n": [1, 2]}),
+    ]
+
+def persisted(event):
+    """用于比较的事件内容：类型、时间戳和全部持久化字段（嵌套事件递归展开）"""
+    registry = sys.modules[type(event).__module__]._EVENT_TYPE_IDS
+    _, spec = registry[type(event)]
+    values = {"type": type(event).__name__, "timestamp": event.timestamp}
+    for name, kind in spec:
+        value = getattr(event, name)
+        values[name] = [persisted(item) for item in value] if kind == "events" else value
+    return values
+
+def write_log(m, path, events):
+    with m.EventLogWriter(path) as writer:
+        writer.extend(events)
+
+def test_encode_decode_round_trip(custom_agent):
+    m = custom_agent
+    for event in sample_events(m):
+        record = m.encode_event(event)
+        decoded, end = m.decode_event(record, 0)
+        assert end == len(record)
+        assert persisted(decoded) == persisted(event)
+
+def test_replay_scan_and_read_at(custom_agent, tmp_path):
+    m = custom_agent
+    path = str(tmp_path / "events.bin")
+    events = sample_events(m)
+    write_log(m, path, events)
+    with m.EventLogReader(path) as reader:
+        assert [persisted(e) for e in reader.replay()] == [persisted(e) for e in events]
+        assert [type(e) for e in reader.replay((m.Observation,))] == [
+            type(e) for e in events if isinstance(e, m.Observation)
+        ]
+        headers = list(reader.scan())
+        assert [timestamp for _, _, timestamp in headers] == [e.timestamp for e in events]
+        assert persisted(reader.read_at(headers[2][0])) == persisted(events[2])
+        assert reader.count_by_type()["CmdRunAction"] == 1
+
+def test_torn_tail_is_ignored_and_truncated_on_reopen(custom_agent, tmp_path):
+    m = custom_agent
+    path = str(tmp_path / "events.bin")
+    write_log(m, path, [m.MessageAction(content="一"), m.MessageAction(content="二")])
+    with open(path, "ab") as f:
+        f.write(m.encode_event(m.MessageAction(content="写了一半的记录"))[:7])
+
+    with m.EventLogReader(path) as reader:
+        assert [e.content for e in reader] == ["一", "二"]
+
+    writer = m.EventLogWriter(path)
+    assert writer.truncated_bytes == 7
+    writer.append(m.MessageAction(content="三"))
+    writer.close()
+    with m.EventLogReader(path) as reader:
+        assert [e.content for e in reader] == ["一", "二", "三"]
+
+def test_invalid_logs_are_rejected_without_leaking_files(custom_agent, tmp_path):
+    m = custom_agent
+    path = str(tmp_path / "not_a_log.bin")
+    with open(path, "wb") as f:
+        f.write(b"definitely not an event log")
+    fd_dir = f"/proc/{os.getpid()}/fd"
+    before = len(os.listdir(fd_dir))
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            m.EventLogReader(path)
+        with pytest.raises(ValueError):
+            m.EventLogWriter(path)
+    assert len(os.listdir(fd_dir)) == before
+    with open(path, "rb") as f:
+        assert f.read() == b"definitely not an event log"  # 不是事件日志的文件不会被截断
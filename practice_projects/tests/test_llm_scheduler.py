@@ -0,0 +1,119 @@
+"""
+LLM请求调度器的测试：优先级、租户加权公平排队、截止时间丢弃和防饿死
+"""
+
+import asyncio
+
+from agent_core.llm_scheduler import DeadlineExceeded, LLMRequestScheduler, Priority, ScheduledProvider
+from agent_core.messages import ChatMessage
+from agent_core.providers import MockLLMProvider
+
+async def run_in_grant_order(scheduler, requests, hold: float = 0.0):
+    """先占满名额再提交 requests（(标签, 优先级, 租户, 截止时间)），返回得到名额的顺序和过期的标签"""
+    order, expired = [], []
+
+    async def one(label, priority, tenant, deadline):
+        try:
+            await scheduler.acquire(priority, tenant, deadline)
+        except DeadlineExceeded:
+            expired.append(label)
+            return
+        order.append(label)
+        await asyncio.sleep(0)
+        scheduler.release()
+
+    for _ in range(scheduler.max_concurrency):
+        await scheduler.acquire()
+    tasks = [asyncio.ensure_future(one(*request)) for request in requests]
+    await asyncio.sleep(hold)
+    for _ in range(scheduler.max_concurrency):
+        scheduler.release()
+    await asyncio.gather(*tasks)
+    return order, expired
+
+def test_higher_priority_runs_first():
+    scheduler = LLMRequestScheduler(max_concurrency=1)
+    order, _ = asyncio.run(run_in_grant_order(scheduler, [
+        ("batch", Priority.BATCH, "t", None),
+        ("normal", Priority.NORMAL, "t", None),
+        ("interactive", Priority.INTERACTIVE, "t", None),
+    ]))
+    assert order == ["interactive", "normal", "batch"]
+
+def test_weighted_fair_queueing_interleaves_tenants():
+    scheduler = LLMRequestScheduler(max_concurrency=1, tenant_weights={"heavy": 2.0})
+    requests = [(f"flood-{i}", Priority.BATCH, "flood", None) for i in range(6)]
+    requests += [(f"light-{i}", Priority.BATCH, "light", None) for i in range(3)]
+    requests += [(f"heavy-{i}", Priority.BATCH, "heavy", None) for i in range(6)]
+    order, _ = asyncio.run(run_in_grant_order(scheduler, requests))
+    tenants = [label.split("-")[0] for label in order]
+    # 先提交大量请求的租户不会挤占其他租户：前三轮每个租户都有份额，权重2的租户份额加倍
+    assert tenants[:12].count("light") == 3
+    assert tenants[:12].count("heavy") == 6
+    assert tenants[:12].count("flood") == 3
+    # 同一租户内部保持提交顺序
+    assert [label for label in order if label.startswith("flood")] == [f"flood-{i}" for i in range(6)]
+
+def test_requests_past_their_deadline_are_dropped():
+    scheduler = LLMRequestScheduler(max_concurrency=1)
+    order, expired = asyncio.run(run_in_grant_order(scheduler, [
+        ("late", Priority.BATCH, "t", 0.01),
+        ("patient", Priority.BATCH, "t", 5.0),
+        ("no-deadline", Priority.BATCH, "t", None),
+    ], hold=0.05))
+    assert expired == ["late"]
+    assert order == ["patient", "no-deadline"]
+    stats = scheduler.get_stats()
+    assert stats["classes"]["batch"]["expired"] == 1
+    assert stats["waiting"] == 0 and stats["active"] == 0
+
+def test_starved_requests_are_promoted():
+    scheduler = LLMRequestScheduler(max_concurrency=1, starvation_after=0.02)
+
+    async def scenario():
+        await scheduler.acquire()
+        old = asyncio.ensure_future(scheduler.acquire(Priority.BATCH, "b"))
+        await asyncio.sleep(0.05)  # BATCH请求已等待超过 starvation_after
+        fresh = asyncio.ensure_future(scheduler.acquire(Priority.INTERACTIVE, "i"))
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.sleep(0)
+        assert old.done() and not fresh.done()
+        scheduler.release()
+        await fresh
+        scheduler.release()
+
+    asyncio.run(scenario())
+    assert scheduler.get_stats()["promoted"] == 1
+
+def test_cancelled_waiter_releases_its_place():
+    scheduler = LLMRequestScheduler(max_concurrency=1)
+
+    async def scenario():
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire(Priority.NORMAL, "t"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release()
+        await asyncio.wait_for(scheduler.acquire(), 1)
+        scheduler.release()
+
+    asyncio.run(scenario())
+    assert scheduler.get_stats()["waiting"] == 0 and scheduler.get_stats()["active"] == 0
+
+def test_scheduled_provider_reports_expired_requests():
+    scheduler = LLMRequestScheduler(max_concurrency=1)
+    provider = ScheduledProvider(MockLLMProvider(latency=0), scheduler)
+
+    async def scenario():
+        await scheduler.acquire()
+        pending = asyncio.ensure_future(
+            provider.chat_completion([ChatMessage(role="user", content="你好")], deadline=0.01)
+        )
+        await asyncio.sleep(0.05)
+        scheduler.release()
+        return await pending
+
+    response = asyncio.run(scenario())
+    assert response["expired"] and not response["success"]
@@ -0,0 +1,127 @@
+"""
+相似提示词缓存（PromptSimilarityCache）的测试
+"""
+
+import asyncio
+
+from agent_core import prompt_cache
+from agent_core.messages import ChatMessage
+from agent_core.prompt_cache import PromptSimilarityCache, SimilarityCachedProvider, formula_skeleton, prompt_shingles
+from agent_core.providers import MockLLMProvider
+
+class BatchRecordingProvider(MockLLMProvider):
+    """记录每次批量调用收到的用户提示词"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.batches = []
+
+    async def batch_chat_completion(self, requests):
+        self.batches.append([messages[-1].content for messages, _ in requests])
+        return await super().batch_chat_completion(requests)
+
+def user(text: str):
+    return [ChatMessage(role="user", content=text)]
+
+def jaccard(a: str, b: str) -> float:
+    a, b = prompt_shingles(a), prompt_shingles(b)
+    return len(a & b) / len(a | b)
+
+def test_prompts_differing_only_in_operator_do_not_collide():
+    cache = PromptSimilarityCache()
+    cache.store("scope", "帮我计算 15 * 8", {"success": True, "content": "120"})
+    assert cache.lookup("scope", "帮我计算 15 + 8") is None
+    assert cache.lookup("scope", "帮我计算 15 - 8") is None
+    assert cache.lookup("scope", "帮我计算 (15 * 8)") is None
+    assert cache.lookup("scope", "帮我计算 15 * 9") is None
+    response, similarity = cache.lookup("scope", "请帮我计算15*8")
+    assert response["content"] == "120" and similarity == 1.0
+
+def test_formula_skeleton_ignores_spacing_and_width():
+    assert formula_skeleton("计算 15 * 8") == formula_skeleton("计算１５＊８") == "15*8"
+    assert formula_skeleton("计算 -5 + 3") == "-5+3"
+    assert formula_skeleton("北京今天天气怎么样") == ""
+
+def test_similar_prompts_without_numbers_still_hit():
+    cache = PromptSimilarityCache()
+    cache.store("scope", "北京今天天气怎么样", {"success": True, "content": "晴天"})
+    assert cache.lookup("scope", "请问北京天气怎么样") is not None
+    assert cache.lookup("other", "北京今天天气怎么样") is None
+
+def test_jaccard_threshold_is_a_hard_cutoff():
+    stored, query = "北京今天天气怎么样", "北京天气预报怎么样"
+    similarity = jaccard(stored, query)
+    assert similarity == 0.6
+    for threshold, hit in ((similarity, True), (similarity + 0.01, False)):
+        cache = PromptSimilarityCache(threshold=threshold)
+        cache.store("scope", stored, {"success": True, "content": "晴天"})
+        result = cache.lookup("scope", query)
+        assert (result is not None) == hit
+        if hit:
+            assert result[1] == similarity
+
+def test_lru_eviction_removes_bucket_keys():
+    cache = PromptSimilarityCache(maxsize=2)
+    for prompt in ("北京天气", "上海温度"):
+        cache.store("scope", prompt, {"success": True, "content": prompt})
+    assert cache.lookup("scope", "北京天气") is not None  # 北京变为最近使用
+    cache.store("scope", "广州湿度", {"success": True, "content": "广州湿度"})
+    assert cache.lookup("scope", "上海温度") is None
+    assert cache.lookup("scope", "北京天气") is not None
+    live_keys = {key for entry in cache._entries.values() for key in entry.band_keys}
+    assert set(cache._buckets) == live_keys
+    assert all(cache._buckets[key] for key in live_keys)
+    assert cache.get_stats()["entries"] == 2
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prompt_cache.time, "monotonic", lambda: now[0])
+    cache = PromptSimilarityCache(ttl=10)
+    cache.store("scope", "北京天气", {"success": True, "content": "晴天"})
+    now[0] += 9
+    assert cache.lookup("scope", "北京天气") is not None
+    now[0] += 2
+    assert cache.lookup("scope", "北京天气") is None
+
+def test_clear_resets_entries_and_counters():
+    cache = PromptSimilarityCache()
+    cache.store("scope", "北京天气", {"success": True, "content": "晴天"})
+    cache.lookup("scope", "北京天气")
+    cache.lookup("scope", "上海温度")
+    cache.clear()
+    stats = cache.get_stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["hit_rate"]) == (0, 0, 0, 0.0)
+    assert cache._buckets == {}
+
+def test_provider_isolates_tenants():
+    upstream = BatchRecordingProvider()
+    provider = SimilarityCachedProvider(upstream)
+
+    async def scenario():
+        first = await provider.chat_completion(user("北京天气"), tenant="a")
+        other = await provider.chat_completion(user("北京天气"), tenant="b")
+        again = await provider.chat_completion(user("北京天气"), tenant="a")
+        return first, other, again
+
+    first, other, again = asyncio.run(scenario())
+    assert not first.get("cached") and not other.get("cached")
+    assert again["cached"] and again["content"] == first["content"]
+    assert provider.cache.get_stats()["hits"] == 1
+
+def test_batch_sends_only_misses_downstream():
+    upstream = BatchRecordingProvider()
+    provider = SimilarityCachedProvider(upstream)
+
+    async def scenario():
+        await provider.chat_completion(user("北京天气"))
+        return await provider.batch_chat_completion([
+            (user("北京天气"), {}),
+            (user("上海温度"), {}),
+            (user("北京天气"), {"tenant": "b"}),
+            (user("请问北京天气"), {}),
+        ])
+
+    results = asyncio.run(scenario())
+    assert upstream.batches == [["上海温度", "北京天气"]]
+    assert [bool(result.get("cached")) for result in results] == [True, False, False, True]
+    assert all(result["success"] for result in results)
@@ -0,0 +1,61 @@
+"""
+BM25检索索引的测试：NumPy向量化打分与逐条累加的结果一致，同分时按文档号排序
+"""
+
+import random
+
+import pytest
+
+from agent_core.retrieval import BM25Index, tokenize
+
+WORDS = ["北京", "天气", "计算", "文件", "python", "agent", "error", "测试", "上海", "tool"]
+
+def build_index(documents: int, seed: int = 0) -> BM25Index:
+    rng = random.Random(seed)
+    index = BM25Index()
+    doc_id = 0
+    for _ in range(documents):
+        doc_id += rng.randint(1, 3)  # 文档号递增但不连续
+        index.add(doc_id, " ".join(rng.choices(WORDS, k=rng.randint(1, 8))))
+    return index
+
+def python_search(index, query, k, before=None):
+    terms = [term for term in set(tokenize(query)) if term in index.postings]
+    return index._search_python(terms, k, before) if terms else []
+
+def assert_same_ranking(a, b):
+    assert [doc for doc, _ in a] == [doc for doc, _ in b]
+    assert [score for _, score in a] == pytest.approx([score for _, score in b])
+
+def test_tokenize_mixes_chinese_bigrams_and_english_words():
+    assert tokenize("北京天气 Python3 很好") == ["北京", "京天", "天气", "python3", "很好"]
+    assert tokenize("好") == ["好"]
+
+@pytest.mark.parametrize("query", ["北京 天气", "python error", "测试 tool agent", "上海"])
+@pytest.mark.parametrize("k", [1, 5, 50, 10_000])
+def test_numpy_and_python_scoring_agree(query, k):
+    index = build_index(500)
+    assert_same_ranking(index.search(query, k), python_search(index, query, k))
+    assert_same_ranking(index.search(query, k, before=400), python_search(index, query, k, before=400))
+
+def test_ties_are_broken_by_document_id():
+    index = BM25Index()
+    for doc_id in range(0, 40, 2):
+        index.add(doc_id, "相同 的 内容")
+    index.add(41, "完全无关")
+    expected = [0, 2, 4, 6, 8]
+    assert [doc for doc, _ in index.search("相同 内容", 5)] == expected
+    assert [doc for doc, _ in python_search(index, "相同 内容", 5)] == expected
+    # 第k名同分的文档很多时，截断位置之后的文档也不会挤掉文档号较小的文档
+    assert [doc for doc, _ in index.search("相同 内容", 5, before=30)] == expected
+
+def test_incremental_index_rejects_non_increasing_ids_and_unknown_terms():
+    index = BM25Index()
+    index.add(3, "hello world")
+    with pytest.raises(ValueError):
+        index.add(3, "again")
+    assert index.search("unknown", 5) == []
+    assert index.search("hello", 0) == []
+    index.add(7, "")  # 没有词项的文档不计入统计
+    assert index.get_stats()["documents"] == 1
+    assert index.search("hello", 5, before=3) == []
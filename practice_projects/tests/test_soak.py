@@ -0,0 +1,28 @@
+"""
+内存浸泡测试的冒烟测试：每种代理都能按 max_turns 跑完并生成报告
+"""
+
+import asyncio
+
+import pytest
+
+from agent_core.soak import SOAK_DRIVERS, run_soak
+
+@pytest.mark.parametrize("agent", list(SOAK_DRIVERS))
+def test_run_soak_completes_for_each_driver(agent):
+    report = asyncio.run(run_soak(
+        agent, duration=60.0, sessions=2, session_turns=3, interval=0.0, max_turns=8
+    ))
+    assert report.agent == agent
+    assert report.turns == 8
+    assert report.sessions_completed > 2  # 用完轮数的会话被关闭并换新
+    assert report.samples and report.samples[-1].turns == 8
+    assert report.per_session_bytes >= 0 and report.retained_per_session_bytes >= 0
+
+def test_custom_session_close_releases_manager_and_controller():
+    session = SOAK_DRIVERS["custom"]()
+    asyncio.run(session.turn("你好"))
+    controller = session.manager.controller
+    session.close()
+    assert session.manager.scheduler is None
+    assert controller.checkpoints is None or not controller.checkpoints._writers
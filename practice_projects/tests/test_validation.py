@@ -0,0 +1,81 @@
+"""
+参数校验（compile_schema）的测试：编译后的校验函数与逐次解释的参考实现结果一致
+"""
+
+import asyncio
+
+import pytest
+
+from agent_core.tools import FunctionTool
+from agent_core.validation import SchemaError, compile_schema, validate_interpretive
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string", "minLength": 1, "maxLength": 20, "pattern": "^[a-z ]+$"},
+        "limit": {"type": "integer", "minimum": 1, "exclusiveMaximum": 100},
+        "mode": {"enum": ["fast", "exact"]},
+        "version": {"const": 2},
+        "weights": {"type": "array", "items": {"type": "number"}, "minItems": 1, "maxItems": 3},
+        "filters": {
+            "type": "object",
+            "properties": {"lang": {"type": ["string", "null"]}},
+            "additionalProperties": {"type": "boolean"},
+        },
+    },
+    "required": ["query"],
+    "additionalProperties": False,
+}
+
+VALUES = [
+    {"query": "hello"},
+    {"query": "hello world", "limit": 10, "mode": "fast", "version": 2, "weights": [0.5, 1]},
+    {},
+    {"query": ""},
+    {"query": "x" * 21},
+    {"query": "Hello"},
+    {"query": 3},
+    {"query": "ok", "limit": 0},
+    {"query": "ok", "limit": 100},
+    {"query": "ok", "limit": 2.5},
+    {"query": "ok", "limit": 3.0},
+    {"query": "ok", "limit": True},
+    {"query": "ok", "mode": "slow"},
+    {"query": "ok", "version": 3},
+    {"query": "ok", "weights": []},
+    {"query": "ok", "weights": [1, 2, 3, 4]},
+    {"query": "ok", "weights": [1, "2"]},
+    {"query": "ok", "filters": {"lang": None, "strict": True}},
+    {"query": "ok", "filters": {"lang": 1}},
+    {"query": "ok", "filters": {"strict": "yes"}},
+    {"query": "ok", "unknown": 1},
+    ["not", "an", "object"],
+    None,
+]
+
+@pytest.mark.parametrize("value", VALUES)
+def test_compiled_matches_interpretive(value):
+    assert compile_schema(SCHEMA)(value) == validate_interpretive(SCHEMA, value)
+
+def test_error_messages_carry_the_path():
+    validate = compile_schema(SCHEMA)
+    assert validate({"query": "hello"}) is None
+    assert validate({}) == "缺少必需参数 'query'"
+    assert validate({"query": "ok", "weights": [1, "2"]}) == "weights[1]: 类型应为 number，实际为 string"
+    assert validate({"query": "ok", "filters": {"strict": "yes"}}) == "filters.strict: 类型应为 boolean，实际为 string"
+
+def test_invalid_schema_is_rejected_at_compile_time():
+    with pytest.raises(SchemaError):
+        compile_schema({"type": "decimal"})
+    with pytest.raises(SchemaError):
+        compile_schema({"properties": {"a": "string"}})
+
+def test_function_tool_rejects_invalid_arguments_before_calling():
+    calls = []
+    tool = FunctionTool("echo", "回显", {"type": "object", "properties": {"text": {"type": "string"}},
+                                         "required": ["text"]}, lambda text: calls.append(text) or text)
+    assert asyncio.run(tool.execute()) == {
+        "success": False, "error": "参数错误: 缺少必需参数 'text'", "invalid_arguments": True
+    }
+    assert asyncio.run(tool.execute(text="hi")) == {"success": True, "result": "hi"}
+    assert calls == ["hi"]